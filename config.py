@@ -1,32 +1,331 @@
 import os
+import threading
 from dotenv import load_dotenv
-import google.generativeai as genai
-from google.cloud import vision
 
 load_dotenv()
 
 # API 키
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# GOOGLE_API_KEYS에 여러 프로젝트의 키를 쉼표로 나열하면 키마다 모델 인스턴스/동시 호출 한도/쿼터를 따로 두고 호출을 나눠 보냅니다.
+# (비우면 GOOGLE_API_KEY 하나만 사용. 첫 번째 키가 GOOGLE_API_KEY 역할을 합니다)
+GOOGLE_API_KEYS = [key.strip() for key in os.getenv("GOOGLE_API_KEYS", "").split(",") if key.strip()] \
+    or ([os.getenv("GOOGLE_API_KEY")] if os.getenv("GOOGLE_API_KEY") else [])
+GOOGLE_API_KEY = GOOGLE_API_KEYS[0] if GOOGLE_API_KEYS else None
+# Gemini 호출 창구(키) 수 (오프라인 백엔드에서 키가 없으면 1)
+GEMINI_KEY_COUNT = max(1, len(GOOGLE_API_KEYS))
 BIGKINDS_API_KEY = os.getenv("BIGKINDS_API_KEY")
 
-# 클라이언트 초기화
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
-else:
-    print("[Config Warning] GOOGLE_API_KEY가 없습니다.")
+# --- AI 백엔드 설정 (부하 테스트 / 벤치마크) ---
+# live: 실제 API / fake: 로컬 가짜 클라이언트 / record: 실제 응답을 디스크에 녹화 / replay: 녹화된 응답만 재생
+AI_BACKEND = os.getenv("AI_BACKEND", "live").lower()
+AI_OFFLINE = AI_BACKEND in ("fake", "replay")
+AI_RECORDINGS_DIR = os.getenv("AI_RECORDINGS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings"))
+# replay 시 녹화 당시의 지연 시간을 재현할지 여부 (false면 즉시 응답)
+AI_REPLAY_LATENCY = os.getenv("AI_REPLAY_LATENCY", "true").lower() == "true"
+# fake 클라이언트의 지연 시간(로그정규 분포 중앙값, ms)과 오류율
+FAKE_GEMINI_PRO_LATENCY_MS = float(os.getenv("FAKE_GEMINI_PRO_LATENCY_MS", "2500"))
+FAKE_GEMINI_FLASH_LATENCY_MS = float(os.getenv("FAKE_GEMINI_FLASH_LATENCY_MS", "800"))
+FAKE_GEMINI_LATENCY_SIGMA = float(os.getenv("FAKE_GEMINI_LATENCY_SIGMA", "0.4"))
+FAKE_GEMINI_ERROR_RATE = float(os.getenv("FAKE_GEMINI_ERROR_RATE", "0.0"))
+FAKE_GEMINI_STREAM_CHUNKS = int(os.getenv("FAKE_GEMINI_STREAM_CHUNKS", "8"))
+FAKE_VISION_LATENCY_MS = float(os.getenv("FAKE_VISION_LATENCY_MS", "400"))
+FAKE_VISION_LATENCY_SIGMA = float(os.getenv("FAKE_VISION_LATENCY_SIGMA", "0.3"))
+FAKE_VISION_ERROR_RATE = float(os.getenv("FAKE_VISION_ERROR_RATE", "0.0"))
 
 # GCP 서비스 클라이언트는 gcloud 인증을 사용하므로 API 키 없이 초기화 가능
 #SPEECH_CLIENT = speech.SpeechClient()
 #TTS_CLIENT = texttospeech.TextToSpeechClient()
 
-# Vision API 클라이언트 초기화 (Cloud Run 환경에서 에러 처리)
-try:
-    VISION_CLIENT = vision.ImageAnnotatorClient()
-    print("[Config] Vision API 클라이언트 초기화 성공")
-except Exception as e:
-    print(f"[Config Warning] Vision API 클라이언트 초기화 실패: {e}")
-    VISION_CLIENT = None
-
-# 사용할 Gemini 모델들을 미리 정의
-GEMINI_PRO_MODEL = genai.GenerativeModel('gemini-2.5-pro')
-GEMINI_FLASH_MODEL = genai.GenerativeModel('gemini-2.5-flash')
\ No newline at end of file
+# 사용할 Gemini 모델 (등급 -> 모델 이름)
+GEMINI_MODEL_NAMES = {"pro": "gemini-2.5-pro", "flash": "gemini-2.5-flash"}
+_FAKE_GEMINI_LATENCY_MS = {"pro": FAKE_GEMINI_PRO_LATENCY_MS, "flash": FAKE_GEMINI_FLASH_LATENCY_MS}
+
+def _log():
+    # log_service가 이 모듈의 LOG_* 설정을 import하므로, 로거는 모듈 로드가 끝난 뒤(클라이언트 생성 시점)에 가져옵니다.
+    from services.log_service import get_logger
+    return get_logger("config")
+
+def _create_vision_client():
+    if AI_BACKEND == "fake":
+        from services.ai_backends import FakeImageAnnotatorClient
+        return FakeImageAnnotatorClient(FAKE_VISION_LATENCY_MS, FAKE_VISION_LATENCY_SIGMA, FAKE_VISION_ERROR_RATE)
+    if AI_BACKEND == "replay":
+        from services.ai_backends import ReplayImageAnnotatorClient
+        return ReplayImageAnnotatorClient(AI_RECORDINGS_DIR)
+    from google.cloud import vision
+    client = vision.ImageAnnotatorClient()
+    if AI_BACKEND == "record":
+        from services.ai_backends import RecordingImageAnnotatorClient
+        return RecordingImageAnnotatorClient(client, AI_RECORDINGS_DIR)
+    return client
+
+def _create_gemini_model(tier: str, key_index: int):
+    model_name = GEMINI_MODEL_NAMES[tier]
+    if AI_BACKEND == "fake":
+        from services.ai_backends import FakeGenerativeModel
+        return FakeGenerativeModel(model_name, _FAKE_GEMINI_LATENCY_MS[tier], FAKE_GEMINI_LATENCY_SIGMA, FAKE_GEMINI_ERROR_RATE, FAKE_GEMINI_STREAM_CHUNKS)
+    if AI_BACKEND == "replay":
+        from services.ai_backends import ReplayGenerativeModel
+        return ReplayGenerativeModel(model_name, AI_RECORDINGS_DIR, AI_REPLAY_LATENCY)
+    import google.generativeai as genai
+    if not GOOGLE_API_KEY:
+        _log().warning("GOOGLE_API_KEY가 없습니다.", model=model_name)
+    else:
+        # 전역 설정은 첫 번째 키를 사용합니다. (캐시 컨텍스트 등록과 캐시 기반 모델은 이 키의 프로젝트에서만 동작)
+        genai.configure(api_key=GOOGLE_API_KEY)
+    if len(GOOGLE_API_KEYS) > 1:
+        # 키가 여러 개면 모든 키가 전역 설정과 무관한 키별 클라이언트로 호출합니다.
+        from services.ai_backends import KeyedGenerativeModel
+        model = KeyedGenerativeModel(model_name, GOOGLE_API_KEYS[key_index])
+    else:
+        model = genai.GenerativeModel(model_name)
+    if AI_BACKEND == "record":
+        from services.ai_backends import RecordingGenerativeModel
+        return RecordingGenerativeModel(model, AI_RECORDINGS_DIR)
+    return model
+
+# --- 지연 초기화 ---
+# google.generativeai / google.cloud.vision import와 클라이언트 생성(인증 정보 조회)은 수 초가 걸리므로,
+# 서버 시작 시가 아니라 처음 사용할 때(또는 시작 후 백그라운드 워밍업에서) 한 번만 만듭니다.
+_CLIENT_LOCK = threading.Lock()
+_CLIENTS: dict[str, object] = {}
+
+def _get_client(key: str, factory):
+    if key not in _CLIENTS:
+        with _CLIENT_LOCK:
+            if key not in _CLIENTS:
+                _CLIENTS[key] = factory()
+    return _CLIENTS[key]
+
+def _create_vision_client_or_none():
+    # Vision API 클라이언트 초기화 (Cloud Run 환경에서 에러 처리)
+    try:
+        client = _create_vision_client()
+        _log().info("Vision API 클라이언트 초기화 성공", ai_backend=AI_BACKEND)
+        return client
+    except Exception as e:
+        _log().warning("Vision API 클라이언트 초기화 실패", ai_backend=AI_BACKEND, error=str(e))
+        return None
+
+def get_vision_client():
+    """Vision 클라이언트를 반환합니다. 초기화에 실패했으면 None을 반환합니다."""
+    return _get_client("vision", _create_vision_client_or_none)
+
+def get_gemini_model(tier: str, key_index: int = 0):
+    """등급('pro' | 'flash')에 해당하는 Gemini 모델을 반환합니다. (key_index: GOOGLE_API_KEYS 중 사용할 키 순번)"""
+    return _get_client(f"gemini:{tier}:{key_index}", lambda: _create_gemini_model(tier, key_index))
+
+def warm_up_clients() -> None:
+    """모든 클라이언트를 미리 만들어 둡니다. (블로킹이므로 스레드에서 호출)"""
+    get_vision_client()
+    for tier in GEMINI_MODEL_NAMES:
+        for key_index in range(GEMINI_KEY_COUNT):
+            get_gemini_model(tier, key_index)
+
+# 서버 시작 직후 백그라운드에서 클라이언트 생성/분류기 학습 등을 미리 해 둘지 여부
+STARTUP_WARMUP_ENABLED = os.getenv("STARTUP_WARMUP_ENABLED", "true").lower() == "true"
+
+# 모델별 동시 호출 한도 (uvicorn 워커 1개, API 키 1개 기준)
+# 비동기 호출은 스레드풀 슬롯을 점유하지 않으므로, 한도는 Gemini 쿼터에 맞춰 설정합니다.
+GEMINI_PRO_CONCURRENCY = int(os.getenv("GEMINI_PRO_CONCURRENCY", "64"))
+GEMINI_FLASH_CONCURRENCY = int(os.getenv("GEMINI_FLASH_CONCURRENCY", "256"))
+
+# 결과 캐시 (/diagnose/image의 OCR 텍스트 및 위험도 진단 결과)
+# RESULT_CACHE_DB_PATH를 지정하면 같은 SQLite 파일을 모든 워커가 공유합니다. (비우면 메모리 캐시만 사용)
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+RESULT_CACHE_DB_PATH = os.getenv("RESULT_CACHE_DB_PATH") or None
+
+# 동시 요청 합치기 (single-flight): 같은 입력의 Gemini/Vision 호출이 진행 중이면 새로 호출하지 않고 그 결과를 함께 기다림
+REQUEST_COALESCING_ENABLED = os.getenv("REQUEST_COALESCING_ENABLED", "true").lower() == "true"
+
+# 리포트 엔진 (같은 세션의 기본/프리미엄 리포트가 한 번의 분석 결과를 공유)
+# 분석/프리미엄 리포트는 결과 캐시와 같은 저장소(RESULT_CACHE_DB_PATH)에 보관됩니다.
+REPORT_CACHE_TTL_SECONDS = float(os.getenv("REPORT_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+# 기본 리포트 요청 시 프리미엄 리포트를 백그라운드에서 미리 만들어 둘지 여부의 기본값 (요청별로 바꿀 수 있음)
+REPORT_PRECOMPUTE_PREMIUM = os.getenv("REPORT_PRECOMPUTE_PREMIUM", "false").lower() == "true"
+
+# 결정적 채점 (대화 기록의 verdict/axes로 취약 축과 A/B/C/F 등급을 계산, LLM 호출 없음)
+# 최근 턴일수록 크게 반영합니다. (이 턴 수만큼 이전의 사용자 대응은 가중치가 절반)
+SCORING_RECENCY_HALF_LIFE_TURNS = float(os.getenv("SCORING_RECENCY_HALF_LIFE_TURNS", "4"))
+# verdict별 위험 점수 (0: 안전 ~ 1: 치명적)
+SCORING_VERDICT_WEIGHTS = {"safe": 0.0, "risky": 0.5, "unsafe": 1.0}
+# 위험 점수 상한별 등급 (위험 점수 < 상한이면 해당 등급, 모두 넘으면 F). 'unsafe' 대응이 한 번이라도 있으면 최고 C입니다.
+SCORING_GRADE_THRESHOLDS = (
+    ("A", float(os.getenv("SCORING_GRADE_A_BELOW", "0.15"))),
+    ("B", float(os.getenv("SCORING_GRADE_B_BELOW", "0.35"))),
+    ("C", float(os.getenv("SCORING_GRADE_C_BELOW", "0.6"))),
+)
+# /analysis/scores 한 번에 채점할 최대 세션 수
+SCORING_MAX_SESSIONS = int(os.getenv("SCORING_MAX_SESSIONS", "10000"))
+
+# OCR 처리 (Vision 동기 호출을 실행할 전용 스레드 수, 다중 이미지 진단 최대 장수)
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", "8"))
+DIAGNOSE_MAX_IMAGES = int(os.getenv("DIAGNOSE_MAX_IMAGES", "10"))
+
+# 이미지 전처리 (업로드 크기 제한, OCR용 축소/재인코딩, 근사 중복 인식)
+# 이미지 한 장의 최대 업로드 크기 (초과 시 413)
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+# OCR로 보낼 최대 픽셀 수 (초과하면 비율을 유지해 축소, 작은 이미지는 확대하지 않음)
+IMAGE_OCR_MAX_PIXELS = int(os.getenv("IMAGE_OCR_MAX_PIXELS", "3000000"))
+# 디코딩을 허용할 최대 픽셀 수 (압축 폭탄 방지, 초과 시 413)
+IMAGE_MAX_DECODE_PIXELS = int(os.getenv("IMAGE_MAX_DECODE_PIXELS", "64000000"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+# 전처리(디코딩/축소/해시)를 실행할 프로세스 수 (CPU 작업이 이벤트 루프를 막지 않도록 별도 프로세스에서 실행)
+IMAGE_PROCESS_WORKERS = int(os.getenv("IMAGE_PROCESS_WORKERS", "2"))
+# 지각 해시(256비트) 해밍 거리가 이 값 이하이면 근사 중복으로 인식합니다. (0이면 끔)
+IMAGE_NEAR_DUPLICATE_DISTANCE = int(os.getenv("IMAGE_NEAR_DUPLICATE_DISTANCE", "10"))
+IMAGE_NEAR_DUPLICATE_INDEX_SIZE = int(os.getenv("IMAGE_NEAR_DUPLICATE_INDEX_SIZE", "2048"))
+# 근사 중복 이미지에 이전 OCR 결과를 재사용할지 여부 (메시지 한 줄만 달라도 같은 해시가 나올 수 있어 기본값은 끔)
+IMAGE_NEAR_DUPLICATE_REUSE_OCR = os.getenv("IMAGE_NEAR_DUPLICATE_REUSE_OCR", "false").lower() == "true"
+
+# 이미지 진단 사전 분류 (mode=fast로 요청한 경우에만 사용, 로컬 분류기 + 판정 근거용 키워드 매처)
+# 사기 점수가 (LOW, HIGH) 구간 안에 있을 때만 Gemini로 진단합니다.
+TRIAGE_LLM_BAND_LOW = float(os.getenv("TRIAGE_LLM_BAND_LOW", "0.2"))
+TRIAGE_LLM_BAND_HIGH = float(os.getenv("TRIAGE_LLM_BAND_HIGH", "0.85"))
+# 분류기 학습용 라벨 데이터 (JSONL: {"text": ..., "label": 0|1}). 저장소/이미지에는 포함되어 있지 않으며, 없으면 fast path를 쓰지 않고 항상 Gemini로 진단합니다.
+TRIAGE_TRAINING_PATH = os.getenv("TRIAGE_TRAINING_PATH") or None
+# 학습에 쓰지 않고 떼어 두는 검증 데이터 비율과 최소 학습 데이터 수
+TRIAGE_HOLDOUT_RATIO = float(os.getenv("TRIAGE_HOLDOUT_RATIO", "0.2"))
+TRIAGE_MIN_TRAINING_EXAMPLES = int(os.getenv("TRIAGE_MIN_TRAINING_EXAMPLES", "200"))
+# 검증 데이터에서 '위험'/'관심' 판정의 정밀도가 이 값 이상인 쪽만 LLM 없이 판정합니다.
+TRIAGE_MIN_PRECISION = float(os.getenv("TRIAGE_MIN_PRECISION", "0.95"))
+
+# 프롬프트 컨텍스트 관리 (턴 생성: 최근 N턴은 원문 유지, 이전 턴은 누적 요약으로 압축 / 리포트: 요약 없이 원문만 예산에 맞춤)
+CONTEXT_RECENT_TURNS = int(os.getenv("CONTEXT_RECENT_TURNS", "8"))
+CONTEXT_SUMMARY_CHUNK_TURNS = int(os.getenv("CONTEXT_SUMMARY_CHUNK_TURNS", "4"))
+CONTEXT_SUMMARY_CACHE_SIZE = int(os.getenv("CONTEXT_SUMMARY_CACHE_SIZE", "2048"))
+# 엔드포인트별 대화 기록 토큰 예산 (로컬 추정치 기준)
+CONTEXT_TOKEN_BUDGETS = {
+    "adaptive_turn": int(os.getenv("CONTEXT_BUDGET_ADAPTIVE_TURN", "2000")),
+    "voice_turn": int(os.getenv("CONTEXT_BUDGET_VOICE_TURN", "1500")),
+    "basic_report": int(os.getenv("CONTEXT_BUDGET_BASIC_REPORT", "6000")),
+    "premium_report": int(os.getenv("CONTEXT_BUDGET_PREMIUM_REPORT", "12000")),
+}
+
+# 사기 패턴 DB (scripts/create_database.py, scripts/insert_patterns.py로 생성)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PATTERN_DB_PATH = os.getenv("PATTERN_DB_PATH", os.path.join(BASE_DIR, "database", "safeguard_patterns.db"))
+PATTERN_RELOAD_INTERVAL_SECONDS = float(os.getenv("PATTERN_RELOAD_INTERVAL_SECONDS", "5"))
+PATTERN_PROMPT_LIMIT = int(os.getenv("PATTERN_PROMPT_LIMIT", "2"))
+PATTERN_PROMPT_MAX_CHARS = int(os.getenv("PATTERN_PROMPT_MAX_CHARS", "600"))
+# patterns.simulation_mode 컬럼에 저장된 모드 이름
+PATTERN_TEXT_MODE = os.getenv("PATTERN_TEXT_MODE", "text")
+PATTERN_VOICE_MODE = os.getenv("PATTERN_VOICE_MODE", "voice")
+
+# 적응형 턴 추측 생성 (응답 직후 세 선택지별 다음 턴을 미리 생성, 기본 비활성)
+SPECULATIVE_TURNS_ENABLED = os.getenv("SPECULATIVE_TURNS_ENABLED", "false").lower() == "true"
+SPECULATIVE_CACHE_SIZE = int(os.getenv("SPECULATIVE_CACHE_SIZE", "1000"))
+SPECULATIVE_TTL_SECONDS = float(os.getenv("SPECULATIVE_TTL_SECONDS", "300"))
+SPECULATIVE_MAX_CALLS_PER_MINUTE = int(os.getenv("SPECULATIVE_MAX_CALLS_PER_MINUTE", "300"))
+
+# 적응형 턴 근사 중복 캐시 (최근 대화가 거의 같은 요청에 이전 턴을 Gemini 호출 없이 반환)
+TURN_CACHE_ENABLED = os.getenv("TURN_CACHE_ENABLED", "true").lower() == "true"
+TURN_CACHE_MAX_ENTRIES = int(os.getenv("TURN_CACHE_MAX_ENTRIES", "5000"))
+# 최근 대화 TF-IDF 벡터의 코사인 유사도가 이 값 이상이어야 재사용합니다.
+TURN_CACHE_SIMILARITY = float(os.getenv("TURN_CACHE_SIMILARITY", "0.9"))
+# 임계값을 넘는 후보 중 유사도 상위 몇 개에서 무작위로 고를지 (대화 다양성)
+TURN_CACHE_TOP_K = int(os.getenv("TURN_CACHE_TOP_K", "3"))
+# 유사도 비교에 사용할 최근 대사 수
+TURN_CACHE_CONTEXT_TURNS = int(os.getenv("TURN_CACHE_CONTEXT_TURNS", "4"))
+# 정확히 같은 대화 기록에 대해 보관할 서로 다른 턴의 수
+TURN_CACHE_MAX_VARIANTS = int(os.getenv("TURN_CACHE_MAX_VARIANTS", "3"))
+
+# 음성 세션 WebSocket (/simulation/voice/ws, 대화 기록을 서버가 보관)
+# 마지막 활동 후 이 시간이 지난 세션은 정리합니다. (연결이 끊긴 세션도 이 시간 안에는 session_id로 이어서 사용 가능)
+VOICE_SESSION_IDLE_SECONDS = float(os.getenv("VOICE_SESSION_IDLE_SECONDS", "300"))
+# 동시에 보관할 최대 세션 수 (가득 차면 연결이 끊긴 세션 중 가장 오래된 것부터 정리, 모두 연결 중이면 새 세션 거절)
+VOICE_SESSION_MAX_SESSIONS = int(os.getenv("VOICE_SESSION_MAX_SESSIONS", "1000"))
+# 세션당 원문으로 보관할 최대 턴 수 (이전 턴은 요약으로만 보관)
+VOICE_SESSION_MAX_RETAINED_TURNS = int(os.getenv("VOICE_SESSION_MAX_RETAINED_TURNS", "64"))
+# 사용자 발화 한 번의 최대 글자 수
+VOICE_SESSION_MAX_MESSAGE_CHARS = int(os.getenv("VOICE_SESSION_MAX_MESSAGE_CHARS", "2000"))
+
+# 배치 리포트 작업 (/analysis/batch)
+# 작업 상태는 SQLite에 저장되므로 서버가 재시작되어도 남은 항목을 이어서 처리합니다. (같은 파일을 쓰는 워커들이 나눠 처리)
+BATCH_DB_PATH = os.getenv("BATCH_DB_PATH", os.path.join(BASE_DIR, "database", "batch_jobs.db"))
+# 동시에 처리할 리포트 수와 분당 Gemini 호출 한도 (uvicorn 워커 1개 기준, 실시간 요청 몫을 남겨 두도록 설정)
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))
+BATCH_MAX_CALLS_PER_MINUTE = int(os.getenv("BATCH_MAX_CALLS_PER_MINUTE", "120"))
+BATCH_MAX_SESSIONS = int(os.getenv("BATCH_MAX_SESSIONS", "1000"))
+BATCH_MAX_ATTEMPTS = int(os.getenv("BATCH_MAX_ATTEMPTS", "3"))
+# 처리 중 항목의 점유 시간. 이 시간이 지나도 끝나지 않은 항목(워커 종료 등)은 다시 대기열로 돌아갑니다.
+BATCH_LEASE_SECONDS = float(os.getenv("BATCH_LEASE_SECONDS", "300"))
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "2"))
+BATCH_RETENTION_SECONDS = float(os.getenv("BATCH_RETENTION_SECONDS", str(7 * 24 * 60 * 60)))
+
+# 구조화 출력 (JSON 응답 모드 + 스키마 검증)
+# 검증 실패 시 마감 시간 안에서만 최대 N회 복구 재시도합니다.
+STRUCTURED_OUTPUT_MAX_REPAIRS = int(os.getenv("STRUCTURED_OUTPUT_MAX_REPAIRS", "1"))
+STRUCTURED_OUTPUT_DEADLINES = {
+    "adaptive_turn": float(os.getenv("DEADLINE_ADAPTIVE_TURN_SECONDS", "15")),
+    "basic_report": float(os.getenv("DEADLINE_BASIC_REPORT_SECONDS", "30")),
+    "premium_report": float(os.getenv("DEADLINE_PREMIUM_REPORT_SECONDS", "90")),
+    "diagnose": float(os.getenv("DEADLINE_DIAGNOSE_SECONDS", "30")),
+}
+
+# 모델 라우팅 (엔드포인트별 주 모델 등급, 지연 시간 SLO, 호출별 타임아웃; 단위: 초)
+MODEL_ROUTES = {
+    "adaptive_turn": {"primary": "flash", "slo": float(os.getenv("SLO_ADAPTIVE_TURN_SECONDS", "4")), "timeout": 15.0},
+    "voice_turn": {"primary": "flash", "slo": float(os.getenv("SLO_VOICE_TURN_SECONDS", "3")), "timeout": 10.0},
+    "basic_report": {"primary": "flash", "slo": float(os.getenv("SLO_BASIC_REPORT_SECONDS", "10")), "timeout": 30.0},
+    "premium_report": {"primary": "pro", "slo": float(os.getenv("SLO_PREMIUM_REPORT_SECONDS", "30")), "timeout": 90.0},
+    "diagnose": {"primary": "pro", "slo": float(os.getenv("SLO_DIAGNOSE_SECONDS", "8")), "timeout": 30.0},
+    "summary": {"primary": "flash", "slo": 10.0, "timeout": 30.0},
+}
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", "0.2"))
+# 주 모델이 SLO를 넘어 강등된 동안에도 지연 통계 갱신을 위해 주 모델로 보내는 비율
+ROUTER_PROBE_RATE = float(os.getenv("ROUTER_PROBE_RATE", "0.05"))
+# 주 호출이 p95 지연을 넘기면 Flash로 헤지 호출을 보냅니다.
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+# 서킷 브레이커 (최근 BREAKER_WINDOW회 중 실패 비율이 기준 이상이면 쿨다운 동안 Flash로 강등)
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATIO = float(os.getenv("BREAKER_FAILURE_RATIO", "0.5"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("BREAKER_COOLDOWN_SECONDS", "30"))
+
+# --- Gemini 호출 스케줄러 (쿼터 기반 속도 제한 + 우선순위 대기열) ---
+# 모델별 분당 요청/토큰 쿼터 (키 하나(프로젝트)의 쿼터에 맞춰 설정, uvicorn 워커가 여러 개면 워커 수로 나눈 값)
+GEMINI_QUOTAS = {
+    "pro": {"rpm": int(os.getenv("GEMINI_PRO_RPM", "150")), "tpm": int(os.getenv("GEMINI_PRO_TPM", "2000000"))},
+    "flash": {"rpm": int(os.getenv("GEMINI_FLASH_RPM", "1000")), "tpm": int(os.getenv("GEMINI_FLASH_TPM", "1000000"))},
+}
+# 우선순위 클래스 (위에서부터 높은 순)와 클래스별 최대 대기 시간(초). 이 안에 시작하지 못할 호출은 대기열에서 거절합니다.
+SCHEDULER_MAX_WAIT_SECONDS = {
+    "voice": float(os.getenv("SCHEDULER_MAX_WAIT_VOICE_SECONDS", "2")),
+    "turn": float(os.getenv("SCHEDULER_MAX_WAIT_TURN_SECONDS", "5")),
+    "diagnose": float(os.getenv("SCHEDULER_MAX_WAIT_DIAGNOSE_SECONDS", "10")),
+    "report": float(os.getenv("SCHEDULER_MAX_WAIT_REPORT_SECONDS", "30")),
+    "background": float(os.getenv("SCHEDULER_MAX_WAIT_BACKGROUND_SECONDS", "120")),
+}
+# 엔드포인트 -> 우선순위 클래스 (추측 생성/배치 작업 등은 엔드포인트와 관계없이 background로 실행)
+SCHEDULER_ENDPOINT_CLASSES = {
+    "voice_turn": "voice",
+    "adaptive_turn": "turn",
+    "diagnose": "diagnose",
+    "basic_report": "report",
+    "premium_report": "report",
+    "summary": "background",
+}
+# 모델별 대기열 최대 길이 (가득 차면 가장 낮은 우선순위의 대기 호출부터 거절)
+SCHEDULER_MAX_QUEUE = int(os.getenv("SCHEDULER_MAX_QUEUE", "512"))
+# 429/5xx 응답의 재시도 (지터를 섞은 지수 백오프, 스케줄러 안에서만 수행)
+SCHEDULER_MAX_RETRIES = int(os.getenv("SCHEDULER_MAX_RETRIES", "3"))
+SCHEDULER_RETRY_BASE_SECONDS = float(os.getenv("SCHEDULER_RETRY_BASE_SECONDS", "0.5"))
+SCHEDULER_RETRY_MAX_SECONDS = float(os.getenv("SCHEDULER_RETRY_MAX_SECONDS", "8"))
+# 키 풀 (GOOGLE_API_KEYS가 여러 개일 때): 동시 호출 한도와 쿼터는 키(프로젝트)마다 적용되고, 호출은 여유가 가장 많은 키로 보냅니다.
+# 429(쿼터 초과)나 인증 오류를 낸 키는 아래 시간 동안 분배에서 빼고, 다른 키로 바로 재시도합니다.
+GEMINI_KEY_EJECT_SECONDS = float(os.getenv("GEMINI_KEY_EJECT_SECONDS", "30"))
+GEMINI_KEY_AUTH_EJECT_SECONDS = float(os.getenv("GEMINI_KEY_AUTH_EJECT_SECONDS", "600"))
+
+# --- 고정 프롬프트 템플릿 / Gemini 컨텍스트 캐시 설정 ---
+# 켜면 서버 시작 시 엔드포인트·사기 유형별 고정 프롬프트를 Gemini 캐시 컨텍스트로 등록합니다. (캐시 저장 비용 발생)
+PROMPT_CONTEXT_CACHE_ENABLED = os.getenv("PROMPT_CONTEXT_CACHE_ENABLED", "false").lower() == "true"
+PROMPT_CONTEXT_CACHE_TTL_SECONDS = float(os.getenv("PROMPT_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+
+# --- 로깅 / 지표 설정 ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")   # json | text
+# INFO 이하 로그를 남길 비율 (WARNING 이상은 항상 기록)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+# 요청 단위 접근 로그는 양이 많으므로 별도 비율로 샘플링합니다.
+LOG_ACCESS_SAMPLE_RATE = float(os.getenv("LOG_ACCESS_SAMPLE_RATE", "0.1"))
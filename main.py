@@ -1,21 +1,106 @@
 import json
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager, aclosing
+from typing import List, Literal
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Query, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 
 # --- 1. 역할별 전문가(모듈) 및 모델 import ---
-from services import gemini_service, ocr_service
+from services import (
+    gemini_service, ocr_service, cache_service, triage_service, pattern_service,
+    speculation_service, metrics_service, batch_service, report_service, image_service,
+    voice_session_service, scoring_service, single_flight, turn_cache_service
+)
+from services.log_service import get_logger
+from config import (
+    DIAGNOSE_MAX_IMAGES, BATCH_MAX_SESSIONS, REPORT_PRECOMPUTE_PREMIUM, STARTUP_WARMUP_ENABLED, warm_up_clients,
+    VOICE_SESSION_IDLE_SECONDS, VOICE_SESSION_MAX_MESSAGE_CHARS, SCORING_MAX_SESSIONS
+)
 from models import (
-    AdaptiveTurnRequest, VoiceTurnRequest, ReportRequest,
+    AdaptiveTurnRequest, VoiceTurnRequest, ReportRequest, BatchReportRequest, ScoreSessionsRequest,
+    TextStreamRequest, VoiceStreamRequest, VoiceSessionStart, VoiceSessionUtterance,
     DialogueHistoryEntry, UserInfo # 상세 모델 import
 )
 
+_LOG = get_logger("startup")
+
 # --- 2. FastAPI 앱 생성 ---
+async def _warm_up():
+    """
+    서버가 요청을 받기 시작한 뒤 백그라운드에서 무거운 초기화를 미리 해 둡니다.
+    (클라이언트는 지연 초기화되므로, 워밍업을 끄면 첫 요청이 초기화 비용을 부담합니다)
+    """
+    if STARTUP_WARMUP_ENABLED:
+        started = time.perf_counter()
+        await asyncio.to_thread(warm_up_clients)
+        await asyncio.to_thread(triage_service.warm_up)
+        await asyncio.to_thread(turn_cache_service.warm_up)
+        await image_service.warm_up()
+        _LOG.info("워밍업 완료", duration_ms=round((time.perf_counter() - started) * 1000, 1))
+    # 고정 프롬프트의 토큰 수 측정/캐시 등록은 외부 API 호출이므로 서버 시작을 막지 않도록 백그라운드로 실행합니다.
+    await gemini_service.register_prompt_caches()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 서버 시작 시 사기 패턴 DB를 메모리 색인으로 로드합니다. (이후 변경은 자동 재로드)
+    await asyncio.to_thread(pattern_service.PATTERNS.load)
+    warm_up_task = asyncio.create_task(_warm_up())
+    # 배치 리포트 워커 시작 (이전 실행에서 끝나지 않은 항목도 이어서 처리)
+    batch_service.start()
+    # 연결이 끊긴 뒤 유휴 시간이 지난 음성 세션 정리
+    voice_session_service.start()
+    yield
+    warm_up_task.cancel()
+    await batch_service.stop()
+    await voice_session_service.stop()
+    image_service.shutdown()
+
 app = FastAPI(
     title="Safeguard AI Server",
     description="금융사기 시뮬레이션을 위한 AI 서버 API (v3.0 - Adaptive Engine)",
-    version="3.0.0"
+    version="3.0.0",
+    lifespan=lifespan
 )
+# 이미지 업로드 경로의 요청 본문 크기 제한 (지표 미들웨어 안쪽에서 실행되어 413도 지표에 기록됨)
+app.add_middleware(image_service.UploadLimitMiddleware)
+# 엔드포인트별 처리 시간/진행 중 요청 수 지표와 샘플링된 접근 로그
+app.add_middleware(metrics_service.MetricsMiddleware)
+
+# --- 3. 공통 유틸리티 ---
+
+@app.exception_handler(gemini_service.OverloadedError)
+async def handle_overloaded(request, exc: gemini_service.OverloadedError):
+    """Gemini 쿼터/대기열이 가득 차 처리할 수 없는 요청은 503과 재시도 권장 시각(Retry-After)으로 응답합니다."""
+    retry_after = math.ceil(exc.retry_after)
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "요청이 많아 잠시 후 다시 시도해주세요.", "retry_after": retry_after},
+        headers={"Retry-After": str(retry_after)}
+    )
+
+@app.exception_handler(image_service.ImageRejectedError)
+async def handle_image_rejected(request, exc: image_service.ImageRejectedError):
+    """크기 초과(413), 지원하지 않는 형식(415), 손상된 파일(400) 이미지는 OCR 전에 거절합니다."""
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.message})
+
+async def _to_sse(events):
+    """
+    (event, data) 튜플 스트림을 Server-Sent Events 형식의 문자열로 변환합니다.
+    """
+    async for event, data in events:
+        yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-# --- 3. API 엔드포인트 ---
+def _sse_response(events) -> StreamingResponse:
+    # 프록시(Cloud Run, nginx 등)가 응답을 모아서 보내지 않도록 버퍼링을 끕니다.
+    return StreamingResponse(
+        _to_sse(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# --- 4. API 엔드포인트 ---
 
 @app.get("/", tags=["기본"])
 def read_root():
@@ -23,77 +108,321 @@ def read_root():
     return {"status": "ok", "message": "Safeguard AI Server is running."}
 
 
+@app.get("/metrics", tags=["기본"])
+def read_metrics():
+    """Prometheus 지표 (엔드포인트별 지연 시간, 단계별 처리 시간, 모델별 토큰 사용량/오류 수, 진행 중 요청 수)"""
+    body, content_type = metrics_service.render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/cache/stats", tags=["기본"])
+def read_cache_stats():
+    """이미지 진단 결과 캐시(OCR/진단)의 크기와 적중/미스 횟수를 반환합니다."""
+    return cache_service.cache_stats()
+
+
+@app.get("/triage/stats", tags=["기본"])
+def read_triage_stats():
+    """로컬 사전 분류(fast path)로 절약한 Gemini 호출 수 등 통계를 반환합니다."""
+    return triage_service.triage_stats()
+
+
+@app.get("/patterns/stats", tags=["기본"])
+def read_pattern_stats():
+    """메모리에 로드된 사기 패턴 수와 마지막 로드 시각을 반환합니다."""
+    return pattern_service.PATTERNS.stats()
+
+
+@app.get("/simulation/speculation/stats", tags=["기본"])
+def read_speculation_stats():
+    """적응형 턴 추측 생성의 적중률과 낭비된 호출 수를 반환합니다."""
+    return speculation_service.speculation_stats()
+
+
+@app.get("/simulation/turn_cache/stats", tags=["기본"])
+def read_turn_cache_stats():
+    """적응형 턴 근사 중복 캐시의 크기, 적중률(턴 수별 포함), 정리/재가중 횟수를 반환합니다."""
+    return turn_cache_service.turn_cache_stats()
+
+
+@app.get("/structured_output/stats", tags=["기본"])
+def read_structured_output_stats():
+    """엔드포인트별 Gemini 응답 스키마 검증 실패 및 복구 재시도 횟수를 반환합니다."""
+    return gemini_service.structured_output_stats()
+
+
+@app.get("/router/stats", tags=["기본"])
+def read_router_stats():
+    """모델별 EWMA/p95 지연 시간, 서킷 브레이커 상태, 헤지/강등 횟수를 반환합니다."""
+    return gemini_service.router_stats()
+
+
+@app.get("/analysis/reports/stats", tags=["기본"])
+def read_report_stats():
+    """기본/프리미엄 리포트의 공유 분석 재사용 횟수, 미리 생성한 프리미엄 리포트 수 등을 반환합니다."""
+    return report_service.report_stats()
+
+
+@app.get("/analysis/batch/stats", tags=["기본"])
+def read_batch_stats():
+    """배치 리포트 워커 수, 처리/재시도/실패 항목 수를 반환합니다."""
+    return batch_service.batch_stats()
+
+
+@app.get("/simulation/voice/stats", tags=["기본"])
+def read_voice_session_stats():
+    """음성 세션 WebSocket의 보관 중인 세션 수, 연결 수, 보관 중인 원문 턴/글자 수, 정리/거절 횟수를 반환합니다."""
+    return voice_session_service.voice_session_stats()
+
+
+@app.get("/images/stats", tags=["기본"])
+def read_image_stats():
+    """이미지 전처리(축소/재인코딩으로 줄인 전송량, 거절 사유별 건수, 근사 중복 인식) 통계"""
+    return image_service.image_stats()
+
+
+@app.get("/coalescing/stats", tags=["기본"])
+def read_coalescing_stats():
+    """같은 입력의 동시 요청을 하나의 Gemini/Vision 호출로 합친 횟수(실행/합류/포기)와 진행 중인 호출 수를 반환합니다."""
+    return single_flight.coalescing_stats()
+
+
+@app.get("/scheduler/stats", tags=["기본"])
+def read_scheduler_stats():
+    """모델별 Gemini 호출 대기열 길이, 남은 분당 요청/토큰 쿼터, 거절/재시도 횟수를 반환합니다."""
+    return gemini_service.scheduler_stats()
+
+
+@app.get("/prompts/templates", tags=["기본"])
+def read_prompt_templates():
+    """엔드포인트·사기 유형별 고정 프롬프트의 토큰 수, 캐시 등록 여부, 캐시 적중 횟수를 반환합니다."""
+    return gemini_service.template_stats()
+
+
+def _vulnerability_axis(requested: str | None, history_list: List[DialogueHistoryEntry]) -> str:
+    """BE가 보낸 최대 취약점이 없으면 대화 기록의 axes로 계산합니다. (채점된 턴이 없으면 빈 문자열)"""
+    return requested or scoring_service.highest_vulnerability_axis(history_list) or ""
+
+
 @app.post("/simulation/adaptive_turn", tags=["시뮬레이션"])
-def handle_adaptive_turn(request: AdaptiveTurnRequest):
+async def handle_adaptive_turn(request: AdaptiveTurnRequest, background_tasks: BackgroundTasks):
     """
     (BE 전용) 텍스트 모드의 적응형 턴(4~8턴)을 위한 다음 대사와 선택지를 생성합니다.
-    - 입력: crime_type, 대화 기록, 최대 취약점
+    - 입력: crime_type, 대화 기록, 최대 취약점 (생략하면 대화 기록의 axes로 계산)
     - 출력: { "next_speech": "...", "options": [...] }
     """
-    return gemini_service.generate_adaptive_turn(
+    axis = _vulnerability_axis(request.highest_vulnerability_axis, request.dialogue_history)
+
+    # 1. 직전 응답 후 미리 생성해 둔 턴이 있으면 바로 반환 (SPECULATIVE_TURNS_ENABLED일 때만)
+    turn = await speculation_service.lookup(
         crime_type=request.crime_type,
         history_list=request.dialogue_history,
-        highest_vulnerability_axis=request.highest_vulnerability_axis
+        highest_vulnerability_axis=axis
     )
+    # 2. 최근 대화가 거의 같은 이전 턴이 있으면 Gemini 호출 없이 반환
+    if turn is None:
+        turn = turn_cache_service.lookup(request.crime_type, request.dialogue_history, axis)
+        if turn is None:
+            turn = await gemini_service.generate_adaptive_turn(
+                crime_type=request.crime_type,
+                history_list=request.dialogue_history,
+                highest_vulnerability_axis=axis
+            )
+            # 색인 갱신은 가벼운 CPU 작업이라 이벤트 루프에서 바로 합니다. (스레드풀에서 돌리면 조회와 경쟁)
+            turn_cache_service.store(request.crime_type, request.dialogue_history, axis, turn)
+
+    # 3. 응답 전송 후, 세 선택지 각각에 이어질 다음 턴을 백그라운드에서 미리 생성
+    background_tasks.add_task(
+        speculation_service.speculate,
+        request.crime_type, request.dialogue_history, axis, turn
+    )
+    return turn
 
 
 @app.post("/simulation/voice_turn", tags=["시뮬레이션"])
-def handle_voice_turn(request: VoiceTurnRequest):
+async def handle_voice_turn(request: VoiceTurnRequest):
     """
     (BE 전용) 음성 모드의 다음 턴을 위한 AI 대사(텍스트)를 생성합니다.
     - 입력: 대화 기록, 사용자의 STT 변환 텍스트
     - 출력: { "ai_message": "..." }
     """
-    ai_message = gemini_service.generate_voice_turn(
+    ai_message = await gemini_service.generate_voice_turn(
         history_list=request.dialogue_history,
         user_message=request.user_message
     )
     return {"ai_message": ai_message}
 
+
+@app.post("/simulation/adaptive_turn/stream", tags=["시뮬레이션"])
+async def handle_adaptive_turn_stream(request: TextStreamRequest):
+    """
+    (BE 전용) 텍스트 모드의 적응형 턴을 SSE로 스트리밍합니다.
+    - 이벤트: token(next_speech 조각) -> options(최종 next_speech + 선택지) -> done
+    """
+    axis = _vulnerability_axis(request.highest_vulnerability_axis, request.dialogue_history)
+    # 최근 대화가 거의 같은 이전 턴이 있으면 Gemini 호출 없이 같은 이벤트 순서로 바로 보냅니다.
+    cached = turn_cache_service.lookup(request.crime_type, request.dialogue_history, axis)
+    if cached is not None:
+        return _sse_response(turn_cache_service.replay(cached))
+    return _sse_response(turn_cache_service.recording(
+        gemini_service.stream_adaptive_turn(
+            crime_type=request.crime_type,
+            history_list=request.dialogue_history,
+            highest_vulnerability_axis=axis
+        ),
+        request.crime_type, request.dialogue_history, axis
+    ))
+
+
+@app.post("/simulation/voice_turn/stream", tags=["시뮬레이션"])
+async def handle_voice_turn_stream(request: VoiceStreamRequest):
+    """
+    (BE 전용) 음성 모드의 다음 턴을 SSE로 스트리밍합니다.
+    - 이벤트: token(출력 조각), sentence(TTS용 완성 문장) -> done
+    """
+    return _sse_response(gemini_service.stream_voice_turn(
+        history_list=request.dialogue_history,
+        user_message=request.user_message
+    ))
+
+@app.websocket("/simulation/voice/ws")
+async def handle_voice_session(websocket: WebSocket):
+    """
+    (BE 전용) 음성 모드 세션. 대화 기록을 서버가 보관하므로, 발화마다 새 발화만 보내면 됩니다.
+    - 첫 메시지: {"type": "start", "user_info": {...}, "dialogue_history": [...]} (이어서 사용: {"type": "start", "session_id": "..."})
+    - 발화: {"type": "utterance", "text": "..."} / 종료: {"type": "end"}
+    - 서버 메시지: {"event": ..., "data": {...}} 형식이며, session -> (발화마다) token, sentence -> done(ai_message 포함) 순서입니다.
+    """
+    await websocket.accept()
+    try:
+        start = VoiceSessionStart.model_validate(
+            await asyncio.wait_for(websocket.receive_json(), VOICE_SESSION_IDLE_SECONDS)
+        )
+        session, resumed = voice_session_service.open_session(start)
+    except (ValueError, asyncio.TimeoutError):
+        # JSON이 아니거나(ValueError), 형식이 맞지 않거나(ValidationError), 첫 메시지가 오지 않은 경우
+        await websocket.close(code=voice_session_service.CLOSE_INVALID_START, reason="invalid start message")
+        return
+    except voice_session_service.VoiceSessionError as e:
+        await websocket.send_json({"event": "error", "data": {"error": e.message}})
+        await websocket.close(code=e.close_code)
+        return
+    except WebSocketDisconnect:
+        return
+
+    try:
+        await websocket.send_json({
+            "event": "session",
+            "data": {"session_id": session.session_id, "resumed": resumed, "turns": session.context.total_turns}
+        })
+        while True:
+            try:
+                message = VoiceSessionUtterance.model_validate(
+                    await asyncio.wait_for(websocket.receive_json(), VOICE_SESSION_IDLE_SECONDS)
+                )
+            except asyncio.TimeoutError:
+                # 연결은 닫지만 세션은 유휴 시간 동안 남겨 두므로, 같은 session_id로 다시 연결할 수 있습니다.
+                await websocket.close(code=voice_session_service.CLOSE_IDLE_TIMEOUT, reason="idle timeout")
+                return
+            except ValueError:
+                await websocket.send_json({"event": "error", "data": {"error": "잘못된 메시지 형식입니다."}})
+                continue
+
+            if message.type == "end":
+                voice_session_service.end(session)
+                await websocket.close()
+                return
+            text = message.text.strip()
+            if not text or len(text) > VOICE_SESSION_MAX_MESSAGE_CHARS:
+                await websocket.send_json({
+                    "event": "error",
+                    "data": {"error": f"발화는 1~{VOICE_SESSION_MAX_MESSAGE_CHARS}자여야 합니다."}
+                })
+                continue
+            # 전송 중 연결이 끊기면 생성 중인 스트림(Gemini 호출 자리)도 바로 정리합니다.
+            async with aclosing(voice_session_service.stream_turn(session, text)) as events:
+                async for event, data in events:
+                    await websocket.send_json({"event": event, "data": data})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        voice_session_service.detach(session)
+
+
 @app.post("/analysis/basic_report", tags=["리포트"])
-def get_basic_report(request: ReportRequest):
-    # 1. 먼저, gemini_service.generate_basic_report 함수를 호출하고,
-    #    그 결과를 'report_data'라는 변수에 '일단 저장'합니다.
-    report_data = gemini_service.generate_basic_report(
+async def get_basic_report(
+    request: ReportRequest,
+    background_tasks: BackgroundTasks,
+    precompute_premium: bool = Query(REPORT_PRECOMPUTE_PREMIUM, description="응답 후 프리미엄 리포트를 백그라운드에서 미리 생성"),
+    fast: bool = Query(False, description="Gemini 없이 대화 기록의 verdict 채점만으로 즉시 생성 (verdict가 없으면 일반 생성)")
+):
+    """
+    (BE 전용) 시뮬레이션 종료 후, 무료 기본 리포트를 생성합니다.
+    - 같은 세션의 프리미엄 리포트와 하나의 분석 결과를 공유하므로 두 리포트의 등급이 항상 같습니다.
+    - grade는 대화 기록의 verdict로 계산한 결정적 등급이며, verdict가 없을 때만 Gemini가 판정합니다.
+    """
+    report = await report_service.basic_report(
         crime_type=request.crime_type,
-        history_list=request.dialogue_history
+        history_list=request.dialogue_history,
+        fast=fast
     )
-
-    # 2. 저장된 'report_data'를 '검사'합니다.
-    VALID_GRADES = {"A", "B", "C", "F"}
-    if report_data.get("grade") not in VALID_GRADES:
-        # 3. 만약 검사 결과 문제가 있다면, 'report_data'를 '수정'합니다.
-        report_data["grade"] = "C"
-        print(f"[Warning] Basic report's grade was invalid. Corrected to 'C'.")
-    
-    # 4. 검사와 수정이 모두 끝난, 완벽한 'report_data'를 최종적으로 return 합니다.
-    return report_data
+    # 업그레이드 시 바로 응답할 수 있도록 프리미엄 리포트를 미리 생성 (분석 결과는 재사용)
+    # fast 리포트는 Gemini 분석 없이 만든 것이므로 프리미엄 분석은 실제 요청 시 생성합니다.
+    if precompute_premium and not fast and "error" not in report:
+        background_tasks.add_task(report_service.precompute_premium, request.dialogue_history, request.crime_type)
+    return report
 
 @app.post("/analysis/premium_report", tags=["리포트"])
-def get_premium_report(request: ReportRequest):
+async def get_premium_report(request: ReportRequest):
     """
     (BE 전용) 시뮬레이션 종료 후, 유료 심층 분석 리포트를 생성합니다.
+    - 기본 리포트에서 만든 분석(또는 미리 생성된 리포트)이 있으면 재사용합니다.
+    - overall_evaluation.grade는 기본 리포트와 같은 (결정적 채점 또는 분석) 등급입니다.
     """
-    # 1. gemini_service.generate_premium_report 함수를 호출하고,
-    #    그 결과를 'report_data' 변수에 저장합니다.
-    report_data = gemini_service.generate_premium_report(
+    return await report_service.premium_report(
         crime_type=request.crime_type,
         history_list=request.dialogue_history
     )
 
-    # 2. 저장된 'report_data'를 '검사'합니다.
-    VALID_GRADES = {"A", "B", "C", "F"}
-    # 중첩된 JSON 구조 안의 grade 키를 안전하게 확인합니다.
-    if report_data.get("overall_evaluation", {}).get("grade") not in VALID_GRADES:
-        # 3. 만약 문제가 있다면, 'report_data'를 '수정'합니다.
-        #    overall_evaluation 키가 없을 경우를 대비하여 기본값을 설정해줍니다.
-        if "overall_evaluation" not in report_data:
-            report_data["overall_evaluation"] = {}
-        report_data["overall_evaluation"]["grade"] = "C"
-        print(f"[Warning] Premium report's grade was invalid. Corrected to 'C'.")
-    
-    # 4. 검사와 수정이 모두 끝난, 완벽한 'report_data'를 최종적으로 return 합니다.
-    return report_data
+@app.post("/analysis/batch", status_code=202, tags=["리포트"])
+async def create_batch_report_job(request: BatchReportRequest):
+    """
+    (BE 전용) 교육 회차가 끝난 뒤 여러 세션의 리포트를 한 번에 요청합니다.
+    - 입력: sessions(세션별 crime_type, 대화 기록, 선택적 session_id), report_types(basic/premium)
+    - 출력: { "job_id": "...", "total": 항목 수 } (진행 상황은 /analysis/jobs/{job_id}로 조회)
+    """
+    if len(request.sessions) > BATCH_MAX_SESSIONS:
+        raise HTTPException(status_code=400, detail=f"세션은 최대 {BATCH_MAX_SESSIONS}개까지 요청할 수 있습니다.")
+    return await batch_service.submit(
+        sessions=[session.model_dump() for session in request.sessions],
+        report_types=list(dict.fromkeys(request.report_types))
+    )
+
+@app.post("/analysis/scores", tags=["리포트"])
+def score_sessions(request: ScoreSessionsRequest):
+    """
+    (BE 전용) 여러 세션을 대화 기록의 verdict/axes만으로 즉시 채점합니다. (Gemini 호출 없음)
+    - 출력: { "results": [세션별 grade, risk_score, highest_vulnerability_axis, axis_scores...], "cohort": {등급 분포, 평균...} }
+    """
+    if len(request.sessions) > SCORING_MAX_SESSIONS:
+        raise HTTPException(status_code=400, detail=f"세션은 최대 {SCORING_MAX_SESSIONS}개까지 요청할 수 있습니다.")
+    scores = scoring_service.score_sessions([session.dialogue_history for session in request.sessions])
+    scores["results"] = [
+        {"session_id": session.session_id, **result}
+        for session, result in zip(request.sessions, scores["results"])
+    ]
+    return scores
+
+@app.get("/analysis/jobs/{job_id}", tags=["리포트"])
+async def get_batch_report_job(job_id: str):
+    """
+    (BE 전용) 배치 작업의 진행 상황과 지금까지 완료된 리포트를 반환합니다.
+    - 출력: { "status": "queued|running|completed", "progress": 0~1, "results": [항목별 상태/리포트...] }
+    """
+    job = await batch_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="작업을 찾을 수 없습니다.")
+    return job
 
 # @app.post("/analysis/basic_report", tags=["리포트"])
 # def get_basic_report(request: ReportRequest):
@@ -121,16 +450,11 @@ def get_premium_report(request: ReportRequest):
 #     )
 
 
-@app.post("/diagnose/image", tags=["프리미엄"])
-async def diagnose_image_risk(image_file: UploadFile = File(...)):
-    """
-    (BE 전용) 이미지 파일을 받아 OCR로 텍스트를 추출하고, 위험도를 분석합니다.
-    - 입력: 이미지 파일
-    - 출력: { "risk_level": "...", "reason": "...", ... }
-    """
-    # 1. OCR 전문가에게 이미지 분석 요청
-    extracted_text = await ocr_service.extract_text_from_image(image_file)
-    
+# 위험도 순위 (통합 판정 시 가장 높은 단계를 채택)
+RISK_LEVEL_ORDER = {"안전": 0, "관심": 1, "주의": 2, "위험": 3}
+
+async def _diagnose_extracted_text(extracted_text: str, mode: str = "full") -> dict:
+    """OCR 결과 텍스트 하나에 대한 진단 결과(추출 텍스트 포함)를 만듭니다."""
     if not extracted_text:
         return {
             "risk_level": "안전",
@@ -139,10 +463,62 @@ async def diagnose_image_risk(image_file: UploadFile = File(...)):
             "extracted_text": ""
         }
 
-    # 2. Gemini 전문가에게 텍스트 위험도 진단 요청
-    diagnosis_result = gemini_service.diagnose_text_risk(extracted_text)
-    
-    # 3. OCR로 추출한 원본 텍스트를 결과에 포함하여 반환
+    # Gemini 전문가에게 텍스트 위험도 진단 요청 (mode=fast면 로컬 사전 분류 후 애매한 경우에만)
+    diagnosis_result = await triage_service.diagnose(extracted_text, mode=mode)
+
+    # OCR로 추출한 원본 텍스트를 결과에 포함하여 반환
     diagnosis_result["extracted_text"] = extracted_text
-    
-    return diagnosis_result
\ No newline at end of file
+    return diagnosis_result
+
+
+@app.post("/diagnose/image", tags=["프리미엄"])
+async def diagnose_image_risk(
+    image_file: UploadFile = File(...),
+    mode: Literal["fast", "full"] = Query("full", description="full: 항상 AI 분석 / fast: 검증된 로컬 분류기로 확실한 경우는 바로 판정하고 애매한 경우에만 AI 분석")
+):
+    """
+    (BE 전용) 이미지 파일을 받아 OCR로 텍스트를 추출하고, 위험도를 분석합니다.
+    - 입력: 이미지 파일, mode(fast|full)
+    - 출력: { "risk_level": "...", "reason": "...", ... }
+    """
+    # 1. OCR 전문가에게 이미지 분석 요청
+    extracted_text = await ocr_service.extract_text_from_image(image_file)
+
+    # 2. Gemini 전문가에게 텍스트 위험도 진단 요청 (추출 텍스트 포함)
+    return await _diagnose_extracted_text(extracted_text, mode)
+
+
+@app.post("/diagnose/images", tags=["프리미엄"])
+async def diagnose_images_risk(
+    image_files: List[UploadFile] = File(...),
+    mode: Literal["fast", "full"] = Query("full", description="full: 항상 AI 분석 / fast: 검증된 로컬 분류기로 확실한 경우는 바로 판정하고 애매한 경우에만 AI 분석")
+):
+    """
+    (BE 전용) 여러 장의 이미지(예: 여러 페이지로 캡처한 대화)를 한 번에 진단합니다.
+    - 입력: 이미지 파일 목록, mode(fast|full)
+    - 출력: { "results": [이미지별 진단...], "combined": {통합 판정} }
+      통합 판정은 전체 텍스트 진단과 이미지별 진단 중 위험도가 가장 높은 진단입니다. (source_image: 그 진단의 이미지 번호(0부터), 전체 텍스트 진단이면 null)
+    """
+    if len(image_files) > DIAGNOSE_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"이미지는 최대 {DIAGNOSE_MAX_IMAGES}장까지 업로드할 수 있습니다.")
+
+    # 1. 모든 이미지를 한 번의 배치 OCR로 처리
+    extracted_texts = await ocr_service.extract_texts_from_images(image_files)
+    combined_text = "\n".join(text for text in extracted_texts if text)
+
+    # 2. 이미지별 진단과 전체 대화 기준 진단을 동시에 실행
+    *results, combined = await asyncio.gather(
+        *(_diagnose_extracted_text(text, mode) for text in extracted_texts),
+        _diagnose_extracted_text(combined_text, mode)
+    )
+
+    # 3. 통합 판정은 전체 텍스트 진단과 이미지별 진단 중 가장 높은 위험도의 진단을 (제목/근거/지침까지) 그대로 따릅니다.
+    #    (위험도만 바꾸면 다른 진단의 제목/지침과 섞여 서로 모순될 수 있음. 같은 위험도면 전체 텍스트 진단 우선)
+    candidates = [(None, combined)] + list(enumerate(results))
+    source_image, highest = max(
+        candidates,
+        key=lambda candidate: RISK_LEVEL_ORDER.get(candidate[1].get("risk_level"), -1)
+    )
+    combined = {**highest, "extracted_text": combined_text, "source_image": source_image}
+
+    return {"results": results, "combined": combined}
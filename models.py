@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Dict, Any
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Literal
 
 # --- 공통 데이터 모델 ---
 class DialogueHistoryEntry(BaseModel):
@@ -22,7 +22,7 @@ class AdaptiveTurnRequest(BaseModel):
     """(BE -> AI) 텍스트 모드의 적응형 턴(4~8턴) 요청"""
     crime_type: str
     dialogue_history: List[DialogueHistoryEntry]
-    highest_vulnerability_axis: str
+    highest_vulnerability_axis: str | None = None # 생략하면 대화 기록의 axes로 서버가 계산
     user_info: UserInfo
 
 class VoiceTurnRequest(BaseModel):
@@ -36,6 +36,21 @@ class ReportRequest(BaseModel):
     crime_type: str
     dialogue_history: List[DialogueHistoryEntry]
 
+class BatchSession(BaseModel):
+    """배치 리포트 요청에 포함되는 시뮬레이션 세션 하나"""
+    session_id: str | None = None # BE가 결과를 매칭할 때 사용할 식별자 (선택)
+    crime_type: str
+    dialogue_history: List[DialogueHistoryEntry]
+
+class BatchReportRequest(BaseModel):
+    """(BE -> AI) 여러 세션의 리포트를 한 번에 생성하는 배치 작업 요청"""
+    sessions: List[BatchSession] = Field(min_length=1)
+    report_types: List[Literal["basic", "premium"]] = Field(default=["basic"], min_length=1)
+
+class ScoreSessionsRequest(BaseModel):
+    """(BE -> AI) 여러 세션을 결정적 채점으로 한 번에 평가하는 요청 (집단 분석용, Gemini 호출 없음)"""
+    sessions: List[BatchSession] = Field(min_length=1)
+
 class DiagnoseTextRequest(BaseModel):
     """(BE -> AI) [참고용] 텍스트 기반 위험 진단 요청 (실제로는 이미지 API 사용)"""
     text_to_diagnose: str
@@ -44,7 +59,7 @@ class TextStreamRequest(BaseModel):
     """(BE -> AI) 텍스트 스트리밍 턴 요청 (AdaptiveTurnRequest와 동일)"""
     crime_type: str
     dialogue_history: List[DialogueHistoryEntry]
-    highest_vulnerability_axis: str
+    highest_vulnerability_axis: str | None = None # 생략하면 대화 기록의 axes로 서버가 계산
     user_info: UserInfo
 
 class VoiceStreamRequest(BaseModel):
@@ -53,6 +68,75 @@ class VoiceStreamRequest(BaseModel):
     dialogue_history: List[DialogueHistoryEntry]
     user_info: UserInfo
 
+class VoiceSessionStart(BaseModel):
+    """(BE -> AI) 음성 세션 WebSocket의 첫 메시지. session_id를 보내면 끊긴 세션을 이어서 사용합니다."""
+    type: Literal["start"]
+    session_id: str | None = None
+    user_info: UserInfo | None = None # 새 세션일 때 필수
+    dialogue_history: List[DialogueHistoryEntry] = Field(default_factory=list) # 새 세션의 이전 대화 (선택)
+
+class VoiceSessionUtterance(BaseModel):
+    """(BE -> AI) 음성 세션의 사용자 발화 (STT 변환 텍스트) 또는 세션 종료"""
+    type: Literal["utterance", "end"]
+    text: str = ""
+
+
+# --- API 응답 모델 ---
+# Gemini의 JSON 응답 모드(response_schema)에 그대로 사용되며, 응답 검증에도 사용됩니다.
+
+class AdaptiveOption(BaseModel):
+    """적응형 턴의 사용자 선택지 하나"""
+    text: str = Field(description="사용자가 선택할 수 있는 짧은 대응 (15자 내외)")
+    verdict: Literal["safe", "risky", "unsafe"]
+
+class AdaptiveTurnResponse(BaseModel):
+    """(AI -> BE) 텍스트 모드 적응형 턴 응답"""
+    next_speech: str = Field(description="AI가 생성할 다음 대사")
+    options: List[AdaptiveOption] = Field(min_length=3, max_length=3, description="safe, risky, unsafe 순서의 선택지 3개")
+
+class AnalysisMoment(BaseModel):
+    turn_number: int = Field(description="사용자 대응이 위험했던 대화 턴 번호")
+    user_message: str = Field(description="해당 턴에서 사용자가 선택한 선택지 원문 인용")
+    risk_analysis: str = Field(description="인용한 대응이 위험했던 이유")
+
+class SessionAnalysis(BaseModel):
+    """(내부) 같은 세션의 기본/프리미엄 리포트가 함께 사용하는 분석 결과"""
+    grade: Literal["A", "B", "C", "F"]
+    summary: str = Field(description="AI 한 줄 총평")
+    caution_point: str = Field(description="대화 중 가장 위험했거나 아쉬웠던 대응 하나")
+    guide: str = Field(description="사용자가 얻어야 할 가장 중요한 행동 지침 하나")
+    critical_moments: List[AnalysisMoment] = Field(max_length=3, description="위험도가 높은 순서의 위험했던 대응 (최대 3개)")
+
+class OverallEvaluation(BaseModel):
+    grade: Literal["A", "B", "C", "F"]
+    summary: str = Field(description="변호사 AI 종합 소견 (2~3 문장)")
+
+class CriticalMoment(BaseModel):
+    turn_number: int = Field(description="가장 치명적이었던 대화 턴 번호")
+    user_message: str = Field(description="해당 턴에서 사용자가 선택한 선택지 원문 인용")
+    risk_analysis: str = Field(description="인용한 발언이 법적으로 위험했던 이유")
+    legal_advice: str = Field(description="해당 상황에서의 이상적인 법률적 대응")
+
+class PremiumReportResponse(BaseModel):
+    """(AI -> BE) 유료 프리미엄 리포트 응답"""
+    overall_evaluation: OverallEvaluation
+    critical_moments: List[CriticalMoment]
+    recommended_action: str = Field(description="최종 법률 권고")
+    references: List[str]
+
+class DiagnosisResponse(BaseModel):
+    """(AI -> BE) 텍스트 위험도 진단 응답"""
+    risk_level: Literal["위험", "주의", "관심"]
+    title: str = Field(description="위험도에 맞는 상황 요약 제목")
+    detected_keywords: List[str] = Field(min_length=1, max_length=3, description="탐지된 핵심 위험 키워드 (최대 3개)")
+    summary: str = Field(description="해당 위험 등급으로 판정한 핵심 근거")
+    guide: str = Field(description="사용자가 취해야 할 행동 지침")
+
+class TriageDiagnosisResponse(DiagnosisResponse):
+    """(AI -> BE) /diagnose/image(s)의 진단 응답. (Gemini 진단 + 로컬 사전 분류 점수, response_schema로는 사용하지 않음)"""
+    scam_score: float | None = Field(default=None, description="보정된 로컬 분류기의 사기 확률 (분류기가 없거나 mode=full이면 null)")
+    confidence: float | None = Field(default=None, description="로컬 분류기가 판정한 경우 그 판정(risk_level)의 확률 (AI가 판정했으면 null)")
+
 
 # 참고: 이미지 업로드는 Pydantic 모델이 아닌,
 # main.py의 엔드포인트에서 File 타입으로 직접 처리하므로 별도 모델이 필요 없습니다.
\ No newline at end of file
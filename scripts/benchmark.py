@@ -0,0 +1,283 @@
+"""
+엔드포인트별 부하 테스트 / 벤치마크.
+
+동시 접속 수를 단계적으로 올리며 main.py의 모든 엔드포인트를 호출하고,
+처리량(req/s), p50/p95/p99 지연 시간, 오류 수, 이벤트 루프 지연(lag)을 보고합니다.
+
+사용 예)
+  # 가짜 Gemini/Vision으로 실행 (기본값, 쿼터 소모 없음)
+  python scripts/benchmark.py --concurrency 1,16,64
+
+  # 실제 API 응답을 녹화한 뒤, CI에서는 네트워크 없이 재생하여 기준선과 비교
+  AI_BACKEND=record python scripts/benchmark.py --concurrency 1 --requests 10
+  AI_BACKEND=replay python scripts/benchmark.py --output bench.json --baseline bench_baseline.json
+
+  # 이미 떠 있는 서버를 대상으로 실행 (이벤트 루프 지연은 벤치마크 클라이언트 기준)
+  python scripts/benchmark.py --url http://localhost:8000
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import asyncio
+import argparse
+
+# 상대 경로 사용 (프로젝트 루트 기준)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+# 서버를 프로세스 안에서 띄울 때는 별도 지정이 없으면 가짜 클라이언트를 사용합니다. (config import 전에 설정)
+os.environ.setdefault("AI_BACKEND", "fake")
+# 접근 로그가 벤치마크 출력을 덮지 않도록 줄입니다.
+os.environ.setdefault("LOG_ACCESS_SAMPLE_RATE", "0")
+
+import httpx
+
+DEFAULT_SCENARIOS = [
+    "adaptive_turn", "voice_turn", "adaptive_turn_stream", "voice_turn_stream",
+    "basic_report", "premium_report", "diagnose_image", "diagnose_images",
+]
+# 요약 생성(백그라운드 Gemini 호출)이 끼어들지 않도록 CONTEXT_RECENT_TURNS보다 짧은 기록을 사용합니다.
+_HISTORY_TURNS = 6
+
+
+# --- 요청 데이터 ---
+def _png(seed: int) -> bytes:
+    """seed마다 색이 다른 1x1 PNG (이미지마다 OCR 캐시 키가 달라지도록)"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+    pixel = bytes([0, seed % 256, (seed // 256) % 256, (seed // 65536) % 256])
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(pixel))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _history(i: int) -> list[dict]:
+    history = []
+    for turn in range(_HISTORY_TURNS):
+        if turn % 2 == 0:
+            history.append({"role": "agent", "text": f"안녕하세요, 서울중앙지검 수사관입니다. 사건번호 {i}-{turn} 관련해서 연락드렸습니다."})
+        else:
+            history.append({"role": "user", "text": f"무슨 일 때문이죠? ({i}-{turn})", "verdict": "risky"})
+    return history
+
+
+def _turn_body(i: int) -> dict:
+    return {
+        "crime_type": "보이스피싱",
+        "dialogue_history": _history(i),
+        "highest_vulnerability_axis": "권위",
+        "user_info": {"user_name": f"bench-{i}"},
+    }
+
+
+def _voice_body(i: int) -> dict:
+    return {"user_message": f"제가 뭘 하면 되나요? ({i})", "dialogue_history": _history(i), "user_info": {"user_name": f"bench-{i}"}}
+
+
+def _report_body(i: int) -> dict:
+    return {"crime_type": "보이스피싱", "dialogue_history": _history(i)}
+
+
+# --- 시나리오: (client, i) -> 첫 바이트까지 걸린 시간(초) 또는 None ---
+async def _post_json(client, path: str, body: dict) -> None:
+    response = await client.post(path, json=body)
+    response.raise_for_status()
+
+
+async def _post_stream(client, path: str, body: dict) -> float:
+    started = time.perf_counter()
+    first_byte = None
+    async with client.stream("POST", path, json=body) as response:
+        response.raise_for_status()
+        async for _ in response.aiter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+    return first_byte
+
+
+SCENARIOS = {
+    "adaptive_turn": lambda client, i: _post_json(client, "/simulation/adaptive_turn", _turn_body(i)),
+    "voice_turn": lambda client, i: _post_json(client, "/simulation/voice_turn", _voice_body(i)),
+    "adaptive_turn_stream": lambda client, i: _post_stream(client, "/simulation/adaptive_turn/stream", _turn_body(i)),
+    "voice_turn_stream": lambda client, i: _post_stream(client, "/simulation/voice_turn/stream", _voice_body(i)),
+    "basic_report": lambda client, i: _post_json(client, "/analysis/basic_report", _report_body(i)),
+    "premium_report": lambda client, i: _post_json(client, "/analysis/premium_report", _report_body(i)),
+    "diagnose_image": lambda client, i: _upload(client, "/diagnose/image", "image_file", [i]),
+    "diagnose_images": lambda client, i: _upload(client, "/diagnose/images", "image_files", [i * 3, i * 3 + 1, i * 3 + 2]),
+}
+
+
+async def _upload(client, path: str, field: str, seeds: list[int]) -> None:
+    files = [(field, (f"bench-{seed}.png", _png(seed + 1), "image/png")) for seed in seeds]
+    response = await client.post(path, files=files)
+    response.raise_for_status()
+
+
+# --- 측정 ---
+def _percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _ms(seconds: float | None) -> float | None:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+async def _monitor_loop_lag(samples: list[float], interval: float = 0.01) -> None:
+    # 예정보다 늦게 깨어난 시간 = 이벤트 루프가 다른 작업에 막혀 있던 시간
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+async def run_level(client, scenario: str, concurrency: int, total: int, offset: int) -> dict:
+    call = SCENARIOS[scenario]
+    latencies, first_bytes, lags = [], [], []
+    errors: dict[str, int] = {}
+    indices = iter(range(offset, offset + total))
+
+    async def worker():
+        for i in indices:
+            started = time.perf_counter()
+            try:
+                first_byte = await call(client, i)
+            except Exception as e:
+                name = type(e).__name__
+                if isinstance(e, httpx.HTTPStatusError):
+                    name = f"HTTP {e.response.status_code}"
+                errors[name] = errors.get(name, 0) + 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            if first_byte is not None:
+                first_bytes.append(first_byte)
+
+    monitor = asyncio.create_task(_monitor_loop_lag(lags))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    monitor.cancel()
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": _ms(_percentile(latencies, 0.50)),
+        "p95_ms": _ms(_percentile(latencies, 0.95)),
+        "p99_ms": _ms(_percentile(latencies, 0.99)),
+        "first_byte_p95_ms": _ms(_percentile(first_bytes, 0.95)),
+        "loop_lag_p99_ms": _ms(_percentile(lags, 0.99)),
+        "loop_lag_max_ms": _ms(max(lags) if lags else None),
+    }
+
+
+def _print_row(scenario: str, result: dict) -> None:
+    errors = sum(result["errors"].values())
+    fmt = lambda key: "-" if result[key] is None else f"{result[key]}ms"
+    print(
+        f"{scenario:<22} c={result['concurrency']:<4} ok={result['ok']:<5} err={errors:<4} "
+        f"rps={result['throughput_rps']:<8} p50={fmt('p50_ms')} p95={fmt('p95_ms')} p99={fmt('p99_ms')} "
+        f"ttfb95={fmt('first_byte_p95_ms')} lag99={fmt('loop_lag_p99_ms')} lagmax={fmt('loop_lag_max_ms')}"
+    )
+
+
+def compare_with_baseline(results: dict, baseline: dict, max_regression: float) -> list[str]:
+    """기준선 대비 p95가 max_regression 비율 이상 나빠졌거나 오류가 새로 생긴 항목을 반환합니다."""
+    regressions = []
+    for scenario, levels in results.items():
+        for level, result in levels.items():
+            base = baseline.get(scenario, {}).get(level)
+            if base is None:
+                continue
+            if base.get("p95_ms") and result.get("p95_ms") and result["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+                regressions.append(f"{scenario} c={level}: p95 {base['p95_ms']}ms -> {result['p95_ms']}ms")
+            if sum(result["errors"].values()) > sum(base.get("errors", {}).values()):
+                regressions.append(f"{scenario} c={level}: 오류 {sum(base.get('errors', {}).values())} -> {sum(result['errors'].values())}")
+    return regressions
+
+
+# --- 실행 ---
+async def _start_local_server():
+    """main.app을 같은 이벤트 루프에서 임의 포트로 띄웁니다. (이벤트 루프 지연이 서버 기준으로 측정됨)"""
+    import uvicorn
+    import main
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=0, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, f"http://127.0.0.1:{port}"
+
+
+async def main_async(args) -> int:
+    server = task = None
+    base_url = args.url
+    if base_url is None:
+        server, task, base_url = await _start_local_server()
+        print(f"[Benchmark] 프로세스 내 서버 시작 ({base_url}, AI_BACKEND={os.environ['AI_BACKEND']})")
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    scenarios = args.scenarios.split(",") if args.scenarios else DEFAULT_SCENARIOS
+    results: dict[str, dict[str, dict]] = {}
+    limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels) * 2)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            for scenario in scenarios:
+                offset = 0
+                for concurrency in levels:
+                    total = args.requests or max(20, concurrency * 4)
+                    result = await run_level(client, scenario, concurrency, total, offset)
+                    offset += total
+                    results.setdefault(scenario, {})[str(concurrency)] = result
+                    _print_row(scenario, result)
+    finally:
+        if server is not None:
+            server.should_exit = True
+            await task
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"[Benchmark] 결과 저장: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.max_regression)
+        if regressions:
+            print("[Benchmark] 성능 회귀 감지:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print("[Benchmark] 기준선 대비 성능 회귀 없음.")
+    return 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Safeguard AI Server 부하 테스트 / 벤치마크")
+    parser.add_argument("--url", help="대상 서버 URL (생략하면 프로세스 안에서 main.app을 띄움)")
+    parser.add_argument("--concurrency", default="1,16,64", help="동시 요청 수 단계 (쉼표 구분)")
+    parser.add_argument("--requests", type=int, default=0, help="단계별 요청 수 (0이면 max(20, 동시 요청 수 x 4))")
+    parser.add_argument("--scenarios", default="", help=f"실행할 시나리오 (쉼표 구분, 기본: 전체) {DEFAULT_SCENARIOS}")
+    parser.add_argument("--timeout", type=float, default=120.0, help="요청별 타임아웃(초)")
+    parser.add_argument("--output", help="결과를 저장할 JSON 경로")
+    parser.add_argument("--baseline", help="비교할 기준선 JSON 경로 (회귀가 있으면 종료 코드 1)")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="허용하는 p95 증가 비율 (기본 0.2 = 20%%)")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main_async(parse_args())))
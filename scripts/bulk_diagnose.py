@@ -0,0 +1,360 @@
+"""
+대량 문자 진단 (오프라인, 임계값 튜닝용).
+
+신고된 SMS/카카오톡 메시지 말뭉치(JSONL 또는 CSV)를 한 줄씩 읽어 diagnose_text_risk로 진단하고,
+결과를 JSONL로 이어 씁니다. 서버를 거치지 않고 프로세스 안에서 Gemini를 호출하며,
+호출은 서버와 같은 스케줄러(모델별 동시 호출 한도, 분당 요청/토큰 쿼터) 안에서 실행됩니다.
+
+- 입력은 스트리밍으로 읽고, 진행 상황/중복 제거용 진단 결과는 SQLite 체크포인트에 저장하므로 말뭉치 크기와 관계없이 메모리 사용량이 일정합니다.
+- 중단(Ctrl+C, 오류, 강제 종료)된 뒤 같은 명령으로 다시 실행하면 마지막 체크포인트부터 이어서 처리합니다.
+- 공백/URL/숫자만 다른 같은 문자는 한 번만 진단하고 결과를 재사용합니다. (서버의 진단 캐시와 같은 정규화)
+- 각 결과에는 로컬 사전 분류(triage)의 scam_score도 함께 기록하여 TRIAGE_LLM_BAND_* 조정에 사용할 수 있습니다. (TRIAGE_TRAINING_PATH로 학습한 경우)
+
+사용 예)
+  # JSONL (한 줄에 {"id": ..., "text": ...})
+  python scripts/bulk_diagnose.py reports.jsonl --output diagnoses.jsonl --concurrency 32
+
+  # CSV (머리글 행 필요), 열 이름 지정
+  python scripts/bulk_diagnose.py reports.csv --output diagnoses.jsonl --text-field message --id-field report_id
+
+  # 쿼터 소모 없이 파이프라인만 확인
+  AI_BACKEND=fake python scripts/bulk_diagnose.py reports.jsonl --output /tmp/out.jsonl
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import argparse
+
+# 상대 경로 사용 (프로젝트 루트 기준)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from services import triage_service
+from services.cache_service import hash_text
+from services.gemini_scheduler import OverloadedError
+
+# diagnose_text_risk가 실패를 감출 때 돌려주는 위험도 (재시도 대상)
+_ERROR_RISK_LEVEL = "오류"
+# 재시도 간격 (지수 백오프 기준, 초)
+_RETRY_BASE_SECONDS = 2.0
+
+
+# --- 입력 ---
+def _detect_format(path: str, input_format: str | None) -> str:
+    if input_format:
+        return input_format
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def _iter_rows(f, input_format: str):
+    """행(dict, 읽을 수 없는 행은 None)을 차례로 돌려줍니다. JSONL의 빈 줄은 행으로 세지 않습니다."""
+    if input_format == "csv":
+        yield from csv.DictReader(f)
+        return
+    for line in f:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else None
+
+
+def iter_records(path: str, input_format: str, text_field: str, id_field: str):
+    """(행 번호, id, 텍스트)를 한 행씩 돌려줍니다. (텍스트가 없거나 행을 읽을 수 없으면 텍스트는 None)"""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for index, row in enumerate(_iter_rows(f, input_format)):
+            if row is None:
+                yield index, None, None
+                continue
+            text = row.get(text_field)
+            yield index, row.get(id_field), text if isinstance(text, str) and text.strip() else None
+
+
+def count_records(path: str, input_format: str) -> int:
+    """ETA 계산용 전체 행 수 (한 번 더 훑지만 행을 보관하지 않음)"""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if input_format == "csv":
+            return sum(1 for _ in csv.DictReader(f))
+        return sum(1 for line in f if line.strip())
+
+
+# --- 체크포인트 ---
+class Checkpoint:
+    """
+    진행 상황과 진단 결과를 보관하는 SQLite 파일.
+    - meta: 입력 파일/모드, 출력 파일의 확정된 길이(offset), 연속 완료 구간의 끝(watermark)
+    - done: watermark 이후에 완료된 행 번호 (동시 처리로 순서가 뒤섞인 구간만 보관)
+    - results: 정규화된 텍스트 해시 -> 진단 결과 (중복 문자 재사용)
+    출력 파일에 쓴 줄과 완료 표시는 같은 커밋에서 확정되며, 다시 실행하면 출력 파일을 확정된 길이로 잘라 이어 씁니다.
+    """
+
+    def __init__(self, path: str, input_path: str, mode: str):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS done (record_index INTEGER PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS results (text_hash TEXT PRIMARY KEY, diagnosis TEXT NOT NULL);
+        """)
+        meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        identity = {"input": os.path.abspath(input_path), "mode": mode}
+        for key, value in identity.items():
+            if key in meta and meta[key] != value:
+                raise SystemExit(f"[Bulk] 체크포인트의 {key}({meta[key]})가 이번 실행({value})과 다릅니다. --restart로 새로 시작하세요.")
+        with self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)", identity.items())
+        self.offset = int(meta.get("offset", 0))
+        self.watermark = int(meta.get("watermark", 0))
+        self._done_above = {row[0] for row in self._conn.execute("SELECT record_index FROM done")}
+
+    def is_done(self, index: int) -> bool:
+        return index < self.watermark or index in self._done_above
+
+    def lookup(self, text_hash: str) -> dict | None:
+        row = self._conn.execute("SELECT diagnosis FROM results WHERE text_hash = ?", (text_hash,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def commit(self, indices: list[int], results: dict[str, dict], offset: int) -> None:
+        self._done_above.update(indices)
+        while self.watermark in self._done_above:
+            self._done_above.remove(self.watermark)
+            self.watermark += 1
+        self.offset = offset
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO results (text_hash, diagnosis) VALUES (?, ?)",
+                ((key, json.dumps(value, ensure_ascii=False)) for key, value in results.items())
+            )
+            self._conn.execute("DELETE FROM done WHERE record_index < ?", (self.watermark,))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO done (record_index) VALUES (?)",
+                ((index,) for index in indices if index >= self.watermark)
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (("offset", str(offset)), ("watermark", str(self.watermark)))
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class ResultWriter:
+    """결과 줄을 모아 두었다가 checkpoint_every개 또는 checkpoint_seconds마다 출력 파일과 체크포인트에 함께 확정합니다."""
+
+    def __init__(self, output_path: str, checkpoint: Checkpoint, checkpoint_every: int, checkpoint_seconds: float):
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_seconds = checkpoint_seconds
+        # 마지막 체크포인트 이후에 쓴(확정되지 않은) 부분은 버리고 이어 씁니다.
+        if os.path.exists(output_path):
+            if os.path.getsize(output_path) < checkpoint.offset:
+                raise SystemExit(f"[Bulk] 출력 파일이 체크포인트보다 짧습니다: {output_path} (--restart로 새로 시작하세요)")
+            os.truncate(output_path, checkpoint.offset)
+        elif checkpoint.offset:
+            raise SystemExit(f"[Bulk] 출력 파일이 없습니다: {output_path} (--restart로 새로 시작하세요)")
+        self._file = open(output_path, "ab")
+        self._lines: list[bytes] = []
+        self._indices: list[int] = []
+        self._results: dict[str, dict] = {}
+        self._last_commit = time.monotonic()
+
+    def lookup(self, text_hash: str) -> dict | None:
+        result = self._results.get(text_hash)
+        return result if result is not None else self.checkpoint.lookup(text_hash)
+
+    def add(self, index: int, line: dict, text_hash: str | None = None, diagnosis: dict | None = None) -> None:
+        self._lines.append(json.dumps(line, ensure_ascii=False).encode("utf-8") + b"\n")
+        self._indices.append(index)
+        if diagnosis is not None:
+            self._results[text_hash] = diagnosis
+        if len(self._lines) >= self.checkpoint_every or time.monotonic() - self._last_commit >= self.checkpoint_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._lines:
+            self._file.write(b"".join(self._lines))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self.checkpoint.commit(self._indices, self._results, self._file.tell())
+        self._lines, self._indices, self._results = [], [], {}
+        self._last_commit = time.monotonic()
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+
+
+# --- 진단 ---
+async def _diagnose(text: str, mode: str, max_attempts: int) -> dict:
+    """과부하(쿼터 초과)는 권장 시간만큼 기다린 뒤 시도 횟수에 넣지 않고 다시 시도합니다."""
+    attempt = 0
+    while True:
+        try:
+            result = await triage_service.diagnose(text, mode=mode)
+        except OverloadedError as e:
+            await asyncio.sleep(e.retry_after)
+            continue
+        attempt += 1
+        if result.get("risk_level") != _ERROR_RISK_LEVEL and "error" not in result:
+            return result
+        if attempt >= max_attempts:
+            return result
+        await asyncio.sleep(_RETRY_BASE_SECONDS * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+async def main_async(args) -> int:
+    input_format = _detect_format(args.input, args.format)
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint.db"
+    if args.restart:
+        for path in (checkpoint_path, f"{checkpoint_path}-wal", f"{checkpoint_path}-shm", args.output):
+            if os.path.exists(path):
+                os.remove(path)
+
+    total = None if args.no_count else count_records(args.input, input_format)
+    checkpoint = Checkpoint(checkpoint_path, args.input, args.mode)
+    writer = ResultWriter(args.output, checkpoint, args.checkpoint_every, args.checkpoint_seconds)
+    if checkpoint.watermark:
+        print(f"[Bulk] 체크포인트에서 이어서 처리합니다. (연속 완료 {checkpoint.watermark:,}행)")
+    # 분류기를 미리 학습해 둡니다. (진단 도중 이벤트 루프가 학습을 기다리지 않도록)
+    await asyncio.to_thread(triage_service.warm_up)
+
+    stats = {"processed": 0, "skipped": 0, "diagnosed": 0, "duplicates": 0, "errors": 0}
+    in_flight: dict[str, asyncio.Future] = {}
+    # 읽기가 진단보다 앞서 나가지 않도록 대기열 크기를 제한합니다. (메모리 사용량 일정)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    loop = asyncio.get_running_loop()
+
+    async def process(index: int, record_id, text: str | None) -> None:
+        line = {"index": index, "id": record_id}
+        if text is None:
+            stats["errors"] += 1
+            writer.add(index, {**line, "error": "텍스트가 없거나 읽을 수 없는 행입니다."})
+            return
+
+        text_hash = hash_text(text)
+        diagnosis = writer.lookup(text_hash)
+        duplicate = diagnosis is not None
+        if diagnosis is None and text_hash in in_flight:
+            # 같은 문자를 다른 작업자가 진단 중이면 그 결과를 기다립니다.
+            duplicate = True
+            diagnosis = await asyncio.shield(in_flight[text_hash])
+        store = None
+        if diagnosis is None:
+            future = in_flight[text_hash] = loop.create_future()
+            try:
+                diagnosis = await _diagnose(text, args.mode, args.max_attempts)
+                future.set_result(diagnosis)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                future.set_exception(e)
+                future.exception()  # (기다리는 작업자가 없어도 경고가 남지 않도록)
+                raise
+            finally:
+                del in_flight[text_hash]
+            stats["diagnosed"] += 1
+            store = diagnosis
+
+        failed = diagnosis.get("risk_level") == _ERROR_RISK_LEVEL or "error" in diagnosis
+        if failed:
+            # 실패한 결과는 재사용하지 않습니다. (다음 중복 문자는 다시 진단)
+            store = None
+            stats["errors"] += 1
+            line["error"] = diagnosis.get("error") or diagnosis.get("summary")
+        stats["duplicates"] += duplicate
+        line.update({"text_hash": text_hash, "duplicate": duplicate, "diagnosis": diagnosis})
+        if not args.no_triage:
+            line["triage"] = triage_service.classify(text)
+        writer.add(index, line, text_hash, store)
+
+    async def produce() -> None:
+        for index, record_id, text in iter_records(args.input, input_format, args.text_field, args.id_field):
+            if checkpoint.is_done(index):
+                stats["skipped"] += 1
+                continue
+            await queue.put((index, record_id, text))
+        for _ in range(args.concurrency):
+            await queue.put(None)
+
+    async def work() -> None:
+        while (record := await queue.get()) is not None:
+            await process(*record)
+            stats["processed"] += 1
+
+    started = time.monotonic()
+
+    def report(final: bool = False) -> None:
+        elapsed = max(time.monotonic() - started, 1e-9)
+        rate = stats["processed"] / elapsed
+        done = stats["processed"] + stats["skipped"]
+        progress = f"{done:,}/{total:,} ({done / total:.1%})" if total else f"{done:,}"
+        eta = ""
+        if total and not final:
+            eta = f", ETA {_format_duration((total - done) / rate)}" if rate > 0 else ", ETA -"
+        print(
+            f"[Bulk] {progress} {rate:.1f}건/s, 진단 {stats['diagnosed']:,}, "
+            f"중복 재사용 {stats['duplicates']:,}, 오류 {stats['errors']:,}{eta}",
+            flush=True
+        )
+
+    async def report_loop() -> None:
+        while True:
+            await asyncio.sleep(args.progress_seconds)
+            report()
+
+    reporter = asyncio.create_task(report_loop())
+    try:
+        await asyncio.gather(produce(), *(work() for _ in range(args.concurrency)))
+    finally:
+        # 중단되더라도 완료된 결과까지는 확정해 두고, 다시 실행하면 그 다음부터 처리합니다.
+        reporter.cancel()
+        writer.close()
+        checkpoint.close()
+        report(final=True)
+    print(f"[Bulk] 완료: {_format_duration(time.monotonic() - started)}, 결과 {args.output}")
+    return 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="문자 말뭉치 대량 진단 (체크포인트로 이어서 실행)")
+    parser.add_argument("input", help="입력 파일 (JSONL 또는 CSV)")
+    parser.add_argument("--output", required=True, help="결과 JSONL 경로 (이어서 실행하면 뒤에 추가)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="입력 형식 (생략하면 확장자로 판단)")
+    parser.add_argument("--text-field", default="text", help="진단할 텍스트 열/키 이름")
+    parser.add_argument("--id-field", default="id", help="결과에 함께 기록할 식별자 열/키 이름")
+    parser.add_argument("--mode", choices=["full", "fast"], default="full",
+                        help="full: 항상 Gemini로 진단 (diagnose_text_risk) / fast: 로컬 사전 분류 후 애매한 경우에만 Gemini")
+    parser.add_argument("--concurrency", type=int, default=16, help="동시에 진단할 문자 수 (호출은 스케줄러의 쿼터 안에서 시작)")
+    parser.add_argument("--max-attempts", type=int, default=3, help="진단 실패 시 최대 시도 횟수 (쿼터 대기는 제외)")
+    parser.add_argument("--checkpoint", help="체크포인트 SQLite 경로 (기본: <output>.checkpoint.db)")
+    parser.add_argument("--checkpoint-every", type=int, default=200, help="체크포인트를 저장할 결과 수 간격")
+    parser.add_argument("--checkpoint-seconds", type=float, default=10.0, help="체크포인트를 저장할 최대 시간 간격(초)")
+    parser.add_argument("--progress-seconds", type=float, default=5.0, help="진행 상황 출력 간격(초)")
+    parser.add_argument("--no-count", action="store_true", help="시작 전에 전체 행 수를 세지 않음 (ETA 생략)")
+    parser.add_argument("--no-triage", action="store_true", help="결과에 로컬 사전 분류 점수를 기록하지 않음")
+    parser.add_argument("--restart", action="store_true", help="체크포인트와 출력 파일을 지우고 처음부터 실행")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(asyncio.run(main_async(parse_args())))
+    except KeyboardInterrupt:
+        print("[Bulk] 중단되었습니다. 같은 명령으로 다시 실행하면 이어서 처리합니다.")
+        sys.exit(130)
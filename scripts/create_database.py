@@ -33,6 +33,19 @@ def create_database():
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP
         )
         ''')
+
+        # 같은 (유형, 시나리오, 모드) 패턴은 하나만 존재하도록 하여 insert_patterns.py가 upsert할 수 있게 합니다.
+        cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_patterns_scenario
+        ON patterns (crime_type, scenario_name, simulation_mode)
+        ''')
+        # 서버가 (crime_type, simulation_mode)별 활성 패턴을 조회할 때 사용하는 색인
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_patterns_lookup
+        ON patterns (crime_type, simulation_mode, is_active)
+        ''')
+        # 서버가 읽는 동안에도 쓰기가 가능하도록 WAL 모드를 사용합니다.
+        cursor.execute('PRAGMA journal_mode=WAL')
         
         conn.commit()
         conn.close()
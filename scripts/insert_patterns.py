@@ -1,39 +1,74 @@
 import sqlite3
 import json
 import os
+import time
 
 # 상대 경로 사용 (프로젝트 루트 기준)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(BASE_DIR, 'database', 'safeguard_patterns.db')
 JSON_PATH = os.path.join(BASE_DIR, 'data', 'patterns_final.json')
 
+def ensure_schema(cursor):
+    """
+    upsert에 필요한 색인을 준비합니다. (예전 스크립트로 만든 DB도 그대로 사용할 수 있도록)
+    """
+    # 예전 방식(단순 INSERT)으로 중복 삽입된 행이 있으면 가장 최근 행만 남깁니다.
+    cursor.execute('''
+    DELETE FROM patterns WHERE pattern_id NOT IN (
+        SELECT MAX(pattern_id) FROM patterns GROUP BY crime_type, scenario_name, simulation_mode
+    )
+    ''')
+    cursor.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_patterns_scenario
+    ON patterns (crime_type, scenario_name, simulation_mode)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_patterns_lookup
+    ON patterns (crime_type, simulation_mode, is_active)
+    ''')
+
 def insert_patterns_from_json():
     """
-    JSON 파일에서 패턴 데이터를 읽어와 SQLite DB에 삽입합니다.
+    JSON 파일에서 패턴 데이터를 읽어와 SQLite DB에 일괄 upsert합니다.
+    - 같은 (crime_type, scenario_name, simulation_mode) 패턴은 새로 넣지 않고 갱신하므로 여러 번 실행해도 안전합니다.
+    - 하나의 트랜잭션 안에서 executemany로 처리하여, 실행 중인 서버는 완료된 결과만 보게 됩니다.
     """
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
         with open(JSON_PATH, 'r', encoding='utf-8') as f:
             patterns = json.load(f)
-            
-        for pattern in patterns:
-            cursor.execute('''
-            INSERT INTO patterns (crime_type, scenario_name, simulation_mode, pattern_data, is_active)
-            VALUES (?, ?, ?, ?, ?)
-            ''', (
+
+        rows = [
+            (
                 pattern['crime_type'],
                 pattern['scenario_name'],
                 pattern['simulation_mode'],
-                pattern['pattern_data'], # 이미 JSON 문자열이므로 그대로 저장
-                pattern['is_active']
-            ))
-            
-        conn.commit()
+                # 대부분 이미 JSON 문자열이지만, 객체로 들어온 경우 직렬화합니다.
+                pattern['pattern_data'] if isinstance(pattern['pattern_data'], str)
+                else json.dumps(pattern['pattern_data'], ensure_ascii=False),
+                int(pattern.get('is_active', 1))
+            )
+            for pattern in patterns
+        ]
+
+        started = time.perf_counter()
+        conn = sqlite3.connect(DB_PATH)
+        # 서버(패턴 저장소)가 읽는 중에도 쓰기가 막히지 않도록 WAL 모드를 사용합니다.
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with conn:
+            cursor = conn.cursor()
+            ensure_schema(cursor)
+            cursor.executemany('''
+            INSERT INTO patterns (crime_type, scenario_name, simulation_mode, pattern_data, is_active)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (crime_type, scenario_name, simulation_mode) DO UPDATE SET
+                pattern_data = excluded.pattern_data,
+                is_active = excluded.is_active
+            ''', rows)
         conn.close()
-        
-        print(f"{len(patterns)}개의 패턴이 '{DB_PATH}'에 성공적으로 삽입되었습니다.")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        print(f"{len(rows)}개의 패턴이 '{DB_PATH}'에 성공적으로 반영되었습니다. ({elapsed_ms:.1f}ms)")
         
     except FileNotFoundError:
         print(f"[Error] '{JSON_PATH}' 파일을 찾을 수 없습니다. 3_pattern_generation.ipynb를 먼저 실행하세요.")
@@ -41,4 +76,4 @@ def insert_patterns_from_json():
         print(f"[Error] DB 삽입 실패: {e}")
 
 if __name__ == '__main__':
-    insert_patterns_from_json()
\ No newline at end of file
+    insert_patterns_from_json()
@@ -0,0 +1,152 @@
+"""
+콜드 스타트 벤치마크.
+
+새 프로세스에서 다음을 반복 측정하고 중앙값을 보고합니다.
+- import_seconds: `import main`에 걸린 시간
+- ready_seconds: 서버 프로세스 시작부터 GET / 가 처음 응답할 때까지
+- first_response_seconds: 서버 준비 직후 첫 적응형 턴(/simulation/adaptive_turn) 응답 시간
+- max_rss_mb: 첫 응답까지의 최대 메모리 사용량 (Linux만)
+
+사용 예)
+  python scripts/startup_benchmark.py --runs 5
+  python scripts/startup_benchmark.py --max-import-seconds 1.0 --max-ready-seconds 3.0   # 초과 시 종료 코드 1
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+
+# 상대 경로 사용 (프로젝트 루트 기준)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_ADAPTIVE_TURN_BODY = {
+    "crime_type": "보이스피싱",
+    "dialogue_history": [
+        {"role": "agent", "text": "안녕하세요, 서울중앙지검 수사관입니다."},
+        {"role": "user", "text": "무슨 일 때문이죠?"},
+    ],
+    "highest_vulnerability_axis": "권위",
+    "user_info": {"user_name": "startup-bench"},
+}
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    # 별도 지정이 없으면 가짜 클라이언트로 측정합니다. (네트워크/쿼터와 무관한 순수 시작 비용)
+    env.setdefault("AI_BACKEND", "fake")
+    env.setdefault("LOG_ACCESS_SAMPLE_RATE", "0")
+    return env
+
+
+def measure_import(env: dict) -> float:
+    code = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _max_rss_mb(pid: int) -> float | None:
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+def _request(url: str, body: dict | None = None, timeout: float = 60.0) -> int:
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+        return response.status
+
+
+def measure_server(env: dict, ready_timeout: float) -> dict:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError("서버 프로세스가 시작 중 종료되었습니다.")
+            if time.perf_counter() - started > ready_timeout:
+                raise TimeoutError(f"{ready_timeout}초 안에 서버가 준비되지 않았습니다.")
+            try:
+                _request(f"{base_url}/", timeout=1.0)
+                break
+            except OSError:
+                time.sleep(0.02)
+        ready = time.perf_counter() - started
+
+        request_started = time.perf_counter()
+        _request(f"{base_url}/simulation/adaptive_turn", _ADAPTIVE_TURN_BODY)
+        first_response = time.perf_counter() - request_started
+        return {"ready_seconds": ready, "first_response_seconds": first_response, "max_rss_mb": _max_rss_mb(process.pid)}
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Safeguard AI Server 콜드 스타트 벤치마크")
+    parser.add_argument("--runs", type=int, default=3, help="반복 횟수 (중앙값 보고)")
+    parser.add_argument("--ready-timeout", type=float, default=60.0, help="서버 준비 대기 한도(초)")
+    parser.add_argument("--output", help="결과를 저장할 JSON 경로")
+    parser.add_argument("--max-import-seconds", type=float, help="import 시간 한도 (초과 시 종료 코드 1)")
+    parser.add_argument("--max-ready-seconds", type=float, help="서버 준비 시간 한도 (초과 시 종료 코드 1)")
+    args = parser.parse_args()
+
+    env = _env()
+    runs = []
+    for run in range(args.runs):
+        result = {"import_seconds": measure_import(env), **measure_server(env, args.ready_timeout)}
+        runs.append(result)
+        print(
+            f"[Startup] run {run + 1}: import={result['import_seconds']:.3f}s ready={result['ready_seconds']:.3f}s "
+            f"first_response={result['first_response_seconds']:.3f}s max_rss={result['max_rss_mb']}MB"
+        )
+
+    summary = {
+        key: round(statistics.median(run[key] for run in runs), 3)
+        for key in ("import_seconds", "ready_seconds", "first_response_seconds")
+    }
+    rss = [run["max_rss_mb"] for run in runs if run["max_rss_mb"] is not None]
+    summary["max_rss_mb"] = max(rss) if rss else None
+    summary["ai_backend"] = env["AI_BACKEND"]
+    print(f"[Startup] 중앙값: {json.dumps(summary, ensure_ascii=False)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "runs": runs}, f, ensure_ascii=False, indent=2)
+
+    failed = False
+    if args.max_import_seconds is not None and summary["import_seconds"] > args.max_import_seconds:
+        print(f"[Startup] import 시간 {summary['import_seconds']}s > 한도 {args.max_import_seconds}s")
+        failed = True
+    if args.max_ready_seconds is not None and summary["ready_seconds"] > args.max_ready_seconds:
+        print(f"[Startup] 준비 시간 {summary['ready_seconds']}s > 한도 {args.max_ready_seconds}s")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,424 @@
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import threading
+
+from google.api_core import exceptions as google_exceptions
+from google.cloud import vision
+
+# 이 모듈은 config.py가 클라이언트를 만들 때 사용하므로, config를 import하지 않고 설정값은 생성자로 받습니다.
+#
+# AI_BACKEND별 클라이언트
+# - fake:   지연 시간 분포/오류율을 설정할 수 있는 로컬 가짜 클라이언트 (부하 테스트용, 쿼터 소모 없음)
+# - record: 실제 클라이언트를 감싸 응답을 AI_RECORDINGS_DIR에 JSONL로 녹화
+# - replay: 녹화된 응답만 재생 (네트워크 없이 CI에서 성능 회귀 확인)
+
+# 스트리밍 적응형 턴의 대사/선택지 구분자 (gemini_service._OPTIONS_DELIMITER와 같아야 합니다)
+_OPTIONS_DELIMITER = "###OPTIONS###"
+
+_FAKE_SPEECH = "고객님, 지금 확인해보니 명의가 범죄에 연루되어 있습니다. 절차에 따라 바로 조치하셔야 피해를 막을 수 있습니다."
+_FAKE_OPTIONS = [
+    {"text": "전화를 끊고 직접 확인할게요", "verdict": "safe"},
+    {"text": "어떻게 하면 되나요?", "verdict": "risky"},
+    {"text": "알려주신 계좌로 보낼게요", "verdict": "unsafe"},
+]
+# 가짜 OCR 결과 (이미지 바이트 해시로 하나를 고르므로 같은 이미지는 항상 같은 텍스트)
+_FAKE_OCR_TEXTS = [
+    "[국외발신] 고객님 명의로 결제가 승인되었습니다. 본인이 아닐 경우 즉시 아래 링크로 취소 접수 바랍니다. http://bit.ly/xxxx",
+    "엄마 나 폰 액정 깨져서 임시폰이야. 급하게 상품권 결제할 게 있는데 카드 사진이랑 비밀번호 좀 보내줘",
+    "내일 저녁 7시에 강남역 2번 출구에서 만나. 늦으면 연락 줘!",
+    "임대차계약서 특약사항: 임대인은 잔금일 다음날까지 근저당권을 말소하기로 한다. 보증금은 임대인 지정 계좌로 입금한다.",
+]
+
+
+def _lognormal_seconds(median_ms: float, sigma: float) -> float:
+    return median_ms / 1000 * math.exp(random.gauss(0.0, sigma))
+
+
+def _request_key(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            digest.update(part)
+        else:
+            digest.update(json.dumps(part, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+def _generation_config_dict(generation_config) -> dict:
+    if generation_config is None:
+        return {}
+    if isinstance(generation_config, dict):
+        return generation_config
+    return {key: getattr(generation_config, key) for key in ("response_mime_type", "response_schema") if hasattr(generation_config, key)}
+
+
+# --- Gemini 응답 흉내 객체 ---
+class _FakeUsage:
+    def __init__(self, prompt_token_count: int = 0, candidates_token_count: int = 0, cached_content_token_count: int = 0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.cached_content_token_count = cached_content_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class _FakeChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _FakeResponse:
+    """generate_content_async 응답 (일반/스트리밍 공용). 스트리밍이면 async for로 청크를 내보냅니다."""
+
+    def __init__(self, chunks: list[str], usage: _FakeUsage, delays: list[float] | None = None):
+        self._chunks = chunks
+        self._delays = delays or [0.0] * len(chunks)
+        self.text = "".join(chunks)
+        self.usage_metadata = usage
+
+    async def __aiter__(self):
+        for chunk, delay in zip(self._chunks, self._delays):
+            if delay:
+                await asyncio.sleep(delay)
+            yield _FakeChunk(chunk)
+
+
+class _FakeTokenCount:
+    def __init__(self, total_tokens: int):
+        self.total_tokens = total_tokens
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 2)
+
+
+def _sample_from_schema(schema: dict):
+    """response_schema에 맞는 임의의 값을 만듭니다."""
+    if "enum" in schema:
+        return random.choice(schema["enum"])
+    kind = str(schema.get("type", "string")).lower()
+    if kind == "object":
+        return {name: _sample_from_schema(child) for name, child in schema.get("properties", {}).items()}
+    if kind == "array":
+        count = max(schema.get("min_items", 1), 1)
+        return [_sample_from_schema(schema.get("items", {})) for _ in range(count)]
+    if kind == "integer":
+        return 1
+    if kind == "number":
+        return 0.5
+    if kind == "boolean":
+        return False
+    return schema.get("description", "가짜 응답")[:40]
+
+
+def _split_chunks(text: str, count: int) -> list[str]:
+    size = max(1, math.ceil(len(text) / max(1, count)))
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+class FakeGenerativeModel:
+    """
+    genai.GenerativeModel 대역.
+    - 지연 시간은 중앙값 latency_ms, 로그 표준편차 sigma의 로그정규 분포를 따릅니다.
+    - error_rate 비율로 429(ResourceExhausted) / 503(ServiceUnavailable)을 냅니다.
+    - response_schema가 있으면 스키마에 맞는 JSON을, 없으면 대사 텍스트를 반환합니다.
+    """
+
+    def __init__(self, model_name: str, latency_ms: float, sigma: float, error_rate: float, stream_chunks: int):
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.stream_chunks = stream_chunks
+
+    def _fake_text(self, prompt: str, generation_config: dict) -> str:
+        schema = generation_config.get("response_schema")
+        if schema:
+            value = _sample_from_schema(schema)
+            if isinstance(value, dict) and "options" in value:
+                # 선택지는 safe/risky/unsafe를 하나씩 갖도록 고정합니다.
+                value["options"] = [dict(option) for option in _FAKE_OPTIONS]
+            return json.dumps(value, ensure_ascii=False)
+        if _OPTIONS_DELIMITER in prompt:
+            return f"{_FAKE_SPEECH}\n{_OPTIONS_DELIMITER}\n{json.dumps(_FAKE_OPTIONS, ensure_ascii=False)}"
+        return _FAKE_SPEECH
+
+    async def generate_content_async(self, prompt, stream: bool = False, generation_config=None, request_options=None, **kwargs):
+        prompt = prompt if isinstance(prompt, str) else str(prompt)
+        latency = _lognormal_seconds(self.latency_ms, self.sigma)
+        timeout = (request_options or {}).get("timeout")
+        if timeout is not None and latency > timeout:
+            await asyncio.sleep(timeout)
+            raise google_exceptions.DeadlineExceeded("가짜 Gemini 호출 시간 초과")
+        if random.random() < self.error_rate:
+            await asyncio.sleep(latency * random.random())
+            raise random.choice([google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable])("가짜 Gemini 오류")
+
+        text = self._fake_text(prompt, _generation_config_dict(generation_config))
+        usage = _FakeUsage(_estimate_tokens(prompt), _estimate_tokens(text))
+        if not stream:
+            await asyncio.sleep(latency)
+            return _FakeResponse([text], usage)
+        # 스트리밍: 전체 지연의 30%를 첫 청크까지, 나머지를 청크 사이에 고르게 나눕니다.
+        chunks = _split_chunks(text, self.stream_chunks)
+        first = latency * 0.3
+        rest = (latency - first) / max(1, len(chunks) - 1)
+        return _FakeResponse(chunks, usage, [first] + [rest] * (len(chunks) - 1))
+
+    async def count_tokens_async(self, contents, **kwargs):
+        return _FakeTokenCount(_estimate_tokens(contents if isinstance(contents, str) else str(contents)))
+
+
+class FakeImageAnnotatorClient:
+    """
+    vision.ImageAnnotatorClient 대역. (OCR 스레드풀에서 호출되므로 실제 클라이언트처럼 블로킹으로 대기합니다)
+    """
+
+    def __init__(self, latency_ms: float, sigma: float, error_rate: float):
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+
+    def _annotate(self, content: bytes) -> vision.AnnotateImageResponse:
+        if random.random() < self.error_rate:
+            return vision.AnnotateImageResponse(error={"code": 14, "message": "가짜 Vision 오류"})
+        text = _FAKE_OCR_TEXTS[int(hashlib.sha256(content).hexdigest(), 16) % len(_FAKE_OCR_TEXTS)]
+        return vision.AnnotateImageResponse(full_text_annotation={"text": text})
+
+    def text_detection(self, image, **kwargs):
+        time.sleep(_lognormal_seconds(self.latency_ms, self.sigma))
+        return self._annotate(image.content)
+
+    def batch_annotate_images(self, requests, **kwargs):
+        # 배치는 한 번의 왕복이므로 이미지 수에 비례해 조금씩만 늘어납니다.
+        time.sleep(_lognormal_seconds(self.latency_ms, self.sigma) * (1 + 0.1 * len(requests)))
+        return vision.BatchAnnotateImagesResponse(responses=[self._annotate(request.image.content) for request in requests])
+
+
+# --- 녹화 / 재생 ---
+class _RecordingStore:
+    """키 -> 응답 레코드를 JSONL 파일 하나에 추가 기록하고, 재생 시 메모리로 읽어 들입니다."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, key: str, record: dict) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        line = json.dumps({"key": key, **record}, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def load(self) -> dict[str, dict]:
+        records = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        records[record.pop("key")] = record
+        return records
+
+
+class ReplayMissError(LookupError):
+    """재생 모드에서 녹화되지 않은 요청이 들어온 경우"""
+
+
+def _gemini_key(prompt, stream: bool, generation_config) -> str:
+    # 라우터가 Pro/Flash 중 어느 모델로 보내든(강등·헤지) 같은 녹화를 재생하도록 모델명은 키에서 제외합니다.
+    config = _generation_config_dict(generation_config)
+    return _request_key(str(prompt), stream, config.get("response_mime_type"), config.get("response_schema"))
+
+
+# KeyedGenerativeModel이 사용하는 SDK의 공개 API (모듈 경로, 이름). SDK가 바뀌어 하나라도 없으면 시작 시 바로 실패합니다.
+_KEYED_MODEL_SDK_API = [
+    ("google.ai.generativelanguage", "GenerativeServiceAsyncClient"),
+    ("google.ai.generativelanguage", "GenerateContentRequest"),
+    ("google.ai.generativelanguage", "CountTokensRequest"),
+    ("google.generativeai.types.content_types", "to_contents"),
+    ("google.generativeai.types.generation_types", "to_generation_config_dict"),
+    ("google.generativeai.types.generation_types", "AsyncGenerateContentResponse"),
+]
+
+
+def check_keyed_model_sdk() -> None:
+    """KeyedGenerativeModel에 필요한 SDK 공개 API가 모두 있는지 확인합니다. (Docker 빌드 시 스모크 체크로도 실행)"""
+    import importlib
+    missing = []
+    for module_name, attribute in _KEYED_MODEL_SDK_API:
+        try:
+            if not hasattr(importlib.import_module(module_name), attribute):
+                missing.append(f"{module_name}.{attribute}")
+        except ImportError:
+            missing.append(f"{module_name}.{attribute}")
+    response_type = None if missing else importlib.import_module("google.generativeai.types.generation_types").AsyncGenerateContentResponse
+    for method in ("from_response", "from_aiterator"):
+        if response_type is not None and not hasattr(response_type, method):
+            missing.append(f"AsyncGenerateContentResponse.{method}")
+    if missing:
+        raise RuntimeError(f"설치된 Gemini SDK에 키별 클라이언트에 필요한 API가 없습니다: {', '.join(missing)} (requirements.txt의 버전 고정 확인)")
+
+
+class KeyedGenerativeModel:
+    """
+    API 키 하나 전용의 GenerativeModel 대역. (GOOGLE_API_KEYS가 여러 개일 때 키마다 하나씩)
+    전역 설정(genai.configure)을 쓰지 않고, google.ai.generativelanguage의 공개 클라이언트를 키별 client_options로 만들어 호출합니다.
+    요청/응답 변환은 SDK의 공개 함수(content_types, generation_types)를 사용하므로 GenerativeModel과 같은 응답 객체를 돌려줍니다.
+    (비동기 gRPC 클라이언트는 이벤트 루프 안에서 만들어야 하므로 첫 호출 때 만듭니다)
+    """
+
+    def __init__(self, model_name: str, api_key: str):
+        check_keyed_model_sdk()
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        self._api_key = api_key
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            from google.ai import generativelanguage as glm
+            self._client = glm.GenerativeServiceAsyncClient(client_options={"api_key": self._api_key})
+        return self._client
+
+    async def generate_content_async(self, prompt, stream: bool = False, generation_config=None, request_options=None):
+        from google.ai import generativelanguage as glm
+        from google.generativeai.types import content_types, generation_types
+        request = glm.GenerateContentRequest(
+            model=self.model_name,
+            contents=content_types.to_contents(prompt),
+            generation_config=generation_types.to_generation_config_dict(generation_config or {}),
+        )
+        client = self._get_client()
+        if stream:
+            iterator = await client.stream_generate_content(request, **(request_options or {}))
+            return await generation_types.AsyncGenerateContentResponse.from_aiterator(iterator)
+        response = await client.generate_content(request, **(request_options or {}))
+        return generation_types.AsyncGenerateContentResponse.from_response(response)
+
+    async def count_tokens_async(self, contents, request_options=None):
+        from google.ai import generativelanguage as glm
+        from google.generativeai.types import content_types
+        request = glm.CountTokensRequest(model=self.model_name, contents=content_types.to_contents(contents))
+        return await self._get_client().count_tokens(request, **(request_options or {}))
+
+
+class RecordingGenerativeModel:
+    """실제 GenerativeModel을 감싸 응답 텍스트/스트리밍 청크/토큰 사용량을 녹화합니다."""
+
+    def __init__(self, model, recordings_dir: str):
+        self._model = model
+        self.model_name = model.model_name
+        self._store = _RecordingStore(os.path.join(recordings_dir, "gemini.jsonl"))
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    async def generate_content_async(self, prompt, stream: bool = False, generation_config=None, **kwargs):
+        key = _gemini_key(prompt, stream, generation_config)
+        started = time.monotonic()
+        response = await self._model.generate_content_async(prompt, stream=stream, generation_config=generation_config, **kwargs)
+        if not stream:
+            self._record(key, [response.text], response, time.monotonic() - started)
+            return response
+        return self._recording_stream(key, response, started)
+
+    async def _recording_stream(self, key: str, response, started: float):
+        chunks = []
+        async for chunk in response:
+            try:
+                chunks.append(chunk.text)
+            except ValueError:
+                pass
+            yield chunk
+        self._record(key, chunks, response, time.monotonic() - started)
+
+    def _record(self, key: str, chunks: list[str], response, elapsed: float) -> None:
+        usage = getattr(response, "usage_metadata", None)
+        self._store.append(key, {
+            "model": self.model_name,
+            "chunks": chunks,
+            "latency_seconds": round(elapsed, 4),
+            "usage": {
+                "prompt_token_count": getattr(usage, "prompt_token_count", 0) or 0,
+                "candidates_token_count": getattr(usage, "candidates_token_count", 0) or 0,
+                "cached_content_token_count": getattr(usage, "cached_content_token_count", 0) or 0,
+            },
+        })
+
+
+class ReplayGenerativeModel:
+    """
+    녹화된 응답을 재생하는 GenerativeModel 대역.
+    replay_latency가 True면 녹화 당시의 지연 시간을 그대로 재현합니다.
+    """
+
+    def __init__(self, model_name: str, recordings_dir: str, replay_latency: bool):
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        self.replay_latency = replay_latency
+        self._records = _RecordingStore(os.path.join(recordings_dir, "gemini.jsonl")).load()
+
+    async def generate_content_async(self, prompt, stream: bool = False, generation_config=None, **kwargs):
+        key = _gemini_key(prompt, stream, generation_config)
+        record = self._records.get(key)
+        if record is None:
+            raise ReplayMissError(f"녹화되지 않은 Gemini 요청입니다. ({self.model_name}, key={key[:12]})")
+        chunks = record["chunks"] or [""]
+        latency = record.get("latency_seconds", 0.0) if self.replay_latency else 0.0
+        usage = _FakeUsage(**record.get("usage", {}))
+        if not stream:
+            await asyncio.sleep(latency)
+            return _FakeResponse(chunks, usage)
+        return _FakeResponse(chunks, usage, [latency / len(chunks)] * len(chunks))
+
+    async def count_tokens_async(self, contents, **kwargs):
+        return _FakeTokenCount(_estimate_tokens(contents if isinstance(contents, str) else str(contents)))
+
+
+class RecordingImageAnnotatorClient:
+    """실제 ImageAnnotatorClient를 감싸 이미지별 OCR 결과를 녹화합니다."""
+
+    def __init__(self, client, recordings_dir: str):
+        self._client = client
+        self._store = _RecordingStore(os.path.join(recordings_dir, "vision.jsonl"))
+
+    def _record(self, content: bytes, response) -> None:
+        self._store.append(_request_key(content), {
+            "text": response.full_text_annotation.text if response.full_text_annotation else "",
+            "error": response.error.message,
+        })
+
+    def text_detection(self, image, **kwargs):
+        response = self._client.text_detection(image=image, **kwargs)
+        self._record(image.content, response)
+        return response
+
+    def batch_annotate_images(self, requests, **kwargs):
+        batch = self._client.batch_annotate_images(requests=requests, **kwargs)
+        for request, response in zip(requests, batch.responses):
+            self._record(request.image.content, response)
+        return batch
+
+
+class ReplayImageAnnotatorClient:
+    """녹화된 OCR 결과를 재생하는 ImageAnnotatorClient 대역."""
+
+    def __init__(self, recordings_dir: str):
+        self._records = _RecordingStore(os.path.join(recordings_dir, "vision.jsonl")).load()
+
+    def _annotate(self, content: bytes) -> vision.AnnotateImageResponse:
+        record = self._records.get(_request_key(content))
+        if record is None:
+            return vision.AnnotateImageResponse(error={"code": 5, "message": "녹화되지 않은 이미지입니다."})
+        if record.get("error"):
+            return vision.AnnotateImageResponse(error={"code": 13, "message": record["error"]})
+        return vision.AnnotateImageResponse(full_text_annotation={"text": record["text"]})
+
+    def text_detection(self, image, **kwargs):
+        return self._annotate(image.content)
+
+    def batch_annotate_images(self, requests, **kwargs):
+        return vision.BatchAnnotateImagesResponse(responses=[self._annotate(request.image.content) for request in requests])
@@ -0,0 +1,385 @@
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import sqlite3
+import threading
+from collections import deque
+
+from config import (
+    BATCH_DB_PATH, BATCH_WORKERS, BATCH_MAX_CALLS_PER_MINUTE, BATCH_MAX_ATTEMPTS,
+    BATCH_LEASE_SECONDS, BATCH_POLL_SECONDS, BATCH_RETENTION_SECONDS
+)
+from models import DialogueHistoryEntry
+from services import report_service
+from services.gemini_scheduler import OverloadedError, background_priority
+from services.log_service import get_logger
+
+_LOG = get_logger("batch")
+
+# 리포트 종류별 생성 함수 (배치 작업의 각 항목은 세션 하나 x 리포트 종류 하나)
+# 같은 세션의 기본/프리미엄 항목은 리포트 엔진에서 하나의 분석 결과를 공유합니다.
+_REPORT_GENERATORS = {
+    "basic": report_service.basic_report,
+    "premium": report_service.premium_report,
+}
+
+# 실패한 항목을 다시 시도하기 전 대기 시간 (초, 시도 횟수에 따라 2배씩 증가 + 지터)
+_RETRY_BASE_SECONDS = 5.0
+
+
+class BatchJobStore:
+    """
+    배치 작업과 항목 상태를 저장하는 SQLite 저장소.
+    - 모든 메서드는 블로킹 SQLite 호출이므로 이벤트 루프에서는 asyncio.to_thread로 실행합니다.
+    - 항목은 점유(lease) 방식으로 가져가므로, 같은 파일을 쓰는 여러 워커 프로세스가 중복 없이 나눠 처리합니다.
+    - 점유 시간이 지난 '처리 중' 항목(프로세스 종료 등)은 다시 가져갈 수 있는 상태로 취급됩니다.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 여러 구문을 하나의 트랜잭션으로 묶기 위해 자동 커밋 모드에서 BEGIN을 직접 사용합니다.
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+        CREATE TABLE IF NOT EXISTS batch_jobs (
+            job_id TEXT PRIMARY KEY,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            total INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS batch_items (
+            job_id TEXT NOT NULL,
+            item_index INTEGER NOT NULL,
+            session_id TEXT,
+            report_type TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,            -- queued | running | completed | failed
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at REAL NOT NULL,      -- queued: 재시도 대기 후 처리 가능 시각 / running: 점유 만료 시각
+            result TEXT,
+            error TEXT,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (job_id, item_index)
+        );
+        CREATE INDEX IF NOT EXISTS idx_batch_items_claim ON batch_items (status, available_at);
+        """)
+
+    def create_job(self, sessions: list[dict], report_types: list[str]) -> dict:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        rows = []
+        for session in sessions:
+            payload = json.dumps(
+                {"crime_type": session["crime_type"], "dialogue_history": session["dialogue_history"]},
+                ensure_ascii=False
+            )
+            for report_type in report_types:
+                rows.append((job_id, len(rows), session.get("session_id"), report_type, payload, "queued", now, now))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO batch_jobs (job_id, created_at, updated_at, total) VALUES (?, ?, ?, ?)",
+                    (job_id, now, now, len(rows))
+                )
+                self._conn.executemany(
+                    "INSERT INTO batch_items (job_id, item_index, session_id, report_type, payload, status, available_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {"job_id": job_id, "total": len(rows)}
+
+    def claim(self) -> dict | None:
+        """처리할 항목 하나를 점유하여 반환합니다. (대기 중이거나 점유가 만료된 항목, 먼저 들어온 작업 우선)"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                """
+                UPDATE batch_items
+                SET status = 'running', attempts = attempts + 1, available_at = ?, updated_at = ?
+                WHERE rowid = (
+                    SELECT rowid FROM batch_items
+                    WHERE status IN ('queued', 'running') AND available_at <= ?
+                    ORDER BY available_at LIMIT 1
+                )
+                RETURNING job_id, item_index, report_type, payload, attempts
+                """,
+                (now + BATCH_LEASE_SECONDS, now, now)
+            ).fetchone()
+        if row is None:
+            return None
+        job_id, item_index, report_type, payload, attempts = row
+        return {"job_id": job_id, "item_index": item_index, "report_type": report_type,
+                "payload": json.loads(payload), "attempts": attempts}
+
+    def complete(self, item: dict, result: dict) -> None:
+        self._finish(item, "completed", result, None)
+
+    def fail(self, item: dict, error: str, result: dict | None = None) -> None:
+        self._finish(item, "failed", result, error)
+
+    def retry_later(self, item: dict, error: str, delay: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE batch_items SET status = 'queued', available_at = ?, error = ?, updated_at = ? "
+                "WHERE job_id = ? AND item_index = ?",
+                (now + delay, error, now, item["job_id"], item["item_index"])
+            )
+
+    def release(self, item: dict, delay: float = 0.0) -> None:
+        """처리를 끝내지 못한 항목(서버 종료, 과부하 등)을 시도 횟수에 포함하지 않고 대기열로 돌려놓습니다."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE batch_items SET status = 'queued', attempts = attempts - 1, available_at = ?, updated_at = ? "
+                "WHERE job_id = ? AND item_index = ? AND status = 'running'",
+                (now + delay, now, item["job_id"], item["item_index"])
+            )
+
+    def get_job(self, job_id: str) -> dict | None:
+        with self._lock:
+            job = self._conn.execute(
+                "SELECT created_at, updated_at, total FROM batch_jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            items = self._conn.execute(
+                "SELECT item_index, session_id, report_type, status, attempts, result, error "
+                "FROM batch_items WHERE job_id = ? ORDER BY item_index",
+                (job_id,)
+            ).fetchall()
+        created_at, updated_at, total = job
+
+        counts = {"queued": 0, "running": 0, "completed": 0, "failed": 0}
+        results = []
+        for item_index, session_id, report_type, status, attempts, result, error in items:
+            counts[status] += 1
+            results.append({
+                "index": item_index,
+                "session_id": session_id,
+                "report_type": report_type,
+                "status": status,
+                "attempts": attempts,
+                "result": json.loads(result) if result else None,
+                "error": error if status != "completed" else None,
+            })
+        done = counts["completed"] + counts["failed"]
+        if done == total:
+            status = "completed"
+        elif done or counts["running"]:
+            status = "running"
+        else:
+            status = "queued"
+        return {
+            "job_id": job_id,
+            "status": status,
+            "total": total,
+            **counts,
+            "progress": round(done / total, 4) if total else 1.0,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "results": results,
+        }
+
+    def purge_expired(self, retention_seconds: float) -> int:
+        """보관 기간이 지난 작업을 삭제하고 삭제한 작업 수를 반환합니다."""
+        cutoff = time.time() - retention_seconds
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM batch_items WHERE job_id IN (SELECT job_id FROM batch_jobs WHERE updated_at < ?)", (cutoff,)
+                )
+                deleted = self._conn.execute("DELETE FROM batch_jobs WHERE updated_at < ?", (cutoff,)).rowcount
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+        return deleted
+
+    # --- 내부 구현 ---
+    def _finish(self, item: dict, status: str, result: dict | None, error: str | None) -> None:
+        now = time.time()
+        raw = json.dumps(result, ensure_ascii=False) if result is not None else None
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE batch_items SET status = ?, result = ?, error = ?, updated_at = ? "
+                    "WHERE job_id = ? AND item_index = ?",
+                    (status, raw, error, now, item["job_id"], item["item_index"])
+                )
+                self._conn.execute("UPDATE batch_jobs SET updated_at = ? WHERE job_id = ?", (now, item["job_id"]))
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+class _RateLimiter:
+    """최근 1분간 호출 수가 한도를 넘지 않도록, 자리가 날 때까지 기다리게 하는 제한기."""
+
+    def __init__(self, max_calls_per_minute: int):
+        self.max_calls = max_calls_per_minute
+        self._call_times: deque[float] = deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._call_times and self._call_times[0] <= now - 60:
+                    self._call_times.popleft()
+                if len(self._call_times) < self.max_calls:
+                    self._call_times.append(now)
+                    return
+                await asyncio.sleep(self._call_times[0] + 60 - now)
+
+
+_STORE: BatchJobStore | None = None
+_LIMITER = _RateLimiter(BATCH_MAX_CALLS_PER_MINUTE)
+_WORKERS: list[asyncio.Task] = []
+_WAKE = asyncio.Event()
+
+_STATS = {
+    "processed": 0,        # 처리를 마친 항목 수 (성공)
+    "failed": 0,           # 재시도 끝에 실패로 기록된 항목 수
+    "retried": 0,          # 재시도 대기열로 돌려보낸 횟수
+    "deferred": 0,         # Gemini 과부하로 시도 횟수에 넣지 않고 미룬 횟수
+    "errors": 0,           # 워커에서 예상하지 못한 오류가 난 횟수 (항목은 실패로 기록)
+}
+
+
+def _get_store() -> BatchJobStore:
+    global _STORE
+    if _STORE is None:
+        _STORE = BatchJobStore(BATCH_DB_PATH)
+    return _STORE
+
+
+async def submit(sessions: list[dict], report_types: list[str]) -> dict:
+    """세션 목록 x 리포트 종류만큼의 항목을 가진 작업을 만들고 작업 id를 반환합니다."""
+    job = await asyncio.to_thread(_get_store().create_job, sessions, report_types)
+    _WAKE.set()
+    _LOG.info("배치 작업 접수", job_id=job["job_id"], sessions=len(sessions), items=job["total"])
+    return job
+
+
+async def get_job(job_id: str) -> dict | None:
+    """작업의 진행 상황과 (완료된 항목까지의) 부분 결과를 반환합니다."""
+    return await asyncio.to_thread(_get_store().get_job, job_id)
+
+
+async def _process(item: dict) -> None:
+    store = _get_store()
+    payload = item["payload"]
+    try:
+        history_list = [DialogueHistoryEntry(**entry) for entry in payload["dialogue_history"]]
+        generate = _REPORT_GENERATORS[item["report_type"]]
+        crime_type = payload["crime_type"]
+    except Exception as e:
+        # 저장된 항목 자체가 잘못된 경우는 다시 시도해도 같으므로 바로 실패로 기록합니다.
+        await asyncio.to_thread(store.fail, item, f"잘못된 항목: {e}")
+        _STATS["failed"] += 1
+        _LOG.warning("배치 항목 형식 오류", job_id=item["job_id"], index=item["item_index"], error=str(e))
+        return
+
+    await _LIMITER.acquire()
+    try:
+        # 배치 작업은 실시간 요청보다 항상 뒤에 처리되도록 가장 낮은 우선순위로 실행합니다.
+        with background_priority():
+            result = await generate(history_list=history_list, crime_type=crime_type)
+        # 리포트 생성 함수는 실패 시에도 기본 등급을 채운 응답(error 포함)을 반환합니다.
+        error = result.get("error")
+    except OverloadedError as e:
+        # 쿼터가 찬 것은 항목의 실패가 아니므로 시도 횟수에 넣지 않고 권장 시각 이후에 다시 처리합니다.
+        await asyncio.to_thread(store.release, item, e.retry_after)
+        _STATS["deferred"] += 1
+        return
+    except Exception as e:
+        result, error = None, str(e)
+
+    if error is None:
+        await asyncio.to_thread(store.complete, item, result)
+        _STATS["processed"] += 1
+    elif item["attempts"] < BATCH_MAX_ATTEMPTS:
+        delay = _RETRY_BASE_SECONDS * 2 ** (item["attempts"] - 1) * random.uniform(0.5, 1.5)
+        await asyncio.to_thread(store.retry_later, item, error, delay)
+        _STATS["retried"] += 1
+    else:
+        await asyncio.to_thread(store.fail, item, error, result)
+        _STATS["failed"] += 1
+        _LOG.warning("배치 항목 실패", job_id=item["job_id"], index=item["item_index"], attempts=item["attempts"], error=error)
+
+
+async def _worker() -> None:
+    store = _get_store()
+    while True:
+        try:
+            item = await asyncio.to_thread(store.claim)
+        except sqlite3.Error as e:
+            _LOG.warning("배치 항목 조회 실패", error=str(e))
+            item = None
+        if item is None:
+            # 새 작업이 들어오면 바로 깨어나고, 아니면 재시도 대기/다른 워커의 점유 만료를 주기적으로 확인합니다.
+            _WAKE.clear()
+            try:
+                await asyncio.wait_for(_WAKE.wait(), timeout=BATCH_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            await _process(item)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(store.release, item)
+            raise
+        except sqlite3.Error as e:
+            # 결과 저장에 실패한 항목은 점유가 만료된 뒤 다시 처리됩니다.
+            _LOG.warning("배치 결과 저장 실패", job_id=item["job_id"], index=item["item_index"], error=str(e))
+        except Exception as e:
+            # 그 밖의 오류(결과 직렬화 실패 등)로 워커가 멈추지 않도록, 항목을 실패로 기록하고 다음 항목으로 넘어갑니다.
+            _STATS["errors"] += 1
+            _LOG.error("배치 항목 처리 오류", job_id=item["job_id"], index=item["item_index"], error=repr(e))
+            try:
+                await asyncio.to_thread(store.fail, item, f"처리 오류: {e!r}")
+                _STATS["failed"] += 1
+            except Exception as fail_error:
+                # 기록하지 못한 항목은 점유가 만료된 뒤 다시 처리됩니다.
+                _LOG.warning("배치 항목 실패 기록 실패", job_id=item["job_id"], index=item["item_index"], error=str(fail_error))
+
+
+def start() -> None:
+    """(서버 시작 시) 보관 기간이 지난 작업을 정리하고 워커를 띄웁니다. 이전에 남은 항목도 이어서 처리합니다."""
+    try:
+        purged = _get_store().purge_expired(BATCH_RETENTION_SECONDS)
+    except sqlite3.Error as e:
+        _LOG.warning("배치 작업 저장소를 열 수 없어 배치 처리를 시작하지 않습니다", db_path=BATCH_DB_PATH, error=str(e))
+        return
+    if purged:
+        _LOG.info("만료된 배치 작업 정리", jobs=purged)
+    _WORKERS.extend(asyncio.create_task(_worker()) for _ in range(BATCH_WORKERS))
+
+
+async def stop() -> None:
+    """(서버 종료 시) 워커를 멈추고, 처리 중이던 항목은 대기열로 돌려놓습니다."""
+    for task in _WORKERS:
+        task.cancel()
+    await asyncio.gather(*_WORKERS, return_exceptions=True)
+    _WORKERS.clear()
+
+
+def batch_stats() -> dict:
+    return {**_STATS, "workers": len(_WORKERS), "max_calls_per_minute": BATCH_MAX_CALLS_PER_MINUTE}
@@ -0,0 +1,196 @@
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_DB_PATH
+from services.log_service import get_logger
+
+_LOG = get_logger("cache")
+
+# --- 텍스트 정규화 규칙 ---
+# 같은 스미싱 문자가 URL/번호만 바뀌어 반복되는 경우가 많으므로,
+# 공백·URL·숫자를 표준형으로 바꾼 뒤 해시합니다.
+_URL_RE = re.compile(r"(https?://|www\.)\S+|\b[\w-]+\.(?:com|net|org|kr|ly|me|io|co|xyz|top)(?:/\S*)?", re.IGNORECASE)
+_DIGIT_RE = re.compile(r"\d+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def hash_bytes(content: bytes) -> str:
+    """이미지 바이트의 내용 기반 키 (1단계 캐시용)"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    """공백, URL, 숫자를 표준형으로 바꾼 텍스트를 반환합니다."""
+    text = _URL_RE.sub("<URL>", text)
+    text = _DIGIT_RE.sub("0", text)
+    return _SPACE_RE.sub(" ", text).strip().lower()
+
+
+def hash_text(text: str) -> str:
+    """정규화된 텍스트의 내용 기반 키 (2단계 캐시용)"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    LRU + TTL 메모리 캐시와, 선택적인 SQLite 영속 계층으로 구성된 결과 캐시.
+    - 값은 JSON으로 직렬화하여 보관하므로, 호출자가 반환값을 수정해도 캐시가 오염되지 않습니다.
+    - db_path를 지정하면 같은 파일을 공유하는 모든 uvicorn 워커가 결과를 함께 사용합니다.
+    - 비동기 코드에서는 aget/aset을 사용합니다. 메모리 계층은 바로 확인하고, SQLite 계층(다른 워커가 쓰기 잠금을 잡고 있으면
+      최대 5초 대기)은 스레드에서 실행하므로 이벤트 루프를 막지 않습니다.
+    """
+
+    def __init__(self, namespace: str, max_entries: int, ttl_seconds: float, db_path: str | None = None):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()       # 메모리 계층 (짧게만 잡음)
+        self._db_lock = threading.Lock()    # SQLite 연결 (느린 IO가 메모리 조회를 막지 않도록 분리)
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+        self._conn = None
+        self._writes = 0
+        if db_path:
+            try:
+                self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    namespace TEXT NOT NULL,
+                    cache_key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, cache_key)
+                )
+                """)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                _LOG.warning("영속 캐시 초기화 실패, 메모리 캐시만 사용합니다", db_path=db_path, error=str(e))
+                self._conn = None
+
+    def get(self, key: str):
+        """(동기 코드/스레드용) 메모리 계층, 없으면 영속 계층에서 찾습니다."""
+        now = time.time()
+        raw = self._get_memory(key, now)
+        if raw is not None:
+            return json.loads(raw)
+        return self._after_persistent(key, self._get_persistent(key, now), now)
+
+    async def aget(self, key: str):
+        """get()의 비동기 버전 (영속 계층 조회는 스레드에서 실행)"""
+        now = time.time()
+        raw = self._get_memory(key, now)
+        if raw is not None:
+            return json.loads(raw)
+        if self._conn is None:
+            return self._after_persistent(key, None, now)
+        return self._after_persistent(key, await asyncio.to_thread(self._get_persistent, key, now), now)
+
+    def set(self, key: str, value) -> None:
+        """(동기 코드/스레드용) 메모리와 영속 계층에 저장합니다."""
+        raw, expires_at = self._set_memory(key, value)
+        self._set_persistent(key, raw, expires_at)
+
+    async def aset(self, key: str, value) -> None:
+        """set()의 비동기 버전 (영속 계층 저장은 스레드에서 실행)"""
+        raw, expires_at = self._set_memory(key, value)
+        if self._conn is not None:
+            await asyncio.to_thread(self._set_persistent, key, raw, expires_at)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.persistent_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.persistent_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+    # --- 내부 구현 ---
+    def _get_memory(self, key: str, now: float) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, raw = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return raw
+            del self._entries[key]
+            return None
+
+    def _after_persistent(self, key: str, raw: str | None, now: float):
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+                return None
+            self.persistent_hits += 1
+            self._put_memory(key, raw, now + self.ttl_seconds)
+        return json.loads(raw)
+
+    def _set_memory(self, key: str, value) -> tuple[str, float]:
+        raw = json.dumps(value, ensure_ascii=False)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._put_memory(key, raw, expires_at)
+        return raw, expires_at
+
+    def _put_memory(self, key: str, raw: str, expires_at: float) -> None:
+        self._entries[key] = (expires_at, raw)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_persistent(self, key: str, now: float) -> str | None:
+        if self._conn is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._conn.execute(
+                    "SELECT value FROM result_cache WHERE namespace = ? AND cache_key = ? AND expires_at > ?",
+                    (self.namespace, key, now)
+                ).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            _LOG.warning("영속 캐시 조회 실패", error=str(e))
+            return None
+
+    def _set_persistent(self, key: str, raw: str, expires_at: float) -> None:
+        if self._conn is None:
+            return
+        try:
+            with self._db_lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO result_cache (namespace, cache_key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.namespace, key, raw, expires_at)
+                )
+                # 만료된 항목은 일정 횟수의 쓰기마다 함께 정리합니다.
+                self._writes += 1
+                if self._writes % 256 == 0:
+                    self._conn.execute("DELETE FROM result_cache WHERE expires_at <= ?", (time.time(),))
+                self._conn.commit()
+        except sqlite3.Error as e:
+            _LOG.warning("영속 캐시 저장 실패", error=str(e))
+
+
+# --- 캐시 인스턴스 ---
+# 1단계: 이미지 바이트 해시 -> OCR 텍스트
+OCR_CACHE = ResultCache("ocr", RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_DB_PATH)
+# 2단계: 정규화된 텍스트 해시 -> 위험도 진단 결과
+DIAGNOSIS_CACHE = ResultCache("diagnosis", RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_DB_PATH)
+
+
+def cache_stats() -> dict:
+    return {"ocr": OCR_CACHE.stats(), "diagnosis": DIAGNOSIS_CACHE.stats()}
@@ -0,0 +1,298 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+from config import (
+    CONTEXT_RECENT_TURNS, CONTEXT_SUMMARY_CHUNK_TURNS, CONTEXT_SUMMARY_CACHE_SIZE,
+    CONTEXT_TOKEN_BUDGETS
+)
+from models import DialogueHistoryEntry
+from services.log_service import get_logger
+
+_LOG = get_logger("context")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    로컬 토큰 수 추정치. (API 호출 없이 예산 계산에만 사용)
+    영문/숫자는 약 4자당 1토큰, 한글 등 비ASCII 문자는 약 1.5자당 1토큰으로 계산합니다.
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    other_chars = len(text) - ascii_chars
+    return int(ascii_chars / 4 + other_chars / 1.5) + 1
+
+
+def _format_turns(turns: list[DialogueHistoryEntry]) -> list[str]:
+    return [f"{entry.role}: {entry.text}" for entry in turns]
+
+
+def _prefix_hash(turns: list[DialogueHistoryEntry]) -> str:
+    digest = hashlib.sha256()
+    for entry in turns:
+        digest.update(entry.role.encode("utf-8"))
+        digest.update(b"\x1f")
+        digest.update(entry.text.encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+class ContextWindow:
+    """
+    대화 기록을 토큰 예산 안의 프롬프트 문자열로 만드는 컨텍스트 관리자.
+    - 최근 N턴은 그대로 유지하고, 그 이전 턴은 누적 요약으로 압축합니다.
+    - 요약은 CHUNK 턴 단위의 접두(prefix) 해시로 메모이즈되므로, 매 턴마다
+      '직전 요약 + 새 CHUNK 턴'만 요약하면 됩니다.
+    - 요약이 아직 준비되지 않았으면 응답을 기다리지 않고 백그라운드에서 만들어 두고,
+      이번 호출은 가장 긴 기존 요약 + 원문 턴으로 구성합니다.
+    """
+
+    def __init__(self, summarize, recent_turns: int, chunk_turns: int, cache_size: int, budgets: dict[str, int]):
+        # summarize: async (previous_summary: str, turns: list[DialogueHistoryEntry]) -> str
+        self._summarize = summarize
+        self.recent_turns = recent_turns
+        self.chunk_turns = max(1, chunk_turns)
+        self.cache_size = cache_size
+        self.budgets = budgets
+        self._summaries: OrderedDict[str, str] = OrderedDict()
+        self._pending: dict[str, asyncio.Task] = {}
+
+    def render(self, history_list: list[DialogueHistoryEntry], endpoint: str) -> str:
+        """엔드포인트별 토큰 예산에 맞춘 대화 기록 문자열을 반환합니다."""
+        budget = self.budgets.get(endpoint)
+        older_count = max(0, len(history_list) - self.recent_turns)
+        summarized_count = older_count - older_count % self.chunk_turns
+
+        summary, covered = "", 0
+        if summarized_count:
+            summary, covered = self._best_summary(history_list, summarized_count)
+
+        lines = _format_turns(history_list[covered:])
+        return self._fit(summary, lines, [estimate_tokens(line) for line in lines], budget)
+
+    def render_verbatim(self, history_list: list[DialogueHistoryEntry], endpoint: str) -> str:
+        """
+        요약 없이 원문 턴만으로 엔드포인트별 토큰 예산에 맞춘 대화 기록 문자열을 반환합니다.
+        (리포트처럼 사용자 발화를 그대로 인용/평가해야 하는 엔드포인트용: 요약은 사용자 대사를 바꿔 말할 수 있음)
+        예산을 넘으면 오래된 AI 대사부터 빼고, 그래도 넘으면 오래된 사용자 대사를 뺍니다. (마지막 턴은 유지)
+        """
+        lines = _format_turns(history_list)
+        budget = self.budgets.get(endpoint)
+        if budget is None:
+            return self._join("", lines)
+        line_tokens = [estimate_tokens(line) for line in lines]
+        used = sum(line_tokens)
+        kept = [True] * len(lines)
+        for drop_users in (False, True):
+            for i, entry in enumerate(history_list[:-1]):
+                if used <= budget:
+                    break
+                if kept[i] and (entry.role == "user") == drop_users:
+                    kept[i] = False
+                    used -= line_tokens[i]
+        kept_lines = [line for line, keep in zip(lines, kept) if keep]
+        if len(kept_lines) < len(lines):
+            kept_lines.insert(0, "(예산 초과로 이전 대화 일부 생략)")
+        return self._join("", kept_lines)
+
+    def session(self, max_retained_turns: int) -> "SessionContext":
+        """대화 상태를 서버가 보관하는 세션용 증분 컨텍스트를 만듭니다. (요약은 이 창의 캐시와 공유)"""
+        return SessionContext(self, max_retained_turns)
+
+    def stats(self) -> dict:
+        return {"cached_summaries": len(self._summaries), "pending_summaries": len(self._pending)}
+
+    # --- 내부 구현 ---
+    def _fit(self, summary: str, lines: list[str], line_tokens: list[int], budget: int | None) -> str:
+        if budget is None:
+            return self._join(summary, lines)
+        # 예산을 넘으면 오래된 원문 턴부터 버리고(마지막 턴은 유지), 그래도 넘으면 요약을 자릅니다.
+        summary_tokens = estimate_tokens(summary)
+        used = summary_tokens + sum(line_tokens)
+        start = 0
+        while used > budget and len(lines) - start > 1:
+            used -= line_tokens[start]
+            start += 1
+        if used > budget and summary:
+            remaining = max(0, budget - (used - summary_tokens))
+            summary = summary[:int(remaining * 1.5)]
+        return self._join(summary, lines[start:])
+
+    def _remember(self, key: str, summary: str) -> None:
+        self._summaries[key] = summary
+        self._summaries.move_to_end(key)
+        while len(self._summaries) > self.cache_size:
+            self._summaries.popitem(last=False)
+
+    @staticmethod
+    def _join(summary: str, lines: list[str]) -> str:
+        history = "\n".join(lines)
+        if summary:
+            return f"[이전 대화 요약]\n{summary}\n\n[최근 대화]\n{history}"
+        return history
+
+    def _best_summary(self, history_list: list[DialogueHistoryEntry], summarized_count: int) -> tuple[str, int]:
+        """
+        summarized_count 턴까지의 요약이 있으면 그대로 쓰고, 없으면 생성을 예약한 뒤
+        그보다 짧은 접두 중 가장 긴 요약을 반환합니다. (요약, 요약이 덮는 턴 수)
+        """
+        target_key = _prefix_hash(history_list[:summarized_count])
+        if target_key in self._summaries:
+            self._summaries.move_to_end(target_key)
+            return self._summaries[target_key], summarized_count
+
+        self._schedule(history_list, summarized_count)
+        for count in range(summarized_count - self.chunk_turns, 0, -self.chunk_turns):
+            key = _prefix_hash(history_list[:count])
+            if key in self._summaries:
+                return self._summaries[key], count
+        return "", 0
+
+    def _schedule(self, history_list: list[DialogueHistoryEntry], summarized_count: int) -> None:
+        key = _prefix_hash(history_list[:summarized_count])
+        if key in self._pending:
+            return
+        task = asyncio.get_running_loop().create_task(
+            self._build_summary(list(history_list[:summarized_count]), key)
+        )
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+
+    async def _build_summary(self, turns: list[DialogueHistoryEntry], key: str) -> None:
+        # 직전 CHUNK까지의 요약을 재귀적으로 확보한 뒤, 새 CHUNK만 덧붙여 요약합니다.
+        previous = ""
+        start = len(turns) - self.chunk_turns
+        if start > 0:
+            previous_key = _prefix_hash(turns[:start])
+            if previous_key not in self._summaries:
+                await self._build_summary(turns[:start], previous_key)
+            if previous_key not in self._summaries:
+                return
+            previous = self._summaries[previous_key]
+        try:
+            summary = await self._summarize(previous, turns[max(0, start):])
+        except Exception as e:
+            _LOG.warning("대화 요약 생성 실패", turns=len(turns), error=str(e))
+            return
+        self._remember(key, summary)
+
+
+class SessionContext:
+    """
+    한 대화 세션의 기록을 서버에 보관하면서 프롬프트용 문자열을 증분으로 만드는 컨텍스트.
+    - 턴을 추가할 때 한 번만 포맷/토큰 추정/접두 해시를 계산하므로, 대화가 길어져도 턴당 비용이 일정합니다.
+    - 요약은 '직전 요약 + 새 CHUNK 턴'으로 이어 만들고, 요약이 덮는 원문 턴은 메모리에서 버립니다.
+    - 요약이 계속 실패하면 max_retained_turns를 넘는 가장 오래된 원문 턴부터 버립니다. (메모리 상한)
+    """
+
+    def __init__(self, window: ContextWindow, max_retained_turns: int):
+        self._window = window
+        self.max_retained_turns = max(max_retained_turns, window.recent_turns + window.chunk_turns)
+        self.total_turns = 0
+        self._offset = 0                                         # _turns[0]의 전체 대화 기준 위치
+        self._turns: list[tuple[DialogueHistoryEntry, str, int]] = []  # (턴, 포맷된 줄, 토큰 추정치)
+        self._digest = hashlib.sha256()                          # 지금까지 전체 턴의 접두 해시 (_prefix_hash와 같은 방식)
+        self._boundary_keys: dict[int, str] = {}                 # CHUNK 경계 턴 수 -> 접두 해시
+        self._summary, self._summary_count = "", 0
+        self._pending: asyncio.Task | None = None
+        self.text_chars = 0                                      # 보관 중인 원문 글자 수 (메모리 사용량 추정)
+
+    def extend(self, turns: list[DialogueHistoryEntry]) -> None:
+        for entry in turns:
+            self.append(entry)
+
+    def append(self, entry: DialogueHistoryEntry) -> None:
+        line = f"{entry.role}: {entry.text}"
+        self._turns.append((entry, line, estimate_tokens(line)))
+        self.text_chars += len(entry.text)
+        self._digest.update(entry.role.encode("utf-8"))
+        self._digest.update(b"\x1f")
+        self._digest.update(entry.text.encode("utf-8"))
+        self._digest.update(b"\x1e")
+        self.total_turns += 1
+        if self.total_turns % self._window.chunk_turns == 0:
+            self._boundary_keys[self.total_turns] = self._digest.copy().hexdigest()
+        if len(self._turns) > self.max_retained_turns:
+            self._drop_before(self._offset + len(self._turns) - self.max_retained_turns)
+
+    def render(self, endpoint: str) -> str:
+        """엔드포인트별 토큰 예산에 맞춘 대화 기록 문자열을 반환합니다. (필요한 요약은 백그라운드에서 생성)"""
+        window = self._window
+        older_count = max(0, self.total_turns - window.recent_turns)
+        target = older_count - older_count % window.chunk_turns
+        if target > self._summary_count:
+            # 같은 대화를 다른 요청(무상태 엔드포인트 등)이 이미 요약했으면 그대로 사용합니다.
+            cached = window._summaries.get(self._boundary_keys.get(target))
+            if cached is not None:
+                self._adopt(cached, target)
+            else:
+                self._schedule(target)
+
+        # 요약이 실패하는 동안 원문이 메모리 상한으로 버려졌으면, 요약과 남은 원문 사이는 비어 있을 수 있습니다.
+        retained = self._turns[max(0, self._summary_count - self._offset):]
+        return window._fit(
+            self._summary, [line for _, line, _ in retained], [tokens for _, _, tokens in retained],
+            window.budgets.get(endpoint)
+        )
+
+    def close(self) -> None:
+        if self._pending is not None:
+            self._pending.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "total_turns": self.total_turns,
+            "retained_turns": len(self._turns),
+            "summarized_turns": self._summary_count,
+            "text_chars": self.text_chars,
+        }
+
+    # --- 내부 구현 ---
+    def _adopt(self, summary: str, count: int) -> None:
+        self._summary, self._summary_count = summary, count
+        self._drop_before(count)
+
+    def _drop_before(self, count: int) -> None:
+        drop = min(len(self._turns), max(0, count - self._offset))
+        if not drop:
+            return
+        self.text_chars -= sum(len(entry.text) for entry, _, _ in self._turns[:drop])
+        del self._turns[:drop]
+        self._offset += drop
+        for boundary in [b for b in self._boundary_keys if b < max(self._offset, self._summary_count)]:
+            del self._boundary_keys[boundary]
+
+    def _schedule(self, target: int) -> None:
+        if self._pending is not None and not self._pending.done():
+            return
+        self._pending = asyncio.get_running_loop().create_task(self._build(target))
+
+    async def _build(self, target: int) -> None:
+        window = self._window
+        while self._summary_count < target:
+            # 버려진 원문(메모리 상한)은 건너뛰고, 남은 원문의 다음 CHUNK 경계까지를 직전 요약에 덧붙입니다.
+            start = max(self._summary_count, self._offset)
+            end = start - start % window.chunk_turns + window.chunk_turns
+            contiguous = start == self._summary_count
+            turns = [entry for entry, _, _ in self._turns[start - self._offset:end - self._offset]]
+            try:
+                summary = await window._summarize(self._summary, turns)
+            except Exception as e:
+                _LOG.warning("세션 대화 요약 생성 실패", turns=end, error=str(e))
+                return
+            if end <= self._summary_count:
+                continue  # 기다리는 동안 공유 캐시의 더 긴 요약을 이미 사용함
+            key = self._boundary_keys.get(end)
+            if contiguous and key is not None:
+                # 전체 접두를 빠짐없이 덮는 요약만 다른 요청과 공유합니다.
+                window._remember(key, summary)
+            self._adopt(summary, end)
+
+
+def create_context_window(summarize) -> ContextWindow:
+    return ContextWindow(
+        summarize=summarize,
+        recent_turns=CONTEXT_RECENT_TURNS,
+        chunk_turns=CONTEXT_SUMMARY_CHUNK_TURNS,
+        cache_size=CONTEXT_SUMMARY_CACHE_SIZE,
+        budgets=CONTEXT_TOKEN_BUDGETS,
+    )
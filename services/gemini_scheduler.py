@@ -0,0 +1,478 @@
+import math
+import time
+import heapq
+import random
+import asyncio
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import (
+    GEMINI_QUOTAS, SCHEDULER_MAX_WAIT_SECONDS, SCHEDULER_ENDPOINT_CLASSES, SCHEDULER_MAX_QUEUE,
+    SCHEDULER_MAX_RETRIES, SCHEDULER_RETRY_BASE_SECONDS, SCHEDULER_RETRY_MAX_SECONDS,
+    GEMINI_KEY_EJECT_SECONDS, GEMINI_KEY_AUTH_EJECT_SECONDS
+)
+from services.log_service import get_logger
+from services.metrics_service import SCHEDULER_QUEUE_DEPTH, SCHEDULER_REJECTED, SCHEDULER_RETRIES, GEMINI_KEY_EJECTIONS
+
+_LOG = get_logger("scheduler")
+
+# 우선순위 클래스 이름 -> 순위 (작을수록 먼저 처리)
+PRIORITIES = {name: rank for rank, name in enumerate(SCHEDULER_MAX_WAIT_SECONDS)}
+_CLASS_NAMES = list(SCHEDULER_MAX_WAIT_SECONDS)
+_BACKGROUND_CLASS = "background"
+
+# 재시도할 오류의 HTTP 상태 코드 (google.api_core 예외의 code 속성)
+_RETRYABLE_CODES = {429, 500, 502, 503, 504}
+# 키(프로젝트) 문제라 다른 키로는 성공할 수 있는 인증 오류의 상태 코드
+_AUTH_CODES = {401, 403}
+
+# 추측 생성/배치 작업처럼 사용자가 기다리지 않는 호출은 엔드포인트와 관계없이 가장 낮은 우선순위로 실행합니다.
+_BACKGROUND: ContextVar[bool] = ContextVar("gemini_background", default=False)
+# background로 시작했지만 나중에 실제 요청이 결과를 기다리게 되면 우선순위를 올릴 수 있는 호출의 손잡이
+_UPGRADE: ContextVar["PriorityUpgrade | None"] = ContextVar("gemini_priority_upgrade", default=None)
+
+
+class PriorityUpgrade:
+    """
+    background_priority(upgrade)로 시작한 호출의 우선순위를 나중에 올리는 손잡이. (추측 생성에 실제 요청이 합류한 경우 등)
+    upgrade()를 부르면 대기열에 있는 호출은 엔드포인트 본래의 우선순위로 다시 정렬되고, 이후 시작하는 호출(재시도 포함)도 본래 우선순위로 실행됩니다.
+    """
+
+    def __init__(self):
+        self.upgraded = False
+        self._waiting: dict["_Waiter", tuple["_Lane", str]] = {}   # 대기 중인 호출 -> (창구, 본래 우선순위 클래스)
+
+    def upgrade(self) -> None:
+        if self.upgraded:
+            return
+        self.upgraded = True
+        for waiter, (lane, priority_class) in list(self._waiting.items()):
+            lane.reprioritize(waiter, PRIORITIES[priority_class])
+
+
+@contextmanager
+def background_priority(upgrade: PriorityUpgrade | None = None):
+    """
+    with 블록 안에서(및 그 안에서 만든 태스크에서) 시작하는 Gemini 호출을 background 우선순위로 실행합니다.
+    upgrade를 주면 upgrade.upgrade()를 부른 뒤부터 엔드포인트 본래의 우선순위로 올라갑니다.
+    """
+    token = _BACKGROUND.set(True)
+    upgrade_token = _UPGRADE.set(upgrade)
+    try:
+        yield
+    finally:
+        _UPGRADE.reset(upgrade_token)
+        _BACKGROUND.reset(token)
+
+
+class OverloadedError(Exception):
+    """쿼터/대기열이 가득 차 호출을 시작하지 못한 경우. retry_after초 뒤 다시 시도하면 됩니다."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """초당 rate만큼 채워지고 capacity까지 쌓이는 토큰 버킷. (사용량 정산으로 음수가 될 수 있음)"""
+
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """amount만큼 꺼내려면 기다려야 하는 시간 (refill 직후 호출)"""
+        # 한 번에 capacity보다 큰 요청은 가득 찼을 때 보냅니다. (영원히 막히지 않도록)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "future")
+
+    def __init__(self, priority: int, seq: int, tokens: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.future = future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def _granted(waiter: _Waiter) -> bool:
+    future = waiter.future
+    return future.done() and not future.cancelled() and future.exception() is None
+
+
+def _is_auth_error(error: Exception) -> bool:
+    code = getattr(error, "code", None)
+    # 잘못된 API 키는 400(INVALID_ARGUMENT, "API key not valid")으로 옵니다.
+    return code in _AUTH_CODES or (code == 400 and "API key" in str(error))
+
+
+class _Lane:
+    """
+    모델 등급 하나 x API 키 하나의 호출 창구.
+    동시 호출 한도, 분당 요청/토큰 버킷을 모두 만족할 때 우선순위가 가장 높은(같으면 먼저 온) 호출부터 시작시킵니다.
+    """
+
+    def __init__(self, tier: str, concurrency: int, rpm: int, tpm: int, key_index: int = 0, label: str | None = None):
+        self.tier = tier
+        self.key_index = key_index
+        self.label = label or tier   # 지표/로그용 이름 (키가 여러 개면 '등급:키 순번')
+        self.concurrency = concurrency
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.active = 0
+        self.paused_until = 0.0      # 429를 받으면 잠시 모든 호출 시작을 멈춥니다.
+        self.ejected_until = 0.0     # 키 풀에서 429/인증 오류를 낸 키는 잠시 새 호출을 배정받지 않습니다.
+        self._queue: list[_Waiter] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._seq = itertools.count()
+        self.stats = {
+            "admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_deadline": 0, "shed": 0, "retries": 0,
+            "ejections": 0, "failovers": 0,
+        }
+
+    # --- 입장 ---
+    async def acquire(self, priority_class: str, tokens: int, upgrade_class: str | None = None) -> None:
+        """입장 허가를 기다립니다. (upgrade_class: 대기 중 PriorityUpgrade로 올라갈 때 쓸 본래 우선순위 클래스)"""
+        priority = PRIORITIES[priority_class]
+        now = time.monotonic()
+        self._refill(now)
+        if not self._pending() and self._start_delay(tokens, now) == 0.0:
+            self._start(tokens)
+            return
+
+        # 앞선 대기 호출들이 빠지는 데 걸릴 예상 시간이 최대 대기 시간을 넘으면 바로 거절합니다. (늦은 성공보다 빠른 실패)
+        max_wait = SCHEDULER_MAX_WAIT_SECONDS[priority_class]
+        expected = self._expected_wait(priority, tokens, now)
+        if expected > max_wait:
+            self._reject(priority_class, "deadline", expected)
+
+        if len(self._queue) >= SCHEDULER_MAX_QUEUE:
+            self._compact()
+        if len(self._queue) >= SCHEDULER_MAX_QUEUE:
+            worst = max(self._queue)
+            if worst.priority <= priority:
+                self._reject(priority_class, "queue_full", self._retry_after(now))
+            # 더 낮은 우선순위의 대기 호출을 밀어냅니다.
+            self._queue.remove(worst)
+            heapq.heapify(self._queue)
+            self.stats["shed"] += 1
+            SCHEDULER_REJECTED.labels(self.label, _CLASS_NAMES[worst.priority], "shed").inc()
+            worst.future.set_exception(OverloadedError("더 높은 우선순위 호출에 밀려 거절되었습니다.", self._retry_after(now)))
+
+        waiter = _Waiter(priority, next(self._seq), tokens, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, waiter)
+        upgrade = _UPGRADE.get()
+        if upgrade is not None and upgrade_class is not None:
+            upgrade._waiting[waiter] = (self, upgrade_class)
+        self.stats["queued"] += 1
+        SCHEDULER_QUEUE_DEPTH.labels(self.label).set(self._pending())
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=max_wait)
+        except asyncio.TimeoutError:
+            # 시간 초과와 동시에 입장이 허가되었다면 그대로 진행합니다.
+            if _granted(waiter):
+                return
+            waiter.future.cancel()
+            self._reject(priority_class, "deadline", self._retry_after(time.monotonic()))
+        except asyncio.CancelledError:
+            # 호출자가 취소된 시점에 이미 입장이 허가되었다면 자리를 돌려줍니다.
+            if _granted(waiter):
+                self.release()
+            else:
+                waiter.future.cancel()
+            raise
+        finally:
+            if upgrade is not None:
+                upgrade._waiting.pop(waiter, None)
+            SCHEDULER_QUEUE_DEPTH.labels(self.label).set(self._pending())
+
+    def release(self, token_adjustment: int = 0) -> None:
+        """호출이 끝나면 자리를 반납하고, 실제 토큰 사용량과 추정치의 차이를 정산합니다."""
+        self.active -= 1
+        self.tokens.take(token_adjustment)
+        self._dispatch()
+
+    def reprioritize(self, waiter: _Waiter, priority: int) -> None:
+        """대기 중인 호출의 우선순위를 올리고 바로 시작할 수 있는지 다시 확인합니다."""
+        if waiter.future.done() or waiter.priority <= priority:
+            return
+        waiter.priority = priority
+        heapq.heapify(self._queue)
+        self._dispatch()
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self._dispatch()
+
+    def eject(self, seconds: float, reason: str) -> None:
+        self.ejected_until = max(self.ejected_until, time.monotonic() + seconds)
+        self.stats["ejections"] += 1
+        GEMINI_KEY_EJECTIONS.labels(self.label, reason).inc()
+        _LOG.warning("Gemini API 키를 분배에서 제외", model=self.label, reason=reason, seconds=seconds)
+
+    def healthy(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+    def load(self, tokens: int, now: float) -> tuple:
+        """키 선택 기준 (작을수록 여유): 바로 시작할 수 있는지, 동시 호출 자리 사용률, 남은 분당 요청 수"""
+        self._refill(now)
+        return self._start_delay(tokens, now) > 0, (self.active + self._pending()) / self.concurrency, -self.requests.level
+
+    # --- 내부 구현 ---
+    def _refill(self, now: float) -> None:
+        self.requests.refill(now)
+        self.tokens.refill(now)
+
+    def _start_delay(self, tokens: int, now: float) -> float:
+        if self.active >= self.concurrency:
+            return math.inf
+        return max(self.paused_until - now, self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def _start(self, tokens: int) -> None:
+        self.active += 1
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.stats["admitted"] += 1
+
+    def _pending(self) -> int:
+        return sum(1 for waiter in self._queue if not waiter.future.done())
+
+    def _compact(self) -> None:
+        self._queue = [waiter for waiter in self._queue if not waiter.future.done()]
+        heapq.heapify(self._queue)
+
+    def _expected_wait(self, priority: int, tokens: int, now: float) -> float:
+        ahead = [waiter for waiter in self._queue if waiter.priority <= priority and not waiter.future.done()]
+        requests_needed = len(ahead) + 1 - self.requests.level
+        tokens_needed = sum(waiter.tokens for waiter in ahead) + tokens - self.tokens.level
+        return max(
+            self.paused_until - now,
+            requests_needed / self.requests.rate if requests_needed > 0 else 0.0,
+            tokens_needed / self.tokens.rate if tokens_needed > 0 else 0.0,
+        )
+
+    def _retry_after(self, now: float) -> float:
+        return max(1.0, self._expected_wait(len(PRIORITIES), 0, now))
+
+    def _reject(self, priority_class: str, reason: str, retry_after: float):
+        self.stats[f"rejected_{reason}"] += 1
+        SCHEDULER_REJECTED.labels(self.label, priority_class, reason).inc()
+        raise OverloadedError(f"Gemini {self.label} 호출 대기열이 가득 찼습니다. ({reason})", retry_after)
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        while self._queue:
+            head = self._queue[0]
+            if head.future.done():
+                heapq.heappop(self._queue)
+                continue
+            delay = self._start_delay(head.tokens, now)
+            if delay == math.inf:
+                return  # 동시 호출 자리가 나면 release()가 다시 호출합니다.
+            if delay > 0:
+                self._arm_timer(delay)
+                return
+            heapq.heappop(self._queue)
+            self._start(head.tokens)
+            head.future.set_result(None)
+
+    def _arm_timer(self, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self._timer is not None:
+            if self._timer.when() <= when:
+                return
+            self._timer.cancel()
+        self._timer = loop.call_at(when, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+
+class GeminiScheduler:
+    """
+    모든 Gemini 호출이 거치는 중앙 스케줄러.
+    - 모델 등급별 동시 호출 한도 + 분당 요청/토큰 버킷 (쿼터 초과로 인한 429를 미리 막음)
+    - 우선순위 클래스 (voice > turn > diagnose > report > background)와 클래스별 최대 대기 시간
+    - 429/5xx는 지터를 섞은 지수 백오프로 재시도 (429면 해당 모델의 호출 시작을 잠시 멈춤)
+    - API 키가 여러 개면 등급마다 키별 창구(한도/쿼터 별도)를 두고, 호출마다 여유가 가장 많은 정상 키로 보냅니다.
+      429/인증 오류를 낸 키는 잠시 빼고 다른 키로 바로 재시도하므로, 처리량은 키 수에 비례해 늘어납니다.
+    """
+
+    def __init__(self, model_names: dict[str, str], concurrency: dict[str, int], key_count: int = 1):
+        self._key_count = key_count
+        self._pools = {
+            f"models/{name}": [
+                _Lane(
+                    tier, concurrency[tier], GEMINI_QUOTAS[tier]["rpm"], GEMINI_QUOTAS[tier]["tpm"],
+                    key_index, tier if key_count == 1 else f"{tier}:{key_index}"
+                )
+                for key_index in range(key_count)
+            ]
+            for tier, name in model_names.items()
+        }
+
+    def pool_for(self, model_name: str) -> list[_Lane]:
+        pool = self._pools.get(model_name)
+        if pool is None:
+            # 캐시 컨텍스트 기반 모델은 버전이 붙은 이름(예: models/gemini-2.5-pro-001)을 가질 수 있습니다.
+            pool = next(pool for name, pool in self._pools.items() if model_name.startswith(name))
+            self._pools[model_name] = pool
+        return pool
+
+    @staticmethod
+    def select(pool: list[_Lane], tokens: int, key_index: int | None = None) -> _Lane:
+        """이번 호출을 보낼 키 창구를 고릅니다. (key_index를 주면 그 키로 고정)"""
+        if key_index is not None:
+            return pool[key_index]
+        if len(pool) == 1:
+            return pool[0]
+        now = time.monotonic()
+        healthy = [lane for lane in pool if lane.healthy(now)]
+        if not healthy:
+            # 모든 키가 빠져 있으면 가장 먼저 돌아올 키로 보냅니다.
+            return min(pool, key=lambda lane: lane.ejected_until)
+        return min(healthy, key=lambda lane: lane.load(tokens, now))
+
+    @staticmethod
+    def priority_class(endpoint: str) -> str:
+        if _BACKGROUND.get():
+            upgrade = _UPGRADE.get()
+            if upgrade is None or not upgrade.upgraded:
+                return _BACKGROUND_CLASS
+        return SCHEDULER_ENDPOINT_CLASSES.get(endpoint, _BACKGROUND_CLASS)
+
+    def retry_delay(self, lane: _Lane, error: Exception, attempt: int, pool: list[_Lane]) -> float | None:
+        """
+        재시도할 오류면 대기 시간을, 아니면(또는 재시도 한도 초과) None을 반환합니다.
+        pool에 다른 키가 있으면 429/인증 오류를 낸 키를 잠시 빼고, 다른 정상 키가 남아 있으면 기다리지 않고(0초) 재시도합니다.
+        """
+        code = getattr(error, "code", None)
+        auth_error = _is_auth_error(error)
+        if attempt >= SCHEDULER_MAX_RETRIES or not (code in _RETRYABLE_CODES or (auth_error and len(pool) > 1)):
+            return None
+        delay = min(SCHEDULER_RETRY_MAX_SECONDS, SCHEDULER_RETRY_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0)
+        if code == 429:
+            lane.pause(delay)
+        lane.stats["retries"] += 1
+        SCHEDULER_RETRIES.labels(lane.label, str(code)).inc()
+        if (code == 429 or auth_error) and len(pool) > 1:
+            lane.eject(GEMINI_KEY_AUTH_EJECT_SECONDS if auth_error else GEMINI_KEY_EJECT_SECONDS, "auth" if auth_error else "quota")
+            now = time.monotonic()
+            if any(other.healthy(now) for other in pool):
+                lane.stats["failovers"] += 1
+                _LOG.info("Gemini 호출을 다른 키로 재시도", model=lane.label, code=code, attempt=attempt + 1)
+                return 0.0
+        _LOG.info("Gemini 호출 재시도", model=lane.label, code=code, attempt=attempt + 1, delay_ms=round(delay * 1000))
+        return delay
+
+    async def run(self, model_name: str, endpoint: str, tokens: int, call, used_tokens=None, key_index: int | None = None):
+        """
+        키 창구를 골라 입장 허가를 받은 뒤 call(키 순번)을 실행합니다. 재시도할 오류면 백오프 후 다시 골라 재시도합니다.
+        used_tokens(result)가 실제 토큰 사용량을 돌려주면 추정치와의 차이를 토큰 버킷에 정산합니다.
+        key_index를 주면 그 키로만 호출합니다. (특정 프로젝트에 등록된 캐시 컨텍스트 등)
+        """
+        pool = self.pool_for(model_name)
+        upgrade_class = SCHEDULER_ENDPOINT_CLASSES.get(endpoint, _BACKGROUND_CLASS)
+        attempt = 0
+        while True:
+            lane = self.select(pool, tokens, key_index)
+            # (재시도 전에 우선순위가 올라갔을 수 있으므로 시도마다 다시 구합니다)
+            await lane.acquire(self.priority_class(endpoint), tokens, upgrade_class)
+            try:
+                result = await call(lane.key_index)
+            except Exception as e:
+                lane.release()
+                delay = self.retry_delay(lane, e, attempt, pool if key_index is None else [lane])
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                lane.release()
+                raise
+            used = used_tokens(result) if used_tokens else None
+            lane.release(used - tokens if used else 0)
+            return result
+
+    async def stream(self, model_name: str, endpoint: str, tokens: int, open_stream, used_tokens=None, key_index: int | None = None):
+        """
+        스트리밍 호출용 run(). open_stream(키 순번)의 스트림이 끝날 때까지 자리를 점유합니다.
+        첫 조각을 내보내기 전에 난 오류만 재시도합니다. (이미 보낸 조각은 되돌릴 수 없으므로)
+        """
+        pool = self.pool_for(model_name)
+        upgrade_class = SCHEDULER_ENDPOINT_CLASSES.get(endpoint, _BACKGROUND_CLASS)
+        attempt = 0
+        while True:
+            lane = self.select(pool, tokens, key_index)
+            # (재시도 전에 우선순위가 올라갔을 수 있으므로 시도마다 다시 구합니다)
+            await lane.acquire(self.priority_class(endpoint), tokens, upgrade_class)
+            started = False
+            try:
+                async for piece in open_stream(lane.key_index):
+                    started = True
+                    yield piece
+            except Exception as e:
+                lane.release()
+                delay = None if started else self.retry_delay(lane, e, attempt, pool if key_index is None else [lane])
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                lane.release()
+                raise
+            used = used_tokens() if used_tokens else None
+            lane.release(used - tokens if used else 0)
+            return
+
+    @staticmethod
+    def _lane_stats(lane: _Lane, now: float) -> dict:
+        return {
+            **lane.stats,
+            "active": lane.active,
+            "waiting": lane._pending(),
+            "concurrency": lane.concurrency,
+            "requests_available": round(lane.requests.level, 1),
+            "tokens_available": round(lane.tokens.level),
+            "paused_seconds": round(max(0.0, lane.paused_until - now), 2),
+        }
+
+    def stats(self) -> dict:
+        """등급별 합계(쿼터/한도는 키 합계, 일시 중지는 가장 먼저 풀리는 키 기준)와 키별 상세"""
+        now = time.monotonic()
+        pools = {pool[0].tier: pool for pool in self._pools.values()}
+        result = {}
+        for tier, pool in pools.items():
+            keys = [self._lane_stats(lane, now) for lane in pool]
+            total = {name: sum(key[name] for key in keys) for name in keys[0] if name != "paused_seconds"}
+            total["requests_available"] = round(total["requests_available"], 1)
+            total["paused_seconds"] = min(key["paused_seconds"] for key in keys)
+            result[tier] = {
+                **total,
+                "keys": [
+                    {"key_index": lane.key_index, "ejected_seconds": round(max(0.0, lane.ejected_until - now), 2), **key}
+                    for lane, key in zip(pool, keys)
+                ],
+            }
+        return result
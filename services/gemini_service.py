@@ -1,6 +1,29 @@
+import re
 import json
-from config import GEMINI_PRO_MODEL, GEMINI_FLASH_MODEL, GOOGLE_API_KEY
-from models import DialogueHistoryEntry
+import math
+import time
+import asyncio
+from pydantic import BaseModel, ValidationError
+from config import (
+    GEMINI_MODEL_NAMES, GEMINI_KEY_COUNT, GOOGLE_API_KEY, AI_OFFLINE, get_gemini_model,
+    GEMINI_PRO_CONCURRENCY, GEMINI_FLASH_CONCURRENCY,
+    PATTERN_TEXT_MODE, PATTERN_VOICE_MODE,
+    STRUCTURED_OUTPUT_MAX_REPAIRS, STRUCTURED_OUTPUT_DEADLINES
+)
+from models import (
+    DialogueHistoryEntry, AdaptiveOption, AdaptiveTurnResponse,
+    SessionAnalysis, PremiumReportResponse, DiagnosisResponse
+)
+from services.schema_service import to_gemini_schema
+from services.model_router import create_router
+from services.gemini_scheduler import GeminiScheduler, OverloadedError, background_priority
+from services.prompt_templates import PromptTemplate, TemplateRegistry
+from services.cache_service import DIAGNOSIS_CACHE, hash_text
+from services.single_flight import SingleFlight, request_key
+from services.context_service import SessionContext, create_context_window, estimate_tokens
+from services.log_service import get_logger
+from services.metrics_service import stage, record_gemini_usage, GEMINI_CALLS, GEMINI_IN_FLIGHT
+from services import pattern_service
 
 # --- 페르소나 템플릿: 5개 카테고리 모두 포함 ---
 PERSONA_PROMPTS = {
@@ -46,130 +69,313 @@ PERSONA_PROMPTS = {
 """
 }
 
-# --- 핵심 기능 함수 ---
-##############################
-def generate_adaptive_turn(crime_type: str, history_list: list[DialogueHistoryEntry], highest_vulnerability_axis: str) -> dict:
-    persona_prompt = PERSONA_PROMPTS.get(crime_type, PERSONA_PROMPTS["전세사기"])
-    #history_for_prompt = "\n".join([f"{entry.role}: {entry.text}" for entry in history_list])
-    history_for_prompt = "\n".join([f"{entry.role}: {entry.text}" for entry in history_list])
+_LOG = get_logger("gemini")
+
+# --- Gemini 호출 스케줄러 ---
+# 모든 호출은 모델별 동시 호출 한도와 분당 요청/토큰 쿼터 안에서, 우선순위(voice > turn > diagnose > report > background)
+# 순서로 시작합니다. 최대 대기 시간 안에 시작할 수 없으면 OverloadedError로 거절하고, 429/5xx는 스케줄러가 재시도합니다.
+# (모델은 처음 사용할 때 만들어지므로, 호출 창구는 모델 이름으로 미리 준비해 둡니다)
+# API 키가 여러 개면 키마다 창구를 두고, 스케줄러가 고른 키의 모델 인스턴스로 호출합니다.
+_SCHEDULER = GeminiScheduler(
+    GEMINI_MODEL_NAMES, {"pro": GEMINI_PRO_CONCURRENCY, "flash": GEMINI_FLASH_CONCURRENCY}, GEMINI_KEY_COUNT
+)
+_TIERS = {f"models/{name}": tier for tier, name in GEMINI_MODEL_NAMES.items()}
+
+def _pinned_key(model) -> int | None:
+    """캐시 컨텍스트 기반 모델은 첫 번째 키(genai.configure)의 프로젝트에 등록되어 있어 그 키로만 호출할 수 있습니다."""
+    return 0 if getattr(model, "cached_content", None) else None
+
+def _model_for_key(model, key_index: int):
+    if key_index == 0 or model.model_name not in _TIERS:
+        return model
+    return get_gemini_model(_TIERS[model.model_name], key_index)
+
+def _used_tokens(response) -> int | None:
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) if usage is not None else None
+
+async def _generate_async(model, prompt: str, endpoint: str, **kwargs):
+    """
+    스케줄러의 입장 허가를 받아 Gemini를 비동기로 호출합니다.
+    """
+    async def call(key_index: int):
+        keyed_model = _model_for_key(model, key_index)
+        GEMINI_IN_FLIGHT.labels(model.model_name).inc()
+        try:
+            with stage("gemini_call"):
+                response = await keyed_model.generate_content_async(prompt, **kwargs)
+        except Exception:
+            GEMINI_CALLS.labels(model.model_name, "error").inc()
+            raise
+        finally:
+            GEMINI_IN_FLIGHT.labels(model.model_name).dec()
+        GEMINI_CALLS.labels(model.model_name, "ok").inc()
+        record_gemini_usage(model.model_name, response)
+        return response
+
+    return await _SCHEDULER.run(
+        model.model_name, endpoint, estimate_tokens(prompt), call, _used_tokens, key_index=_pinned_key(model)
+    )
+
+# --- 모델 라우팅 ---
+# 엔드포인트별 SLO와 관측 지연 시간에 따라 Pro/Flash를 선택하고, 헤지·타임아웃·서킷 브레이커를 적용합니다.
+_ROUTER = create_router(get_gemini_model, list(GEMINI_MODEL_NAMES))
+
+async def _call_model(endpoint: str, prompt: str, template: PromptTemplate | None = None, **kwargs):
+    """
+    엔드포인트에 맞는 모델을 라우터가 골라 호출합니다.
+    template이 있으면 고정 접두부(또는 등록된 캐시 컨텍스트)를 prompt 앞에 적용합니다.
+    """
+    return await _ROUTER.execute(
+        endpoint,
+        lambda model: _generate_async(*_TEMPLATES.bind(template, model, prompt), endpoint, **kwargs)
+    )
+
+def router_stats() -> dict:
+    return _ROUTER.stats()
+
+def scheduler_stats() -> dict:
+    return _SCHEDULER.stats()
+
+async def _stream_async(model, prompt: str, endpoint: str, **kwargs):
+    """
+    Gemini 스트리밍 응답을 텍스트 조각 단위로 내보냅니다.
+    스트림이 끝날 때까지 해당 모델의 동시 호출 자리를 점유합니다.
+    """
+    response = None
+
+    async def open_stream(key_index: int):
+        nonlocal response
+        keyed_model = _model_for_key(model, key_index)
+        GEMINI_IN_FLIGHT.labels(model.model_name).inc()
+        try:
+            with stage("gemini_call"):
+                response = await keyed_model.generate_content_async(prompt, stream=True, **kwargs)
+                async for chunk in response:
+                    # 안전 필터 등으로 텍스트 파트가 없는 청크는 건너뜁니다.
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        continue
+                    if text:
+                        yield text
+        except Exception:
+            GEMINI_CALLS.labels(model.model_name, "error").inc()
+            raise
+        finally:
+            GEMINI_IN_FLIGHT.labels(model.model_name).dec()
+        GEMINI_CALLS.labels(model.model_name, "ok").inc()
+        record_gemini_usage(model.model_name, response)
+
+    async for text in _SCHEDULER.stream(
+        model.model_name, endpoint, estimate_tokens(prompt), open_stream, lambda: _used_tokens(response),
+        key_index=_pinned_key(model)
+    ):
+        yield text
+
+# --- 구조화 출력 (JSON 응답 모드 + 스키마 검증) ---
+# 응답 모델별 response_schema는 한 번만 변환해 둡니다.
+_RESPONSE_SCHEMAS = {
+    model_cls: to_gemini_schema(model_cls)
+    for model_cls in (AdaptiveTurnResponse, SessionAnalysis, PremiumReportResponse, DiagnosisResponse)
+}
+# 엔드포인트별 파싱 실패/복구 재시도 횟수
+_STRUCTURED_STATS: dict[str, dict[str, int]] = {}
+
+def _structured_stats(endpoint: str) -> dict[str, int]:
+    return _STRUCTURED_STATS.setdefault(endpoint, {"calls": 0, "parse_failures": 0, "repair_retries": 0, "repaired": 0, "failed": 0})
+
+class StructuredOutputError(Exception):
+    """마감 시간/재시도 한도 안에서 스키마에 맞는 응답을 얻지 못한 경우"""
+
+# 같은 입력의 동시 구조화 호출(BE 재시도, 연속 클릭으로 중복된 리포트/진단 요청)은 하나의 호출을 함께 기다립니다.
+_STRUCTURED_FLIGHTS = SingleFlight("gemini_structured")
+
+async def _generate_structured(prompt: str, response_model: type[BaseModel], endpoint: str, template: PromptTemplate | None = None) -> BaseModel:
+    """
+    Gemini JSON 응답 모드로 호출하고, 응답을 Pydantic 모델로 검증하여 반환합니다.
+    같은 입력의 호출이 진행 중이면 새로 호출하지 않고 그 결과를 함께 받습니다.
+    (우선순위가 다른 호출끼리는 합치지 않습니다. background 호출에 합류한 사용자 요청이 늦게 시작되지 않도록)
+    """
+    key = request_key(
+        endpoint, _SCHEDULER.priority_class(endpoint), response_model.__name__,
+        template.endpoint if template else None, template.crime_type if template else None, prompt
+    )
+    return await _STRUCTURED_FLIGHTS.do(
+        key, lambda: _generate_structured_once(prompt, response_model, endpoint, template)
+    )
+
+async def _generate_structured_once(prompt: str, response_model: type[BaseModel], endpoint: str, template: PromptTemplate | None) -> BaseModel:
+    """
+    검증에 실패하면 오류 내용을 알려주는 복구 요청을, 마감 시간 안에 끝날 것 같을 때만 재시도합니다.
+    """
+    stats = _structured_stats(endpoint)
+    stats["calls"] += 1
+    generation_config = {
+        "response_mime_type": "application/json",
+        "response_schema": _RESPONSE_SCHEMAS[response_model],
+    }
+    deadline = time.monotonic() + STRUCTURED_OUTPUT_DEADLINES.get(endpoint, 60)
+    current_prompt = prompt
 
+    for attempt in range(STRUCTURED_OUTPUT_MAX_REPAIRS + 1):
+        started = time.monotonic()
+        remaining = deadline - started
+        response = await _call_model(
+            endpoint, current_prompt, template,
+            generation_config=generation_config,
+            request_options={"timeout": max(1.0, remaining)}
+        )
+        try:
+            with stage("parse"):
+                result = response_model.model_validate_json(response.text)
+            if attempt:
+                stats["repaired"] += 1
+            return result
+        except (ValidationError, ValueError) as e:
+            stats["parse_failures"] += 1
+            _LOG.warning("응답 스키마 검증 실패", endpoint=endpoint, attempt=attempt, error=str(e))
+            elapsed = time.monotonic() - started
+            # 같은 시간이 한 번 더 걸려도 마감 안에 끝나는 경우에만 복구를 시도합니다.
+            if attempt >= STRUCTURED_OUTPUT_MAX_REPAIRS or time.monotonic() + elapsed > deadline:
+                stats["failed"] += 1
+                raise StructuredOutputError(f"{endpoint} 응답 스키마 검증 실패: {e}") from e
+            stats["repair_retries"] += 1
+            current_prompt = f"""{prompt}
+
+# PREVIOUS OUTPUT (INVALID)
+{response.text[:4000]}
+
+# VALIDATION ERRORS
+{e}
+
+위 출력은 요구한 JSON 스키마를 위반했습니다. 오류를 고쳐, 스키마를 완벽히 준수하는 JSON만 다시 출력하세요.
+"""
+
+def structured_output_stats() -> dict:
+    return _STRUCTURED_STATS
+
+# --- 대화 기록 컨텍스트 관리 ---
+async def _summarize_history(previous_summary: str, turns: list[DialogueHistoryEntry]) -> str:
+    """
+    이전 요약과 새로 밀려난 턴들을 합쳐 누적 요약을 만듭니다. (ContextWindow가 백그라운드에서 호출)
+    """
+    new_turns = "\n".join([f"{entry.role}: {entry.text}" for entry in turns])
     prompt = f"""
 # ROLE
-당신은 사용자의 심리적 취약점을 분석하여 맞춤형으로 대응하는 '지능형 사기꾼 AI'입니다.
-# CONTEXT
-{persona_prompt}
-당신은 현재 '{crime_type}' 시나리오를 수행 중입니다.
-지금까지의 대화를 통해 파악된 사용자의 가장 큰 취약점은 '{highest_vulnerability_axis}' 입니다.
-당신의 목표는 이 취약점을 집요하게 공략하여, 사용자가 'unsafe'한 행동을 하도록 유도하는 것입니다.
+당신은 금융사기 시뮬레이션 대화를 기록하는 요약 담당자입니다.
 
-[이전 대화 기록]
-{history_for_prompt}
+# PREVIOUS SUMMARY
+{previous_summary or "(없음)"}
+
+# NEW DIALOGUE
+{new_turns}
 
 # INSTRUCTION
-1. 사용자의 가장 큰 취약점인 '{highest_vulnerability_axis}'를 공략하는, 다음 AI 대사('next_speech')를 생성하세요.
-2. 그 대사에 이어질, 사용자가 선택할 수 있는 3개의 짧고 명료한 선택지('options')를 만드세요.
-3. 3개의 선택지는 각각 'safe', 'risky', 'unsafe'한 대응을 대표해야 합니다.
-4. 결과는 반드시 아래 JSON 형식으로만 출력하고, 다른 어떤 말도 덧붙이지 마세요.
+이전 요약에 새 대화 내용을 반영하여, 전체 흐름을 5문장 이내로 다시 요약하세요.
+사기꾼이 사용한 수법, 사용자가 노출한 정보나 위험한 대응은 반드시 남기세요. 요약문만 출력하세요.
+"""
+    response = await _call_model("summary", prompt)
+    return response.text.strip()
+
+_CONTEXT = create_context_window(_summarize_history)
+
+# --- 고정 프롬프트 템플릿 ---
+# 요청마다 같은 부분(역할, 페르소나, 지시사항, 출력 형식)은 (endpoint, crime_type)별로 서버 시작 시 한 번만 만들고,
+# 대화 기록처럼 요청마다 달라지는 부분은 항상 그 뒤에 붙입니다.
+_DEFAULT_CRIME_TYPE = "전세사기"
+_VOICE_CRIME_TYPE = "보이스피싱"
+_OPTIONS_DELIMITER = "###OPTIONS###"
+
+def _adaptive_prefix(crime_type: str, streaming: bool) -> str:
+    persona_prompt = PERSONA_PROMPTS[crime_type]
+    if streaming:
+        output_rules = f"""4. 결과는 반드시 아래 형식으로만 출력하세요. 먼저 대사만 출력하고, 줄을 바꿔 '{_OPTIONS_DELIMITER}' 를 쓴 뒤 선택지 JSON 배열을 출력하세요.
+# OUTPUT
+AI가 생성할 다음 대사
+{_OPTIONS_DELIMITER}
+[
+  {{"text": "안전한 대응 선택지 (15자 내외)", "verdict": "safe"}},
+  {{"text": "애매하고 위험한 선택지 (15자 내외)", "verdict": "risky"}},
+  {{"text": "치명적으로 위험한 선택지 (15자 내외)", "verdict": "unsafe"}}
+]
+"""
+    else:
+        output_rules = """4. 결과는 반드시 아래 JSON 형식으로만 출력하고, 다른 어떤 말도 덧붙이지 마세요.
 # OUTPUT (JSON ONLY)
-{{
+{
   "next_speech": "AI가 생성할 다음 대사",
   "options": [
-    {{"text": "안전한 대응 선택지 (15자 내외)", "verdict": "safe"}},
-    {{"text": "애매하고 위험한 선택지 (15자 내외)", "verdict": "risky"}},
-    {{"text": "치명적으로 위험한 선택지 (15자 내외)", "verdict": "unsafe"}}
+    {"text": "안전한 대응 선택지 (15자 내외)", "verdict": "safe"},
+    {"text": "애매하고 위험한 선택지 (15자 내외)", "verdict": "risky"},
+    {"text": "치명적으로 위험한 선택지 (15자 내외)", "verdict": "unsafe"}
   ]
-}}
+}
 """
-    try:
-        response = GEMINI_FLASH_MODEL.generate_content(prompt)
-        cleaned_response = response.text.strip().strip("```json\n").strip("```")
-        return json.loads(cleaned_response)
-    except Exception as e:
-        print(f"[Error] 적응형 턴 생성 실패: {e}")
-        return {"error": "AI 응답 생성 실패", "next_speech": "오류 발생", "options": []}
-
-##############################
-def generate_voice_turn(history_list: list[DialogueHistoryEntry], user_message: str) -> str:
-    persona_prompt = PERSONA_PROMPTS["보이스피싱"]
-    history_for_prompt = "\n".join([f"{entry.role}: {entry.text}" for entry in history_list]) + f"\nUSER: {user_message}"
-    
-    prompt = f"""
+    return f"""
+# ROLE
+당신은 사용자의 심리적 취약점을 분석하여 맞춤형으로 대응하는 '지능형 사기꾼 AI'입니다.
+# CONTEXT
 {persona_prompt}
-# DIALOGUE HISTORY
-{history_for_prompt}
+당신은 현재 '{crime_type}' 시나리오를 수행 중입니다.
+당신의 목표는 아래 [사용자 취약점]을 집요하게 공략하여, 사용자가 'unsafe'한 행동을 하도록 유도하는 것입니다.
 # INSTRUCTION
-위 대화의 맥락을 이어받아, 당신의 페르소나를 완벽하게 유지하며 다음 할 말을 자연스럽게 생성하세요. 다른 설명 없이 오직 대사만 출력하세요.
-AI: 
-"""
-    try:
-        response = GEMINI_FLASH_MODEL.generate_content(prompt)
-        return response.text.strip().replace("AI:", "").strip()
-    except Exception as e:
-        print(f"[Error] 음성 턴 생성 실패: {e}")
-        return "응답 생성에 실패했습니다."
+1. [사용자 취약점]을 공략하는, 다음 AI 대사('next_speech')를 생성하세요.
+2. 그 대사에 이어질, 사용자가 선택할 수 있는 3개의 짧고 명료한 선택지('options')를 만드세요.
+3. 3개의 선택지는 각각 'safe', 'risky', 'unsafe'한 대응을 대표해야 합니다.
+{output_rules}"""
 
+def _voice_prefix(crime_type: str) -> str:
+    return f"""
+{PERSONA_PROMPTS[crime_type]}
+# INSTRUCTION
+아래 대화의 맥락을 이어받아, 당신의 페르소나를 완벽하게 유지하며 다음 할 말을 자연스럽게 생성하세요. 다른 설명 없이 오직 대사만 출력하세요.
+"""
 
-##############################
-def generate_basic_report(history_list: list[DialogueHistoryEntry], crime_type: str) -> dict:
-    history_for_prompt = "\n".join([f"{entry.role}: {entry.text}" for entry in history_list])
-    prompt = f"""
+# 기본 리포트 호출은 같은 세션의 기본/프리미엄 리포트가 공유하는 분석 결과(SessionAnalysis)를 만듭니다.
+_BASIC_REPORT_PREFIX = """
 # ROLE
 당신은 금융사기 대응을 평가하는 냉정한 'AI 금융사기 분석가'입니다.
 
-# DIALOGUE HISTORY
-{history_for_prompt}
-
 # INSTRUCTION
-1.  **분석:** 위 대화 기록 전체를 보고, 사용자의 대응에서 나타난 핵심적인 문제점과 잘한 점을 분석하세요.
+1.  **분석:** 아래 대화 기록 전체를 보고, 사용자의 대응에서 나타난 핵심적인 문제점과 잘한 점을 분석하세요.
 2.  **등급 결정:** 분석 결과를 바탕으로, 사용자의 대응 수준을 **'A', 'B', 'C', 'F' 4개 등급 중 '하나만'**으로 최종 판정하세요.
-3.  **내용 생성:** 당신이 내린 등급과 분석 내용에 맞춰, 아래 OUTPUT FORMAT의 각 필드에 들어갈 내용을 간결하게 작성하세요.
-4.  **형식 준수:** 결과는 반드시 아래 JSON 형식과 키를 완벽하게 준수해야 하며, 다른 어떤 텍스트도 추가하지 마세요.
+3.  **위험했던 대응:** 사용자의 대응 중 위험했던 턴을 위험도가 높은 순서로 최대 3개 골라, 사용자의 선택지를 정확히 인용하고 위험했던 이유를 적으세요. (위험한 대응이 없었다면 빈 목록)
+4.  **내용 생성:** 당신이 내린 등급과 분석 내용에 맞춰, 아래 OUTPUT FORMAT의 각 필드에 들어갈 내용을 간결하게 작성하세요.
+5.  **형식 준수:** 결과는 반드시 아래 JSON 형식과 키를 완벽하게 준수해야 하며, 다른 어떤 텍스트도 추가하지 마세요.
 
 
 # OUTPUT (JSON ONLY)
-{{
+{
   "grade": "[대응 수준 평가: A, B, C, F 중 한가지]",
   "summary": "[AI 한 줄 총평: 사용자의 대응에 대한 핵심적인 요약 평가]",
   "caution_point": "[이런 점은 주의하세요: 대화 중 가장 위험했거나 아쉬웠던 대응 '하나'를 구체적으로 지적]",
-  "guide": "[한 줄 가이드: 이번 시뮬레이션 경험을 통해 사용자가 얻어야 할 가장 중요한 행동 지침 하나]"
-}}
+  "guide": "[한 줄 가이드: 이번 시뮬레이션 경험을 통해 사용자가 얻어야 할 가장 중요한 행동 지침 하나]",
+  "critical_moments": [
+    {
+      "turn_number": [대화 턴 번호],
+      "user_message": "[대화 인용: 해당 턴에서 사용자가 선택한 선택지 내용 정확히 인용]",
+      "risk_analysis": "[위험 분석: 인용한 대응이 왜 위험했는지]"
+    }
+  ]
+}
 """
-        # --- [디버깅을 위한 print문 추가] ---
-    print("--- 최종 프롬프트 (Basic Report) ---")
-    print(prompt)
-    print("------------------------------------")
-
-    try:
-        response = GEMINI_FLASH_MODEL.generate_content(prompt)
-        return json.loads(response.text.strip().strip("```json\n").strip("```"))
-    except Exception as e:
-        print(f"[Error] 기본 리포트 생성 실패: {e}")
-        return {"error": "리포트 생성 실패"}
-
 
-##############################
-def generate_premium_report(history_list: list[DialogueHistoryEntry], crime_type: str) -> dict:
-    history_for_prompt = "\n".join([f"{entry.role}: {entry.text}" for entry in history_list])
-    
-    # --- [수정 완료] ---
-    # 빅카인즈 뉴스 검색은 AI 서버의 책임이 아니므로, 관련 로직을 제거하고
-    # 프롬프트도 해당 변수를 사용하지 않도록 수정합니다.
+def _premium_report_prefix(crime_type: str) -> str:
+    # 빅카인즈 뉴스 검색은 AI 서버의 책임이 아니므로, 프롬프트에서 참고 뉴스 변수를 사용하지 않습니다.
     # BE와의 최종 협의에 따라, 참고 뉴스 기능은 추후 추가하거나 BE에서 처리합니다.
-
-    prompt = f"""
+    return f"""
 # ROLE
 당신은 '금융사기 전문 변호사'입니다. 당신의 목표는 아래 대화 기록을 법률적 관점에서 분석하고, 사용자의 대응 방식에 대한 명확하고 전문적인 피드백 리포트를 작성하는 것입니다.
 
 # CONTEXT
-아래는 사용자와 사기꾼 간의 '{crime_type}' 시뮬레이션 전체 대화 기록입니다. 이 기록을 법률적, 심리적 관점에서 면밀히 분석해야 합니다.
-
-# DIALOGUE HISTORY
-{history_for_prompt}
+아래 DIALOGUE HISTORY는 사용자와 사기꾼 간의 '{crime_type}' 시뮬레이션 전체 대화 기록입니다. 이 기록을 법률적, 심리적 관점에서 면밀히 분석해야 합니다.
+SESSION ANALYSIS는 이 대화에 대해 이미 확정된 분석 결과(등급, 위험했던 대응)로, 사용자가 먼저 받아 본 기본 리포트와 같은 내용입니다.
 
 # INSTRUCTION
-1.  **분석:** 위 대화 기록 전체를 법률적 관점에서 면밀히 분석하세요.
-2.  **등급 결정:** 분석 결과를 바탕으로, **'A', 'B', 'C', 'F' 4개 등급 중 '하나만'**으로 최종 판정하세요.
-3.  **내용 생성:** 당신이 내린 등급과 분석 내용에 맞춰, 아래 OUTPUT FORMAT의 각 필드에 들어갈 내용을 전문적으로 작성하세요.
+1.  **분석:** 대화 기록 전체를 법률적 관점에서 면밀히 분석하세요.
+2.  **등급 유지:** 등급은 SESSION ANALYSIS의 grade를 그대로 사용하세요. 기본 리포트와 다른 등급을 매기면 안 됩니다.
+3.  **내용 생성:** SESSION ANALYSIS의 위험했던 대응을 중심으로, 아래 OUTPUT FORMAT의 각 필드에 들어갈 내용을 전문적으로 작성하세요.
 4.  **형식 준수:** 결과는 반드시 아래 JSON 형식과 키를 완벽하게 준수해야 하며, 다른 어떤 텍스트도 추가하지 마세요.
 
 # OUTPUT (JSON ONLY)
@@ -180,7 +386,7 @@ def generate_premium_report(history_list: list[DialogueHistoryEntry], crime_type
   }},
   "critical_moments": [
     {{
-      "turn_number": "[대화 턴 번호: 가장 치명적이었던 턴의 숫자]",
+      "turn_number": [대화 턴 번호: 가장 치명적이었던 턴의 숫자],
       "user_message": "[대화 인용: 해당 턴에서 사용자가 선택한 선택지 내용 정확히 인용] ",
       "risk_analysis": "[위험 분석: 인용한 발언의 어떤 부분이 왜 법적으로 위험했는지]",
       "legal_advice": "[법률 조언: 해당 상황에서 했어야 할 가장 이상적인 법률적 대응 방법 제시]"
@@ -190,36 +396,16 @@ def generate_premium_report(history_list: list[DialogueHistoryEntry], crime_type
   "references": []
 }}
 """
-    try:
-        response = GEMINI_PRO_MODEL.generate_content(prompt)
-        result_dict = json.loads(response.text.strip().strip("```json\n").strip("```"))
-        return result_dict
-    except Exception as e:
-        print(f"[Error] 프리미엄 리포트 생성 실패: {e}")
-        return {"error": "리포트를 생성하는 중 오류가 발생했습니다."}
-
-
-##############################
-def diagnose_text_risk(text_to_diagnose: str) -> dict:
-    
-    if not GOOGLE_API_KEY or not GEMINI_FLASH_MODEL:
-        # ... (안전 장치) ...
-        return {"error": "AI 서버 설정에 문제가 발생했습니다."}
-    
-    # 빠른 응답이 중요하므로 Flash 모델을 사용합니다.
 
-    prompt = f"""
+_DIAGNOSE_PREFIX = """
 # ROLE
 당신은 금융사기 메세지 탐지 전문 AI '세이프가드'입니다.
 
 # CONTEXT
 사용자가 의심스러운 문자 메시지 또는 계약서의 일부 내용을 전달했습니다. 이 텍스트에 전세사기, 보이스피싱, 스미싱 등 금융사기와 관련된 위험 요소가 포함되어 있는지 분석해야 합니다.
 
-# TEXT FOR DIAGNOSIS
-{text_to_diagnose}
-
 # INSTRUCTION
-1.  위 텍스트를 분석하여, 금융사기 위험도를 **'위험', '주의', '관심' 3단계 중 하나로만** 판정하세요.
+1.  아래 TEXT FOR DIAGNOSIS를 분석하여, 금융사기 위험도를 **'위험', '주의', '관심' 3단계 중 하나로만** 판정하세요.
 2.  판정된 위험도에 어울리는 '상황 요약 제목(title)'을 생성하세요.
 3.  판단의 핵심 근거를 'AI 분석 요약(summary)'과 '한 줄 가이드(guide)'로 나누어 작성해주세요.
 4.  텍스트에서 가장 위험하다고 판단되는 핵심 키워드를 정확히 3개만 추출해주세요.
@@ -227,25 +413,293 @@ def diagnose_text_risk(text_to_diagnose: str) -> dict:
 
 
 # OUTPUT FORMAT (JSON ONLY)
-{{
+{
   "risk_level": "[위험 레벨: 위험, 주의, 관심 중 한가지]",
   "title": "[위험도에 맞는 상황 요약 제목]",
-  "detected_keywords": "[탐지된 위험 키워드 목록: 핵심 위험 키워드 1, 핵심 위험 키워드 2, 핵심 위험 키워드 3]",
+  "detected_keywords": ["핵심 위험 키워드 1", "핵심 위험 키워드 2", "핵심 위험 키워드 3"],
   "summary": "[AI 분석 요약: 이 텍스트가 왜 해당 위험 등급으로 판정되었는지에 대한 핵심 분석 내용]",
   "guide": "[한 줄 가이드: 사용자가 이 메시지에 대해 어떻게 행동해야 하는지에 대한 명확한 지침]"
-}}
+}
+"""
+
+_TEMPLATES = TemplateRegistry()
+for _crime_type in PERSONA_PROMPTS:
+    _TEMPLATES.register("adaptive_turn", _crime_type, _adaptive_prefix(_crime_type, streaming=False))
+    _TEMPLATES.register("adaptive_turn_stream", _crime_type, _adaptive_prefix(_crime_type, streaming=True))
+    _TEMPLATES.register("premium_report", _crime_type, _premium_report_prefix(_crime_type))
+_TEMPLATES.register("voice_turn", _VOICE_CRIME_TYPE, _voice_prefix(_VOICE_CRIME_TYPE))
+_TEMPLATES.register("basic_report", None, _BASIC_REPORT_PREFIX)
+_TEMPLATES.register("diagnose", None, _DIAGNOSE_PREFIX)
+
+async def register_prompt_caches() -> None:
+    """(서버 시작 시) 고정 프롬프트를 Gemini 캐시 컨텍스트로 등록하고 템플릿별 토큰 수를 측정합니다."""
+    # 모델 생성(라이브러리 import, 인증)은 블로킹이므로 스레드에서 만듭니다.
+    models = [await asyncio.to_thread(get_gemini_model, tier) for tier in GEMINI_MODEL_NAMES]
+    await _TEMPLATES.register_cached_contexts(models)
+
+def template_stats() -> list[dict]:
+    return _TEMPLATES.stats()
+
+# --- 가변 프롬프트 빌더 (일반/스트리밍 엔드포인트 공용) ---
+def _build_adaptive_dynamic(crime_type: str, history_list: list[DialogueHistoryEntry], highest_vulnerability_axis: str) -> str:
+    history_for_prompt = _CONTEXT.render(history_list, "adaptive_turn")
+    # 최근 대화와 키워드가 겹치는 실제 사기 패턴을 참고 자료로 덧붙입니다.
+    recent_text = " ".join(entry.text for entry in history_list[-2:])
+    reference_patterns = pattern_service.render_for_prompt(crime_type, PATTERN_TEXT_MODE, recent_text)
+
+    if highest_vulnerability_axis:
+        vulnerability = f"지금까지의 대화를 통해 파악된 사용자의 가장 큰 취약점은 '{highest_vulnerability_axis}' 입니다."
+    else:
+        # 채점된 턴이 아직 없는 초반에는 취약점을 단정하지 않고 여러 방식으로 떠보게 합니다.
+        vulnerability = "아직 파악된 취약점이 없습니다. 권위, 공포, 이익 등 여러 방식으로 사용자의 반응을 떠보세요."
+    return f"""
+{reference_patterns}[사용자 취약점]
+{vulnerability}
+
+[이전 대화 기록]
+{history_for_prompt}
+"""
+
+def _build_voice_dynamic(history_for_prompt: str, user_message: str) -> str:
+    history_for_prompt += f"\nUSER: {user_message}"
+    reference_patterns = pattern_service.render_for_prompt(_VOICE_CRIME_TYPE, PATTERN_VOICE_MODE, user_message)
+
+    return f"""
+{reference_patterns}# DIALOGUE HISTORY
+{history_for_prompt}
+AI: 
+"""
+
+# --- 핵심 기능 함수 ---
+##############################
+async def generate_adaptive_turn(crime_type: str, history_list: list[DialogueHistoryEntry], highest_vulnerability_axis: str) -> dict:
+    template = _TEMPLATES.get("adaptive_turn", crime_type, _DEFAULT_CRIME_TYPE)
+    with stage("prompt_build"):
+        prompt = _build_adaptive_dynamic(crime_type, history_list, highest_vulnerability_axis)
+    try:
+        result = await _generate_structured(prompt, AdaptiveTurnResponse, "adaptive_turn", template)
+        return result.model_dump()
+    except OverloadedError:
+        # 과부하는 기본값으로 감추지 않고 호출자에게 전달합니다. (API는 503 + Retry-After로 응답)
+        raise
+    except Exception as e:
+        _LOG.error("적응형 턴 생성 실패", error=str(e))
+        return {"error": "AI 응답 생성 실패", "next_speech": "오류 발생", "options": []}
+
+##############################
+async def generate_voice_turn(history_list: list[DialogueHistoryEntry], user_message: str) -> str:
+    template = _TEMPLATES.get("voice_turn", _VOICE_CRIME_TYPE)
+    with stage("prompt_build"):
+        prompt = _build_voice_dynamic(_CONTEXT.render(history_list, "voice_turn"), user_message)
+    try:
+        response = await _call_model("voice_turn", prompt, template)
+        return response.text.strip().replace("AI:", "").strip()
+    except OverloadedError:
+        # 과부하는 기본값으로 감추지 않고 호출자에게 전달합니다. (API는 503 + Retry-After로 응답)
+        raise
+    except Exception as e:
+        _LOG.error("음성 턴 생성 실패", error=str(e))
+        return "응답 생성에 실패했습니다."
+
+
+##############################
+# 스트리밍 턴: (event, data) 튜플을 순서대로 내보내며, SSE 직렬화는 main.py가 담당합니다.
+_SENTENCE_END_RE = re.compile(r"[.?!…\n]+")
+
+async def stream_adaptive_turn(crime_type: str, history_list: list[DialogueHistoryEntry], highest_vulnerability_axis: str):
+    """
+    적응형 턴을 스트리밍으로 생성합니다.
+    - 'token' 이벤트로 next_speech를 먼저 흘려보내고,
+    - 구분자 이후의 선택지 JSON은 모아서 마지막에 'options' 이벤트로 한 번에 보냅니다.
+    """
+    template = _TEMPLATES.get("adaptive_turn_stream", crime_type, _DEFAULT_CRIME_TYPE)
+    with stage("prompt_build"):
+        prompt = _build_adaptive_dynamic(crime_type, history_list, highest_vulnerability_axis)
+    speech = ""
+    pending = ""        # 구분자가 청크 경계에 걸칠 수 있으므로 아직 내보내지 않은 꼬리
+    options_raw = None  # 구분자를 만난 뒤부터 누적되는 선택지 JSON
+    try:
+        async for piece in _stream_async(*_TEMPLATES.bind(template, _ROUTER.model_for("adaptive_turn"), prompt), "adaptive_turn"):
+            if options_raw is not None:
+                options_raw += piece
+                continue
+            pending += piece
+            if _OPTIONS_DELIMITER in pending:
+                head, options_raw = pending.split(_OPTIONS_DELIMITER, 1)
+                pending = ""
+            else:
+                cut = len(pending) - (len(_OPTIONS_DELIMITER) - 1)
+                head, pending = (pending[:cut], pending[cut:]) if cut > 0 else ("", pending)
+            if head:
+                if not speech:
+                    head = head.lstrip()
+                speech += head
+                yield "token", {"text": head}
+        if pending:
+            speech += pending
+            yield "token", {"text": pending}
+
+        stats = _structured_stats("adaptive_turn_stream")
+        stats["calls"] += 1
+        try:
+            with stage("parse"):
+                cleaned = (options_raw or "").strip().removeprefix("```json").removesuffix("```")
+                options = [AdaptiveOption.model_validate(option).model_dump() for option in json.loads(cleaned)]
+        except (ValueError, TypeError, ValidationError) as e:
+            _LOG.error("스트리밍 선택지 파싱 실패", error=str(e))
+            stats["parse_failures"] += 1
+            stats["failed"] += 1
+            options = []
+        yield "options", {"next_speech": speech.strip(), "options": options}
+    except OverloadedError as e:
+        # 스트림은 이미 응답이 시작되었으므로, 재시도 가능 시각을 error 이벤트로 알립니다.
+        yield "error", {"error": "요청이 많아 잠시 후 다시 시도해주세요.", "retry_after": math.ceil(e.retry_after)}
+    except Exception as e:
+        _LOG.error("적응형 턴 스트리밍 실패", error=str(e))
+        yield "error", {"error": "AI 응답 생성 실패"}
+    yield "done", {}
+
+async def stream_voice_turn(history_list: list[DialogueHistoryEntry], user_message: str):
+    """
+    음성 턴을 스트리밍으로 생성합니다.
+    - 'token' 이벤트: 모델 출력 조각을 그대로 전달
+    - 'sentence' 이벤트: 문장 경계가 확정될 때마다 완성된 문장을 전달 (TTS가 바로 읽기 시작할 수 있도록)
+    """
+    with stage("prompt_build"):
+        prompt = _build_voice_dynamic(_CONTEXT.render(history_list, "voice_turn"), user_message)
+    async for event in _stream_voice(prompt):
+        yield event
+
+def create_voice_context(max_retained_turns: int) -> SessionContext:
+    """음성 세션(WebSocket)이 대화 기록을 서버에 보관할 증분 컨텍스트 (요약은 무상태 엔드포인트와 공유)"""
+    return _CONTEXT.session(max_retained_turns)
+
+async def stream_voice_session_turn(context: SessionContext, user_message: str):
+    """
+    서버가 보관 중인 세션 컨텍스트로 음성 턴을 스트리밍합니다. (이벤트는 stream_voice_turn과 동일)
+    대화 기록을 다시 검증/포맷하지 않고, 세션에 쌓아 둔 최근 턴 문자열만 이어 붙여 프롬프트를 만듭니다.
+    """
+    with stage("prompt_build"):
+        prompt = _build_voice_dynamic(context.render("voice_turn"), user_message)
+    async for event in _stream_voice(prompt):
+        yield event
+
+async def _stream_voice(prompt: str):
+    template = _TEMPLATES.get("voice_turn", _VOICE_CRIME_TYPE)
+    buffer = ""
+    started = False
+    try:
+        async for piece in _stream_async(*_TEMPLATES.bind(template, _ROUTER.model_for("voice_turn"), prompt), "voice_turn"):
+            if not started:
+                # 모델이 붙이는 'AI:' 접두어는 첫 조각에서만 제거합니다.
+                piece = piece.lstrip().removeprefix("AI:").lstrip()
+                if not piece:
+                    continue
+                started = True
+            yield "token", {"text": piece}
+            buffer += piece
+            # 문장부호 연속("...", "?!")이 다음 조각으로 이어질 수 있으므로,
+            # 부호 뒤에 다른 글자가 붙은 경우에만 문장을 확정합니다.
+            while (match := _SENTENCE_END_RE.search(buffer)) and match.end() < len(buffer):
+                sentence, buffer = buffer[:match.end()].strip(), buffer[match.end():]
+                if sentence:
+                    yield "sentence", {"text": sentence}
+        if buffer.strip():
+            yield "sentence", {"text": buffer.strip()}
+    except OverloadedError as e:
+        # 스트림은 이미 응답이 시작되었으므로, 재시도 가능 시각을 error 이벤트로 알립니다.
+        yield "error", {"error": "요청이 많아 잠시 후 다시 시도해주세요.", "retry_after": math.ceil(e.retry_after)}
+    except Exception as e:
+        _LOG.error("음성 턴 스트리밍 실패", error=str(e))
+        yield "error", {"error": "응답 생성에 실패했습니다."}
+    yield "done", {}
+
+
+##############################
+async def analyze_report_session(history_list: list[DialogueHistoryEntry], crime_type: str, grade: str | None = None) -> dict:
+    """
+    기본/프리미엄 리포트가 공유하는 세션 분석(등급, 총평, 위험했던 대응)을 생성합니다.
+    grade가 있으면(대화 기록의 verdict로 계산한 결정적 등급) 그 등급을 그대로 쓰고, 내용만 생성합니다.
+    실패 시 예외를 그대로 전달합니다. (실패 결과가 캐시되지 않도록 기본값 채우기는 report_service가 담당)
+    """
+    template = _TEMPLATES.get("basic_report")
+    with stage("prompt_build"):
+        # 리포트는 사용자 대응을 평가/인용하므로 요약 없이 원문 턴만 사용합니다. (예산 초과 시 오래된 AI 대사부터 생략)
+        history_for_prompt = _CONTEXT.render_verbatim(history_list, "basic_report")
+        fixed_grade = f"""
+# GRADE (확정)
+{grade}
+등급은 채점 결과로 이미 확정되었습니다. grade에는 이 값을 그대로 쓰고, 나머지 내용을 이 등급에 맞게 작성하세요.
+""" if grade else ""
+        prompt = f"""
+# CRIME TYPE
+{crime_type}
+{fixed_grade}
+# DIALOGUE HISTORY
+{history_for_prompt}
+"""
+    _LOG.debug("세션 분석 프롬프트 생성", crime_type=crime_type, turns=len(history_list), dynamic_tokens=estimate_tokens(prompt))
+    result = (await _generate_structured(prompt, SessionAnalysis, "basic_report", template)).model_dump()
+    if grade:
+        result["grade"] = grade
+    return result
+
+
+##############################
+async def generate_premium_report(history_list: list[DialogueHistoryEntry], crime_type: str, analysis: dict) -> dict:
+    """
+    확정된 세션 분석을 바탕으로 프리미엄 리포트를 생성합니다. 등급은 분석 결과와 항상 같습니다.
+    실패 시 예외를 그대로 전달합니다.
+    """
+    template = _TEMPLATES.get("premium_report", crime_type, _DEFAULT_CRIME_TYPE)
+    with stage("prompt_build"):
+        # 리포트는 사용자 대응을 평가/인용하므로 요약 없이 원문 턴만 사용합니다. (예산 초과 시 오래된 AI 대사부터 생략)
+        history_for_prompt = _CONTEXT.render_verbatim(history_list, "premium_report")
+        prompt = f"""
+# SESSION ANALYSIS
+{json.dumps(analysis, ensure_ascii=False)}
+
+# DIALOGUE HISTORY
+{history_for_prompt}
+"""
+    result = (await _generate_structured(prompt, PremiumReportResponse, "premium_report", template)).model_dump()
+    result["overall_evaluation"]["grade"] = analysis["grade"]
+    return result
+
+
+##############################
+async def diagnose_text_risk(text_to_diagnose: str) -> dict:
+    
+    if not (GOOGLE_API_KEY or AI_OFFLINE):
+        # ... (안전 장치) ...
+        return {"error": "AI 서버 설정에 문제가 발생했습니다."}
+    
+    # 빠른 응답이 중요하므로, Pro 지연이 SLO를 넘거나 오류가 잦으면 라우터가 Flash로 강등합니다.
+
+    # 공백/URL/숫자만 다른 같은 문자는 이전 진단 결과를 그대로 재사용합니다.
+    cache_key = hash_text(text_to_diagnose)
+    cached_result = await DIAGNOSIS_CACHE.aget(cache_key)
+    if cached_result is not None:
+        return cached_result
+
+    template = _TEMPLATES.get("diagnose")
+    prompt = f"""
+# TEXT FOR DIAGNOSIS
+{text_to_diagnose}
 """
     try:
-        response = GEMINI_PRO_MODEL.generate_content(prompt)
-        cleaned_response = response.text.strip().strip("```json\n").strip("```")
-        return json.loads(cleaned_response)
-        #return json.loads(response.text.strip().strip("```json\n").strip("```"))
+        result = (await _generate_structured(prompt, DiagnosisResponse, "diagnose", template)).model_dump()
+        await DIAGNOSIS_CACHE.aset(cache_key, result)
+        return result
+    except OverloadedError:
+        # 과부하는 기본값으로 감추지 않고 호출자에게 전달합니다. (API는 503 + Retry-After로 응답)
+        raise
     except Exception as e:
-        print(f"[Error] 실시간 진단 실패: {e}")
+        _LOG.error("실시간 진단 실패", error=str(e))
         return {
             "risk_level": "오류",
             "title": "분석 중 오류 발생",
             "detected_keywords": [],
             "summary": "AI가 분석하는 데 실패했습니다. 잠시 후 다시 시도해주세요.",
             "guide": "네트워크 상태를 확인하거나, 다른 이미지를 사용해보세요."
-        }
\ No newline at end of file
+        }
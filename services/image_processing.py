@@ -0,0 +1,110 @@
+"""
+이미지 전처리 (프로세스 풀 작업자에서 실행).
+
+이 모듈은 spawn된 작업 프로세스가 import하므로, Pillow 외의 무거운 모듈(FastAPI, Google SDK 등)을 import하지 않습니다.
+"""
+import io
+import math
+
+# 매직 바이트 -> 형식 (Vision TEXT_DETECTION이 지원하는 형식만 허용)
+_MAGIC_NUMBERS = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+)
+
+# 지각 해시(dHash) 크기: 17x16 회색조 축소 이미지의 가로 인접 픽셀 비교 -> 256비트
+_HASH_SIZE = 16
+
+
+class ImageDecodeError(ValueError):
+    """이미지를 디코딩할 수 없음 (reason: too_many_pixels, undecodable). 프로세스 간에 전달되도록 표준 인자만 사용합니다."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def detect_format(head: bytes) -> str | None:
+    """파일 앞부분의 매직 바이트로 이미지 형식을 판별합니다. (확장자/Content-Type은 신뢰하지 않음)"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for magic, image_format in _MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return image_format
+    return None
+
+
+def difference_hash(image) -> str:
+    """이미지의 256비트 dHash를 16진수 문자열로 반환합니다. (상태 표시줄 시각 등 작은 차이에는 거의 변하지 않음)"""
+    from PIL import Image
+
+    small = image.convert("L").resize((_HASH_SIZE + 1, _HASH_SIZE), Image.Resampling.BOX)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(_HASH_SIZE):
+        offset = row * (_HASH_SIZE + 1)
+        for col in range(_HASH_SIZE):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:0{_HASH_SIZE * _HASH_SIZE // 4}x}"
+
+
+def prepare_for_ocr(content: bytes, max_pixels: int, jpeg_quality: int, max_decode_pixels: int) -> dict:
+    """작업 프로세스 진입점. Pillow 예외를 ImageDecodeError로 바꿔 전달합니다."""
+    from PIL import Image
+
+    # 압축 폭탄(작은 파일, 거대한 해상도) 방지: 헤더의 크기로 먼저 확인하고, Pillow 자체 한도도 함께 둡니다.
+    Image.MAX_IMAGE_PIXELS = max_decode_pixels
+    try:
+        return _prepare(content, max_pixels, jpeg_quality, max_decode_pixels)
+    except ImageDecodeError:
+        raise
+    except Image.DecompressionBombError:
+        raise ImageDecodeError("too_many_pixels") from None
+    except (OSError, SyntaxError, ValueError):
+        raise ImageDecodeError("undecodable") from None
+
+
+def _prepare(content: bytes, max_pixels: int, jpeg_quality: int, max_decode_pixels: int) -> dict:
+    """
+    OCR에 필요한 해상도로 줄이고 다시 인코딩한 이미지와 지각 해시를 반환합니다.
+    - EXIF 회전을 반영하고, 투명 배경은 흰색으로 채웁니다.
+    - 픽셀 수가 max_pixels 이하면 크기를 유지하며, 다시 인코딩한 결과가 원본보다 크면 원본을 그대로 사용합니다.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(content)) as image:
+        original_format = (image.format or "").lower()
+        width, height = image.size
+        if width * height > max_decode_pixels:
+            raise ImageDecodeError("too_many_pixels")
+        scale = min(1.0, math.sqrt(max_pixels / (width * height)))
+        target = (max(1, round(width * scale)), max(1, round(height * scale)))
+        # JPEG는 디코딩 단계에서 1/2, 1/4, 1/8로 줄여 읽을 수 있어 큰 사진의 처리 시간이 크게 줄어듭니다.
+        if scale < 1.0:
+            image.draft("RGB", target)
+        image = ImageOps.exif_transpose(image)
+
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        resized = scale < 1.0
+        if scale < 1.0:
+            image = image.resize(target, Image.Resampling.LANCZOS)
+        phash = difference_hash(image)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=jpeg_quality, optimize=True)
+        encoded = buffer.getvalue()
+
+    if not resized and len(encoded) >= len(content):
+        return {"content": content, "format": original_format, "size": (width, height), "phash": phash, "resized": False}
+    return {"content": encoded, "format": "jpeg", "size": image.size, "phash": phash, "resized": resized}
@@ -0,0 +1,256 @@
+import json
+import asyncio
+import hashlib
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import UploadFile
+
+from config import (
+    IMAGE_MAX_BYTES, IMAGE_OCR_MAX_PIXELS, IMAGE_MAX_DECODE_PIXELS, IMAGE_JPEG_QUALITY, IMAGE_PROCESS_WORKERS,
+    IMAGE_NEAR_DUPLICATE_DISTANCE, IMAGE_NEAR_DUPLICATE_INDEX_SIZE, DIAGNOSE_MAX_IMAGES
+)
+from services import image_processing
+from services.log_service import get_logger
+from services.metrics_service import stage
+
+_LOG = get_logger("image")
+
+# 업로드를 나눠 읽는 단위 (전체를 한 번에 메모리로 읽지 않음)
+_READ_CHUNK_BYTES = 64 * 1024
+# 형식 판별에 필요한 앞부분 바이트 수
+_MAGIC_HEAD_BYTES = 16
+# multipart 경계/헤더 등 파일 외 본문 크기 여유분 (파일 1개당)
+_MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# 경로별 요청 본문 최대 크기 (파일 크기 제한 + multipart 여유분)
+_UPLOAD_LIMITS = {
+    "/diagnose/image": IMAGE_MAX_BYTES + _MULTIPART_OVERHEAD_BYTES,
+    "/diagnose/images": (IMAGE_MAX_BYTES + _MULTIPART_OVERHEAD_BYTES) * DIAGNOSE_MAX_IMAGES,
+}
+
+# 거절 사유 -> (HTTP 상태 코드, 메시지)
+_REJECTIONS = {
+    "too_large": (413, f"이미지는 최대 {IMAGE_MAX_BYTES // (1024 * 1024)}MB까지 업로드할 수 있습니다."),
+    "too_many_pixels": (413, "이미지 해상도가 너무 큽니다."),
+    "unsupported_format": (415, "지원하지 않는 이미지 형식입니다. (JPEG, PNG, GIF, WEBP, BMP, TIFF)"),
+    "undecodable": (400, "이미지 파일이 손상되었거나 읽을 수 없습니다."),
+}
+
+_STATS = {
+    "processed": 0,            # 전처리를 마친 이미지 수
+    "resized": 0,              # OCR 해상도로 축소한 이미지 수
+    "bytes_in": 0,             # 전처리 전 원본 크기 합계
+    "bytes_out": 0,            # Vision으로 보낸 크기 합계
+    "rejected": {reason: 0 for reason in _REJECTIONS},
+    "near_duplicates": 0,      # 이전 이미지와 근사 중복으로 인식된 수
+    "pool_fallbacks": 0,       # 전처리 프로세스 오류로 원본을 그대로 사용한 수
+}
+
+
+class ImageRejectedError(Exception):
+    """업로드 이미지를 처리할 수 없음 (크기 초과, 지원하지 않는 형식, 손상된 파일)"""
+
+    def __init__(self, reason: str, prefix: str = ""):
+        self.reason = reason
+        self.status_code, message = _REJECTIONS[reason]
+        self.message = f"{prefix}{message}"
+        super().__init__(self.message)
+
+
+def _reject(reason: str, prefix: str = "") -> ImageRejectedError:
+    _STATS["rejected"][reason] += 1
+    return ImageRejectedError(reason, prefix)
+
+
+# --- 전처리 프로세스 풀 ---
+# 이미지 디코딩/축소는 CPU 작업이므로 GIL을 피해 별도 프로세스에서 실행합니다.
+# gRPC 등 스레드를 가진 부모 프로세스를 fork하지 않도록 spawn 방식을 사용하며, 처음 사용할 때 생성합니다.
+_POOL: ProcessPoolExecutor | None = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(
+            max_workers=IMAGE_PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _POOL
+
+
+async def warm_up() -> None:
+    """작업 프로세스를 미리 띄워 둡니다. (spawn 비용을 첫 이미지 요청이 부담하지 않도록)"""
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    await asyncio.gather(*(
+        loop.run_in_executor(pool, image_processing.detect_format, b"")
+        for _ in range(IMAGE_PROCESS_WORKERS)
+    ))
+
+
+def shutdown() -> None:
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = None
+
+
+# --- 근사 중복 색인 (지각 해시 -> 해당 이미지의 OCR 캐시 키, 최근 사용 순) ---
+_NEAR_DUPLICATES: OrderedDict[int, str] = OrderedDict()
+
+
+def find_near_duplicate(phash: str | None) -> str | None:
+    """해밍 거리가 IMAGE_NEAR_DUPLICATE_DISTANCE 이하인 이전 이미지의 OCR 캐시 키를 반환합니다."""
+    if not phash or IMAGE_NEAR_DUPLICATE_DISTANCE <= 0:
+        return None
+    value = int(phash, 16)
+    best_key, best_distance = None, IMAGE_NEAR_DUPLICATE_DISTANCE + 1
+    # 색인은 수천 개 이하이고 XOR/비트 수 세기만 하므로 전체를 훑어도 1ms 안쪽입니다.
+    for known, cache_key in _NEAR_DUPLICATES.items():
+        distance = (value ^ known).bit_count()
+        if distance < best_distance:
+            best_key, best_distance = known, distance
+    if best_key is None:
+        return None
+    _NEAR_DUPLICATES.move_to_end(best_key)
+    _STATS["near_duplicates"] += 1
+    return _NEAR_DUPLICATES[best_key]
+
+
+def remember(phash: str | None, cache_key: str) -> None:
+    if not phash or IMAGE_NEAR_DUPLICATE_DISTANCE <= 0:
+        return
+    value = int(phash, 16)
+    _NEAR_DUPLICATES[value] = cache_key
+    _NEAR_DUPLICATES.move_to_end(value)
+    while len(_NEAR_DUPLICATES) > IMAGE_NEAR_DUPLICATE_INDEX_SIZE:
+        _NEAR_DUPLICATES.popitem(last=False)
+
+
+# --- 업로드 읽기 / 전처리 ---
+
+async def read_upload(upload: UploadFile, prefix: str = "") -> tuple[bytes, str]:
+    """
+    업로드를 나눠 읽으면서 크기 제한을 확인하고, 내용 해시(OCR 캐시 키)를 함께 계산합니다.
+    제한을 넘는 순간 읽기를 멈추고 413으로 거절합니다.
+    """
+    digest = hashlib.sha256()
+    chunks = []
+    size = 0
+    while chunk := await upload.read(_READ_CHUNK_BYTES):
+        size += len(chunk)
+        if size > IMAGE_MAX_BYTES:
+            raise _reject("too_large", prefix)
+        digest.update(chunk)
+        chunks.append(chunk)
+    return b"".join(chunks), digest.hexdigest()
+
+
+async def prepare(content: bytes, prefix: str = "") -> dict:
+    """
+    형식을 확인하고 OCR용으로 축소/재인코딩한 이미지와 지각 해시를 반환합니다.
+    - 반환: {"content": bytes, "format": str, "size": (w, h), "phash": str | None, "resized": bool}
+    - 전처리 프로세스에 문제가 생기면 원본을 그대로 반환합니다. (phash 없음)
+    """
+    image_format = image_processing.detect_format(content[:_MAGIC_HEAD_BYTES])
+    if image_format is None:
+        raise _reject("unsupported_format", prefix)
+
+    loop = asyncio.get_running_loop()
+    try:
+        with stage("image_preprocess"):
+            prepared = await loop.run_in_executor(
+                _get_pool(), image_processing.prepare_for_ocr,
+                content, IMAGE_OCR_MAX_PIXELS, IMAGE_JPEG_QUALITY, IMAGE_MAX_DECODE_PIXELS
+            )
+    except image_processing.ImageDecodeError as e:
+        raise _reject(e.reason, prefix) from None
+    except BrokenProcessPool as e:
+        # 작업 프로세스가 죽은 경우(메모리 부족 등) 다음 요청에서 풀을 새로 만들고, 이번 이미지는 원본으로 OCR합니다.
+        _LOG.warning("이미지 전처리 프로세스 오류, 원본 사용", error=str(e))
+        shutdown()
+        _STATS["pool_fallbacks"] += 1
+        prepared = {"content": content, "format": image_format, "size": None, "phash": None, "resized": False}
+
+    _STATS["processed"] += 1
+    _STATS["resized"] += prepared["resized"]
+    _STATS["bytes_in"] += len(content)
+    _STATS["bytes_out"] += len(prepared["content"])
+    return prepared
+
+
+def image_stats() -> dict:
+    return {
+        **_STATS,
+        "rejected": dict(_STATS["rejected"]),
+        "bytes_saved_ratio": round(1 - _STATS["bytes_out"] / _STATS["bytes_in"], 4) if _STATS["bytes_in"] else 0.0,
+        "near_duplicate_index_size": len(_NEAR_DUPLICATES),
+        "pool_started": _POOL is not None,
+    }
+
+
+class UploadLimitMiddleware:
+    """
+    이미지 업로드 경로의 요청 본문 크기를 제한하는 ASGI 미들웨어.
+    Content-Length가 한도를 넘으면 본문을 읽기 전에 거절하고, 길이를 알 수 없는(chunked) 본문은
+    읽는 동안 누적 크기를 세다가 한도를 넘는 즉시 수신을 중단하고 413으로 응답합니다.
+    (multipart 파싱이 본문 전체를 임시 파일로 받아 두기 전에 끊기 위함)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        limit = _UPLOAD_LIMITS.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                _STATS["rejected"]["too_large"] += 1
+                await _send_too_large(send)
+                return
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            # 한도 초과 후 앱이 만든 응답(파싱 오류 400 등)은 버리고 413을 보냅니다.
+            if not exceeded:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _BodyTooLarge:
+            pass
+        if exceeded:
+            _STATS["rejected"]["too_large"] += 1
+            await _send_too_large(send)
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+async def _send_too_large(send) -> None:
+    status_code, message = _REJECTIONS["too_large"]
+    body = json.dumps({"detail": message}, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"connection", b"close")],
+    })
+    await send({"type": "http.response.body", "body": body})
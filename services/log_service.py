@@ -0,0 +1,76 @@
+import sys
+import json
+import random
+import logging
+import datetime
+
+from config import LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE
+
+# 모든 서비스 로거는 'safeguard' 아래에 만들어지며, 한 곳에서 출력 형식과 레벨을 정합니다.
+_ROOT_LOGGER_NAME = "safeguard"
+
+
+class _StructuredFormatter(logging.Formatter):
+    """로그 한 건을 JSON 한 줄(또는 사람이 읽기 쉬운 key=value 한 줄)로 출력합니다."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        if LOG_FORMAT == "json":
+            return json.dumps(payload, ensure_ascii=False, default=str)
+        fields = " ".join(f"{key}={value}" for key, value in payload.items() if key not in ("ts", "level", "logger", "msg"))
+        return f"{payload['ts']} {record.levelname:<7} [{record.name}] {payload['msg']} {fields}".rstrip()
+
+
+class _SamplingFilter(logging.Filter):
+    """INFO 이하 로그는 sample_rate 비율만 남깁니다. WARNING 이상은 항상 기록합니다."""
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.sample_rate >= 1.0:
+            return True
+        return random.random() < self.sample_rate
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """
+    키워드 인자를 구조화 필드로 붙이는 로거.
+    예) logger.warning("패턴 DB 로드 실패", error=str(e), db_path=path)
+    """
+
+    def process(self, msg, kwargs):
+        fields = {key: kwargs.pop(key) for key in list(kwargs) if key not in ("exc_info", "stack_info", "stacklevel")}
+        kwargs["extra"] = {"fields": fields}
+        return msg, kwargs
+
+
+def _configure_root() -> logging.Logger:
+    root = logging.getLogger(_ROOT_LOGGER_NAME)
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(_StructuredFormatter())
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+    return root
+
+
+_ROOT = _configure_root()
+
+
+def get_logger(name: str, sample_rate: float = LOG_SAMPLE_RATE) -> StructuredLogger:
+    """서비스별 구조화 로거를 반환합니다. sample_rate는 이 로거의 INFO 이하 로그에만 적용됩니다."""
+    logger = _ROOT.getChild(name)
+    if not any(isinstance(f, _SamplingFilter) for f in logger.filters):
+        logger.addFilter(_SamplingFilter(sample_rate))
+    return StructuredLogger(logger, {})
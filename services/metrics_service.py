@@ -0,0 +1,151 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from starlette.routing import Match
+
+from config import LOG_ACCESS_SAMPLE_RATE
+from services.log_service import get_logger
+
+_ACCESS_LOG = get_logger("access", sample_rate=LOG_ACCESS_SAMPLE_RATE)
+
+# LLM 호출을 포함하므로 일반 웹 요청보다 긴 구간까지 버킷을 둡니다.
+_LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+# --- 지표 정의 ---
+REQUEST_LATENCY = Histogram(
+    "safeguard_request_duration_seconds", "엔드포인트별 요청 처리 시간 (스트리밍은 응답 완료까지)",
+    ["method", "endpoint", "status"], buckets=_LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "safeguard_requests_in_flight", "엔드포인트별 처리 중인 요청 수", ["endpoint"]
+)
+STAGE_LATENCY = Histogram(
+    "safeguard_stage_duration_seconds", "요청 내 단계별 처리 시간 (prompt_build, gemini_call, parse, ocr, triage)",
+    ["endpoint", "stage"], buckets=_LATENCY_BUCKETS
+)
+STAGE_ERRORS = Counter(
+    "safeguard_stage_errors_total", "단계별 오류 수", ["endpoint", "stage"]
+)
+GEMINI_CALLS = Counter(
+    "safeguard_gemini_calls_total", "모델별 Gemini 호출 수", ["model", "outcome"]
+)
+GEMINI_TOKENS = Counter(
+    "safeguard_gemini_tokens_total", "모델별 Gemini 토큰 사용량 (prompt, output, cached)", ["model", "kind"]
+)
+GEMINI_IN_FLIGHT = Gauge(
+    "safeguard_gemini_in_flight", "모델별 진행 중인 Gemini 호출 수", ["model"]
+)
+SCHEDULER_QUEUE_DEPTH = Gauge(
+    "safeguard_scheduler_queue_depth", "모델별 Gemini 호출 대기열 길이", ["model"]
+)
+SCHEDULER_REJECTED = Counter(
+    "safeguard_scheduler_rejected_total", "과부하로 거절된 Gemini 호출 수 (reason: deadline, queue_full, shed)",
+    ["model", "priority", "reason"]
+)
+SCHEDULER_RETRIES = Counter(
+    "safeguard_scheduler_retries_total", "429/5xx로 재시도한 Gemini 호출 수", ["model", "code"]
+)
+GEMINI_KEY_EJECTIONS = Counter(
+    "safeguard_gemini_key_ejections_total", "429/인증 오류로 분배에서 잠시 뺀 Gemini API 키 수 (model: 등급:키 순번)", ["model", "reason"]
+)
+COALESCED_CALLS = Counter(
+    "safeguard_coalesced_calls_total", "동시 요청 합치기 결과별 호출 수 (outcome: executed, coalesced, abandoned)",
+    ["flight", "outcome"]
+)
+
+# 단계 지표에 붙일 현재 요청의 엔드포인트 (미들웨어가 요청마다 설정, 요청 밖에서는 background)
+_CURRENT_ENDPOINT: ContextVar[str] = ContextVar("metrics_endpoint", default="background")
+
+
+@contextmanager
+def stage(name: str):
+    """
+    with 블록의 실행 시간을 현재 엔드포인트의 단계 지표로 기록합니다.
+    예외가 발생하면 단계별 오류 수도 함께 올립니다. (헤지 패배 등 취소는 오류로 세지 않습니다)
+    """
+    endpoint = _CURRENT_ENDPOINT.get()
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(endpoint, name).inc()
+        raise
+    finally:
+        STAGE_LATENCY.labels(endpoint, name).observe(time.perf_counter() - started)
+
+
+def record_gemini_usage(model_name: str, response) -> None:
+    """응답의 usage_metadata에서 입력/출력/캐시 토큰 수를 모델별로 누적합니다."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for kind, attr in (("prompt", "prompt_token_count"), ("output", "candidates_token_count"), ("cached", "cached_content_token_count")):
+        count = getattr(usage, attr, 0) or 0
+        if count:
+            GEMINI_TOKENS.labels(model_name, kind).inc(count)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Prometheus 텍스트 형식의 지표와 Content-Type을 반환합니다."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def _route_path(app, scope) -> str:
+    # 실제 URL 대신 라우트 경로 템플릿을 레이블로 사용하여 지표 카디널리티를 제한합니다.
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """요청별 처리 시간/진행 중 요청 수를 기록하고, 샘플링된 접근 로그를 남기는 ASGI 미들웨어."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "websocket":
+            await self._websocket(scope, receive, send)
+            return
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = _route_path(scope["app"], scope)
+        method = scope["method"]
+        status = 500
+        token = _CURRENT_ENDPOINT.set(endpoint)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.labels(endpoint).inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUESTS_IN_FLIGHT.labels(endpoint).dec()
+            REQUEST_LATENCY.labels(method, endpoint, str(status)).observe(elapsed)
+            _CURRENT_ENDPOINT.reset(token)
+            log = _ACCESS_LOG.warning if status >= 500 else _ACCESS_LOG.info
+            log("request", method=method, endpoint=endpoint, status=status, duration_ms=round(elapsed * 1000, 1))
+
+    async def _websocket(self, scope, receive, send):
+        # WebSocket은 연결 전체가 아니라 연결 안의 단계(gemini_call 등)만 의미가 있으므로,
+        # 진행 중인 연결 수와 단계 지표의 엔드포인트 레이블만 기록합니다.
+        endpoint = _route_path(scope["app"], scope)
+        token = _CURRENT_ENDPOINT.set(endpoint)
+        REQUESTS_IN_FLIGHT.labels(endpoint).inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            REQUESTS_IN_FLIGHT.labels(endpoint).dec()
+            _CURRENT_ENDPOINT.reset(token)
@@ -0,0 +1,210 @@
+import time
+import random
+import asyncio
+from collections import deque
+
+from config import (
+    MODEL_ROUTES, ROUTER_EWMA_ALPHA, ROUTER_PROBE_RATE, HEDGE_ENABLED,
+    BREAKER_WINDOW, BREAKER_MIN_CALLS, BREAKER_FAILURE_RATIO, BREAKER_COOLDOWN_SECONDS
+)
+from services.gemini_scheduler import OverloadedError
+
+# 헤지/강등 시 사용하는 빠른 모델 등급
+FALLBACK_TIER = "flash"
+
+
+class LatencyTracker:
+    """(엔드포인트, 모델 등급)별 지연 시간의 EWMA와 최근 표본 기반 p95를 추적합니다."""
+
+    def __init__(self, alpha: float, window: int = 200):
+        self.alpha = alpha
+        self.ewma: float | None = None
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self.ewma = seconds if self.ewma is None else self.alpha * seconds + (1 - self.alpha) * self.ewma
+        self._samples.append(seconds)
+
+    def p95(self, min_samples: int = 20) -> float | None:
+        if len(self._samples) < min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class CircuitBreaker:
+    """
+    최근 호출 중 실패 비율이 기준을 넘으면 열리고(open),
+    쿨다운 후 반열림(half-open) 상태에서 다음 호출 결과로 닫힘/재열림을 결정합니다.
+    (등급 공용 브레이커는 오류/타임아웃만, 엔드포인트별 브레이커는 SLO 초과까지 실패로 셉니다)
+    """
+
+    def __init__(self, window: int, min_calls: int, failure_ratio: float, cooldown: float):
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.cooldown = cooldown
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._opened_at: float | None = None
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def record(self, ok: bool) -> None:
+        state = self.state
+        if state == "half_open":
+            if ok:
+                self._opened_at = None
+                self._outcomes.clear()
+            else:
+                self._opened_at = time.monotonic()
+            return
+        self._outcomes.append(ok)
+        failures = self._outcomes.count(False)
+        if state == "closed" and len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_ratio:
+            self._opened_at = time.monotonic()
+            self.trips += 1
+
+
+def _new_breaker() -> CircuitBreaker:
+    return CircuitBreaker(BREAKER_WINDOW, BREAKER_MIN_CALLS, BREAKER_FAILURE_RATIO, BREAKER_COOLDOWN_SECONDS)
+
+
+class ModelRouter:
+    """
+    엔드포인트별 지연 시간 SLO와 관측된 EWMA 지연 시간으로 모델 등급(pro/flash)을 선택하고,
+    헤지 요청·호출별 타임아웃·서킷 브레이커를 적용하여 호출을 실행합니다.
+    - 지연 통계와 SLO 브레이커는 (엔드포인트, 등급)별로 따로 둡니다. (SLO가 다른 엔드포인트끼리 서로의 지연에 영향받지 않도록)
+    - 등급 공용 브레이커는 모델 자체의 장애(오류/타임아웃)만 셉니다.
+    """
+
+    def __init__(self, get_model, tiers: list[str], routes: dict[str, dict]):
+        self.get_model = get_model  # 등급 -> GenerativeModel (처음 호출 시 생성)
+        self.tiers = tiers
+        self.routes = routes        # 엔드포인트 -> {"primary", "slo", "timeout"}
+        self.latency = {
+            (endpoint, tier): LatencyTracker(ROUTER_EWMA_ALPHA) for endpoint in routes for tier in tiers
+        }
+        self.slo_breakers = {(endpoint, tier): _new_breaker() for endpoint in routes for tier in tiers}
+        self.breakers = {tier: _new_breaker() for tier in tiers}
+        self._stats = {"calls": 0, "errors": 0, "timeouts": 0, "degraded": 0, "hedges": 0, "hedge_wins": 0}
+
+    def select(self, endpoint: str) -> str:
+        """이번 호출에 사용할 모델 등급을 고릅니다."""
+        route = self.routes[endpoint]
+        tier = route["primary"]
+        if tier == FALLBACK_TIER:
+            return tier
+        if not self.breakers[tier].allow() or not self.slo_breakers[(endpoint, tier)].allow():
+            self._stats["degraded"] += 1
+            return FALLBACK_TIER
+        # 이 엔드포인트에서 주 모델의 평균 지연이 SLO를 넘으면 빠른 모델로 강등하되,
+        # 주 모델의 지연 통계가 갱신될 수 있도록 일부 호출은 그대로 보냅니다.
+        ewma = self.latency[(endpoint, tier)].ewma
+        if ewma is not None and ewma > route["slo"] and random.random() >= ROUTER_PROBE_RATE:
+            self._stats["degraded"] += 1
+            return FALLBACK_TIER
+        return tier
+
+    def model_for(self, endpoint: str):
+        return self.get_model(self.select(endpoint))
+
+    async def execute(self, endpoint: str, call):
+        """
+        call(model)을 라우팅하여 실행합니다.
+        주 호출이 이 엔드포인트의 p95 지연(표본이 부족하면 SLO)을 넘기면 빠른 모델로 헤지 호출을 시작하고, 먼저 성공한 결과를 사용합니다.
+        (이미 빠른 모델로 호출 중이면 같은 호출을 한 번 더 보내는 셈이므로 헤지하지 않습니다)
+        """
+        route = self.routes[endpoint]
+        tier = self.select(endpoint)
+        primary = asyncio.ensure_future(self._timed(endpoint, tier, call, route))
+        if not HEDGE_ENABLED or tier == FALLBACK_TIER:
+            return await primary
+
+        hedge_after = self.latency[(endpoint, tier)].p95() or route["slo"]
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                self._stats["hedges"] += 1
+                tasks.add(asyncio.ensure_future(self._timed(endpoint, FALLBACK_TIER, call, route)))
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _timed(self, endpoint: str, tier: str, call, route: dict):
+        self._stats["calls"] += 1
+        key = (endpoint, tier)
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(call(self.get_model(tier)), timeout=route["timeout"])
+        except asyncio.CancelledError:
+            # 헤지에서 진 호출은 오류가 아니지만, SLO를 넘긴 만큼은 이 엔드포인트의 지연 통계와 SLO 브레이커에 반영합니다.
+            elapsed = time.monotonic() - started
+            if elapsed > route["slo"]:
+                self.latency[key].observe(elapsed)
+                self.slo_breakers[key].record(False)
+            raise
+        except OverloadedError:
+            # 스케줄러가 입장을 거절한 호출은 모델의 실패가 아니므로 브레이커에 반영하지 않습니다.
+            raise
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            self.breakers[tier].record(False)
+            self.slo_breakers[key].record(False)
+            raise
+        except Exception:
+            self._stats["errors"] += 1
+            self.breakers[tier].record(False)
+            self.slo_breakers[key].record(False)
+            raise
+        elapsed = time.monotonic() - started
+        self.latency[key].observe(elapsed)
+        self.breakers[tier].record(True)
+        self.slo_breakers[key].record(elapsed <= route["slo"])
+        return result
+
+    def _endpoint_stats(self, key: tuple[str, str]) -> dict:
+        latency, breaker = self.latency[key], self.slo_breakers[key]
+        return {
+            "ewma_seconds": round(latency.ewma, 3) if latency.ewma is not None else None,
+            "p95_seconds": latency.p95(),
+            "slo_breaker": breaker.state,
+            "slo_breaker_trips": breaker.trips,
+        }
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "models": {
+                tier: {"breaker": self.breakers[tier].state, "breaker_trips": self.breakers[tier].trips}
+                for tier in self.tiers
+            },
+            "endpoints": {
+                endpoint: {tier: self._endpoint_stats((endpoint, tier)) for tier in self.tiers}
+                for endpoint in self.routes
+            },
+        }
+
+
+def create_router(get_model, tiers: list[str]) -> ModelRouter:
+    return ModelRouter(get_model, tiers, MODEL_ROUTES)
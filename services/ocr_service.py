@@ -1,33 +1,231 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from fastapi import UploadFile
-from google.cloud import vision
-from config import VISION_CLIENT
+from config import get_vision_client, OCR_MAX_WORKERS, IMAGE_NEAR_DUPLICATE_REUSE_OCR
+from services import image_service
+from services.cache_service import OCR_CACHE
+from services.single_flight import SingleFlight
+from services.log_service import get_logger
+from services.metrics_service import stage
+
+_LOG = get_logger("ocr")
+
+# Vision 클라이언트는 동기(gRPC 블로킹) 호출이므로, 이벤트 루프를 멈추지 않도록
+# 크기가 제한된 전용 스레드풀에서 실행합니다.
+_OCR_EXECUTOR = ThreadPoolExecutor(max_workers=OCR_MAX_WORKERS, thread_name_prefix="ocr")
+
+# batch_annotate_images 한 번에 보낼 수 있는 최대 이미지 수 (Vision API 제한)
+_VISION_BATCH_LIMIT = 16
+
+# 같은 이미지(원본 바이트 해시)의 OCR이 진행 중이면 새로 호출하지 않고 그 결과를 함께 기다립니다.
+# /diagnose/image와 /diagnose/images는 서로의 진행 중인 OCR에도 합류합니다.
+_OCR_FLIGHTS = SingleFlight("ocr")
+
+
+async def _run_in_ocr_executor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_OCR_EXECUTOR, partial(func, *args, **kwargs))
+
+
+def _text_from_annotation(response) -> str:
+    if response.error.message:
+        raise Exception(response.error.message)
+    # full_text_annotation이 없을 경우를 대비한 예외 처리
+    if response.full_text_annotation:
+        return response.full_text_annotation.text
+    return ""
+
+
+async def _near_duplicate_text(phash: str | None) -> str | None:
+    """근사 중복으로 인식된 이전 이미지의 OCR 결과 (IMAGE_NEAR_DUPLICATE_REUSE_OCR를 켠 경우에만 재사용)"""
+    cache_key = image_service.find_near_duplicate(phash)
+    if cache_key is None or not IMAGE_NEAR_DUPLICATE_REUSE_OCR:
+        return None
+    return await OCR_CACHE.aget(cache_key)
+
+
+def _rejected_with_prefix(e: image_service.ImageRejectedError, prefix: str) -> image_service.ImageRejectedError:
+    """다른 요청이 시작한 OCR에 합류한 경우, 거절 메시지를 이 요청의 이미지 번호로 다시 만듭니다."""
+    return image_service.ImageRejectedError(e.reason, prefix)
+
+
+async def _recognize(vision_client, content: bytes, cache_key: str) -> str:
+    """이미지 한 장을 전처리하고 OCR합니다. (_OCR_FLIGHTS로 공유되는 작업, 실패하면 빈 문자열)"""
+    # 합류할 호출이 막 끝난 직후에 시작된 경우, 그 결과가 이미 캐시에 있습니다.
+    cached_text = await OCR_CACHE.aget(cache_key)
+    if cached_text is not None:
+        return cached_text
+
+    # 형식 확인 후 OCR에 필요한 해상도로 줄이고 다시 인코딩합니다. (별도 프로세스)
+    prepared = await image_service.prepare(content)
+    near_text = await _near_duplicate_text(prepared["phash"])
+    if near_text is not None:
+        await OCR_CACHE.aset(cache_key, near_text)
+        return near_text
+
+    from google.cloud import vision  # 서버 시작 시간을 줄이기 위해 처음 사용할 때 import
+    image = vision.Image(content=prepared["content"])
+
+    try:
+        # config에서 가져온 클라이언트를 OCR 전용 스레드풀에서 호출합니다.
+        with stage("ocr"):
+            response = await _run_in_ocr_executor(vision_client.text_detection, image=image)
+            text = _text_from_annotation(response)
+        _LOG.debug("OCR 완료", image_bytes=len(content), sent_bytes=len(prepared["content"]), text_chars=len(text))
+        await OCR_CACHE.aset(cache_key, text)
+        image_service.remember(prepared["phash"], cache_key)
+        return text
+    except Exception as e:
+        _LOG.error("OCR 실패", error=str(e))
+        return ""
+
 
 async def extract_text_from_image(image_file: UploadFile) -> str:
     """
     업로드된 이미지 파일에서 텍스트를 추출합니다 (OCR).
     """
-    # Vision API 클라이언트가 초기화되지 않은 경우
-    if VISION_CLIENT is None:
-        print("[Error] Vision API 클라이언트가 초기화되지 않았습니다.")
+    # Vision API 클라이언트가 초기화되지 않은 경우 (첫 호출이면 스레드에서 생성)
+    vision_client = await _run_in_ocr_executor(get_vision_client)
+    if vision_client is None:
+        _LOG.error("Vision API 클라이언트가 초기화되지 않았습니다.")
         return ""
 
-    content = await image_file.read()
-    image = vision.Image(content=content) # vision은 import google.cloud.vision이 필요함
+    # 크기 제한을 확인하며 나눠 읽고, 원본 바이트 해시로 같은 스크린샷의 OCR 결과를 재사용합니다.
+    content, cache_key = await image_service.read_upload(image_file)
+    cached_text = await OCR_CACHE.aget(cache_key)
+    if cached_text is not None:
+        return cached_text
 
-    print("Cloud Vision API (OCR) 호출 시작...")
-    try:
-        # config에서 가져온 클라이언트를 사용합니다.
-        response = VISION_CLIENT.text_detection(image=image)
-        print("OCR API 호출 완료.")
-        
-        if response.error.message:
-            raise Exception(response.error.message)
-            
-        # full_text_annotation이 없을 경우를 대비한 예외 처리
-        if response.full_text_annotation:
-            return response.full_text_annotation.text
+    return await _OCR_FLIGHTS.do(cache_key, lambda: _recognize(vision_client, content, cache_key))
+
+
+async def extract_texts_from_images(image_files: list[UploadFile]) -> list[str]:
+    """
+    여러 이미지에서 텍스트를 추출합니다 (OCR).
+    캐시에 없는 이미지만 모아 batch_annotate_images로 한 번에 요청하며,
+    결과는 입력 순서대로 반환합니다. (실패한 이미지는 빈 문자열)
+    같은 요청 안의 중복 이미지는 한 번만 OCR하고, 다른 요청에서 진행 중인 같은 이미지의 OCR에는 합류합니다.
+    """
+    vision_client = await _run_in_ocr_executor(get_vision_client)
+    if vision_client is None:
+        _LOG.error("Vision API 클라이언트가 초기화되지 않았습니다.")
+        return [""] * len(image_files)
+
+    uploads = [
+        await image_service.read_upload(image_file, prefix=f"{i + 1}번째 이미지: ")
+        for i, image_file in enumerate(image_files)
+    ]
+    cache_keys = [cache_key for _, cache_key in uploads]
+    texts = list(await asyncio.gather(*(OCR_CACHE.aget(key) for key in cache_keys)))
+
+    # 캐시에 없는 이미지를 키별 첫 번호로 모읍니다. (같은 이미지가 여러 번 올라온 경우 한 번만 처리)
+    first_index: dict[str, int] = {}
+    for i, text in enumerate(texts):
+        if text is None:
+            first_index.setdefault(cache_keys[i], i)
+    if not first_index:
+        return texts
+
+    # 다른 요청에서 OCR 중인 이미지는 전처리 없이 합류하고, 나머지만 동시에 전처리합니다. (프로세스 풀이 IMAGE_PROCESS_WORKERS개씩 병렬 처리)
+    new = [i for key, i in first_index.items() if not _OCR_FLIGHTS.in_flight(key)]
+    prepared_list = await asyncio.gather(*(
+        image_service.prepare(uploads[i][0], prefix=f"{i + 1}번째 이미지: ") for i in new
+    ))
+    prepared = dict(zip(new, prepared_list))
+    found: dict[str, str] = {}
+    pending = []
+    for i in new:
+        near_text = await _near_duplicate_text(prepared[i]["phash"])
+        if near_text is not None:
+            await OCR_CACHE.aset(cache_keys[i], near_text)
+            found[cache_keys[i]] = near_text
+            del first_index[cache_keys[i]]
+        elif not _OCR_FLIGHTS.in_flight(cache_keys[i]):
+            # (전처리를 기다리는 동안 다른 요청이 같은 이미지의 OCR을 시작했다면 그쪽에 합류)
+            pending.append(i)
+
+    # 이번 요청이 OCR할 이미지는 키별 Future로 등록해, 다른 요청도 배치 결과를 함께 받을 수 있게 합니다.
+    loop = asyncio.get_running_loop()
+    futures = {cache_keys[i]: loop.create_future() for i in pending}
+    if futures:
+        batch = asyncio.ensure_future(_annotate_batch(vision_client, {cache_keys[i]: prepared[i] for i in pending}, futures))
+
+        def cancel_if_abandoned(_):
+            # 이미지마다 기다리는 요청이 모두 떠나 Future가 전부 취소되면 배치 호출도 멈춥니다.
+            # (결과를 받은 Future가 있으면 OCR은 이미 끝났고 캐시 저장만 남았으므로 멈추지 않습니다)
+            if all(future.cancelled() for future in futures.values()):
+                batch.cancel()
+
+        for future in futures.values():
+            future.add_done_callback(cancel_if_abandoned)
+
+    async def join(key: str, i: int) -> str:
+        if key in futures:
+            factory = lambda: futures[key]
         else:
-            return ""
+            # 합류하려던 OCR이 그사이 끝났다면 결과가 캐시에 있으므로 _recognize가 바로 반환합니다.
+            factory = lambda: _recognize(vision_client, uploads[i][0], key)
+        try:
+            return await _OCR_FLIGHTS.do(key, factory)
+        except image_service.ImageRejectedError as e:
+            raise _rejected_with_prefix(e, f"{i + 1}번째 이미지: ") from None
+
+    # 한 이미지라도 거절되면 요청 전체가 실패하므로, 나머지 이미지를 기다리던 자리도 함께 정리합니다.
+    joins = [asyncio.ensure_future(join(key, i)) for key, i in first_index.items()]
+    try:
+        found.update(zip(first_index, await asyncio.gather(*joins)))
+    finally:
+        for task in joins:
+            task.cancel()
+    return [text if text is not None else found[key] for text, key in zip(texts, cache_keys)]
+
+
+async def _annotate_batch(vision_client, prepared: dict[str, dict], futures: dict[str, asyncio.Future]) -> None:
+    """
+    전처리된 이미지를 batch_annotate_images로 OCR하고, 결과를 키별 Future에 전달합니다. (실패한 이미지는 빈 문자열)
+    """
+    from google.cloud import vision
+    feature = vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)
+    keys = list(prepared)
+    chunks = [keys[i:i + _VISION_BATCH_LIMIT] for i in range(0, len(keys), _VISION_BATCH_LIMIT)]
+
+    async def annotate(chunk: list[str]):
+        requests = [
+            vision.AnnotateImageRequest(image=vision.Image(content=prepared[key]["content"]), features=[feature])
+            for key in chunk
+        ]
+        return await _run_in_ocr_executor(vision_client.batch_annotate_images, requests=requests)
+
+    def resolve(key: str, text: str) -> None:
+        if not futures[key].done():
+            futures[key].set_result(text)
+
+    try:
+        with stage("ocr"):
+            batch_results = await asyncio.gather(*(annotate(chunk) for chunk in chunks), return_exceptions=True)
+        _LOG.debug("OCR 배치 완료", images=len(keys), batches=len(chunks))
+
+        for chunk, batch in zip(chunks, batch_results):
+            if isinstance(batch, Exception):
+                _LOG.error("OCR 배치 실패", images=len(chunk), error=str(batch))
+                for key in chunk:
+                    resolve(key, "")
+                continue
+            recognized = {}
+            for key, response in zip(chunk, batch.responses):
+                try:
+                    text = _text_from_annotation(response)
+                    recognized[key] = text
+                    image_service.remember(prepared[key]["phash"], key)
+                except Exception as e:
+                    _LOG.error("OCR 실패", cache_key=key[:12], error=str(e))
+                    text = ""
+                resolve(key, text)
+            # 기다리는 요청에 결과를 먼저 넘긴 뒤 캐시에 저장합니다. (영속 계층 저장은 스레드에서 실행)
+            await asyncio.gather(*(OCR_CACHE.aset(key, text) for key, text in recognized.items()))
     except Exception as e:
-        print(f"[Error] OCR 실패: {e}")
-        return ""
\ No newline at end of file
+        _LOG.error("OCR 배치 처리 오류", images=len(keys), error=str(e))
+        for future in futures.values():
+            if not future.done():
+                future.set_exception(e)
@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+
+from config import PATTERN_DB_PATH, PATTERN_RELOAD_INTERVAL_SECONDS, PATTERN_PROMPT_LIMIT, PATTERN_PROMPT_MAX_CHARS
+from services.log_service import get_logger
+
+_LOG = get_logger("pattern")
+
+_WORD_RE = re.compile(r"[\w]+", re.UNICODE)
+# trigram 색인으로 찾을 수 있는 최소 단어 길이. 이보다 짧은 단어(검찰, 대출, 계좌 등 2글자)는 메모리에서 부분 문자열로 찾습니다.
+_FTS_MIN_WORD = 3
+_SHORT_MIN_WORD = 2
+
+
+class PatternRepository:
+    """
+    safeguard_patterns DB의 활성 패턴을 메모리에 올려두고 조회하는 저장소.
+    - (crime_type, simulation_mode) 키로 패턴 목록을 색인합니다.
+    - 키워드 검색용으로 메모리 내 SQLite FTS5 색인을 함께 만듭니다.
+    - 조회 시 일정 간격으로 DB의 PRAGMA data_version을 확인하여, 변경되었으면 재시작 없이 다시 읽어옵니다.
+      (이벤트 루프에서는 확인/재로드를 스레드에서 실행하고 기다리지 않으며, 끝나면 색인을 한 번에 교체합니다)
+    """
+
+    def __init__(self, db_path: str, reload_interval: float):
+        self.db_path = db_path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._source_lock = threading.Lock()   # _source 연결은 한 번에 한 스레드만 사용
+        self._reload_task: asyncio.Task | None = None
+        self._source = None          # 변경 감지용 DB 연결
+        self._data_version = None
+        self._last_check = 0.0
+        self._by_key: dict[tuple[str, str], list[dict]] = {}
+        self._by_id: dict[int, dict] = {}
+        self._fts = None             # 메모리 내 FTS5 색인
+        self.loaded_at = None
+
+    # --- 로드 / 핫 리로드 ---
+    def load(self) -> int:
+        """DB에서 활성 패턴을 읽어 색인을 새로 만듭니다. 읽은 패턴 수를 반환합니다."""
+        if not os.path.exists(self.db_path):
+            _LOG.warning("패턴 DB가 없습니다. 기본 페르소나만 사용합니다.", db_path=self.db_path)
+            return 0
+        try:
+            with self._source_lock:
+                if self._source is None:
+                    self._source = sqlite3.connect(self.db_path, check_same_thread=False)
+                rows = self._source.execute(
+                    "SELECT pattern_id, crime_type, scenario_name, simulation_mode, pattern_data "
+                    "FROM patterns WHERE is_active = 1"
+                ).fetchall()
+                data_version = self._source.execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error as e:
+            _LOG.warning("패턴 DB 로드 실패", db_path=self.db_path, error=str(e))
+            return 0
+
+        by_key, by_id = {}, {}
+        for pattern_id, crime_type, scenario_name, simulation_mode, pattern_data in rows:
+            pattern = {
+                "pattern_id": pattern_id,
+                "crime_type": crime_type,
+                "scenario_name": scenario_name,
+                "simulation_mode": simulation_mode,
+                "pattern_data": pattern_data,
+            }
+            by_key.setdefault((crime_type, simulation_mode), []).append(pattern)
+            by_id[pattern_id] = pattern
+        fts = self._build_fts(rows)
+
+        # 색인 교체는 참조 대입 한 번으로 끝나므로, 조회 중인 요청은 이전 색인을 그대로 사용합니다.
+        with self._lock:
+            self._by_key, self._by_id, self._fts = by_key, by_id, fts
+            self._data_version = data_version
+            self.loaded_at = time.time()
+        _LOG.info("활성 패턴 로드 완료", patterns=len(by_id))
+        return len(by_id)
+
+    def maybe_reload(self) -> None:
+        """
+        마지막 확인 후 reload_interval이 지났으면 DB 변경 확인(변경 시 재로드)을 시작합니다.
+        이벤트 루프에서 호출되면 스레드에서 실행하고 기다리지 않으므로, 재로드가 끝날 때까지는 기존 색인으로 조회합니다.
+        """
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        if self._reload_task is not None and not self._reload_task.done():
+            return
+        self._last_check = now
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 스크립트 등 이벤트 루프 밖에서는 바로 실행합니다.
+            self._reload_if_changed()
+            return
+        self._reload_task = loop.create_task(asyncio.to_thread(self._reload_if_changed))
+        self._reload_task.add_done_callback(self._reload_done)
+
+    def _reload_if_changed(self) -> None:
+        if self._source is None:
+            if os.path.exists(self.db_path):
+                self.load()
+            return
+        try:
+            with self._source_lock:
+                data_version = self._source.execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error:
+            return
+        if data_version != self._data_version:
+            self.load()
+
+    @staticmethod
+    def _reload_done(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            _LOG.warning("패턴 DB 재로드 실패", error=str(task.exception()))
+
+    @staticmethod
+    def _build_fts(rows) -> sqlite3.Connection | None:
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        try:
+            # 한국어는 띄어쓰기 단위 토큰화가 잘 맞지 않으므로 trigram 토크나이저를 우선 사용합니다.
+            try:
+                conn.execute("CREATE VIRTUAL TABLE patterns_fts USING fts5(scenario_name, pattern_data, tokenize='trigram')")
+            except sqlite3.OperationalError:
+                conn.execute("CREATE VIRTUAL TABLE patterns_fts USING fts5(scenario_name, pattern_data)")
+            conn.executemany(
+                "INSERT INTO patterns_fts (rowid, scenario_name, pattern_data) VALUES (?, ?, ?)",
+                [(row[0], row[2], row[4]) for row in rows]
+            )
+            conn.commit()
+            return conn
+        except sqlite3.OperationalError as e:
+            _LOG.warning("FTS5 색인 생성 실패, 키워드 검색을 사용하지 않습니다", error=str(e))
+            conn.close()
+            return None
+
+    # --- 조회 ---
+    def get_patterns(self, crime_type: str, simulation_mode: str) -> list[dict]:
+        self.maybe_reload()
+        return list(self._by_key.get((crime_type, simulation_mode), []))
+
+    def search(self, query: str, crime_type: str | None = None, simulation_mode: str | None = None, limit: int = 5) -> list[dict]:
+        """
+        키워드로 패턴을 검색합니다.
+        3글자 이상 단어는 FTS(BM25 순위)로, 2글자 단어는 메모리에서 부분 문자열로 찾고, FTS 결과 뒤에 겹치는 단어 수 순으로 붙입니다.
+        """
+        self.maybe_reload()
+        with self._lock:
+            fts, by_id, by_key = self._fts, self._by_id, self._by_key
+        words = list(dict.fromkeys(_WORD_RE.findall(query)))
+        long_words = [word for word in words if len(word) >= _FTS_MIN_WORD][:20]
+        short_words = [word for word in words if _SHORT_MIN_WORD <= len(word) < _FTS_MIN_WORD][:20]
+
+        def wanted(pattern: dict) -> bool:
+            return (not crime_type or pattern["crime_type"] == crime_type) and \
+                (not simulation_mode or pattern["simulation_mode"] == simulation_mode)
+
+        results = []
+        if fts is not None and long_words:
+            match = " OR ".join('"' + word.replace('"', '""') + '"' for word in long_words)
+            try:
+                with self._lock:
+                    rows = fts.execute(
+                        "SELECT rowid FROM patterns_fts WHERE patterns_fts MATCH ? ORDER BY bm25(patterns_fts)",
+                        (match,)
+                    ).fetchall()
+            except sqlite3.OperationalError as e:
+                _LOG.warning("패턴 검색 실패", error=str(e))
+                rows = []
+            for (pattern_id,) in rows:
+                pattern = by_id.get(pattern_id)
+                if pattern is not None and wanted(pattern):
+                    results.append(pattern)
+                    if len(results) >= limit:
+                        return results
+
+        if short_words:
+            candidates = by_key.get((crime_type, simulation_mode), []) if crime_type and simulation_mode else by_id.values()
+            found = {pattern["pattern_id"] for pattern in results}
+            scored = []
+            for pattern in candidates:
+                if pattern["pattern_id"] in found or not wanted(pattern):
+                    continue
+                text = f"{pattern['scenario_name']} {pattern['pattern_data']}"
+                hits = sum(1 for word in short_words if word in text)
+                if hits:
+                    scored.append((hits, pattern))
+            scored.sort(key=lambda item: item[0], reverse=True)
+            results.extend(pattern for _, pattern in scored[:limit - len(results)])
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "patterns": len(self._by_id),
+            "keys": len(self._by_key),
+            "loaded_at": self.loaded_at,
+        }
+
+
+PATTERNS = PatternRepository(PATTERN_DB_PATH, PATTERN_RELOAD_INTERVAL_SECONDS)
+
+
+def render_for_prompt(crime_type: str, simulation_mode: str, query: str = "") -> str:
+    """
+    프롬프트에 넣을 참고 패턴 블록을 만듭니다. 일치하는 패턴이 없으면 빈 문자열을 반환합니다.
+    - 최근 대화(query)와 키워드가 겹치는 패턴을 우선하고, 부족하면 같은 유형의 패턴으로 채웁니다.
+    """
+    selected = PATTERNS.search(query, crime_type, simulation_mode, limit=PATTERN_PROMPT_LIMIT) if query else []
+    if len(selected) < PATTERN_PROMPT_LIMIT:
+        seen = {pattern["pattern_id"] for pattern in selected}
+        for pattern in PATTERNS.get_patterns(crime_type, simulation_mode):
+            if pattern["pattern_id"] not in seen:
+                selected.append(pattern)
+            if len(selected) >= PATTERN_PROMPT_LIMIT:
+                break
+    if not selected:
+        return ""
+
+    blocks = []
+    for pattern in selected:
+        data = pattern["pattern_data"]
+        if not isinstance(data, str):
+            data = json.dumps(data, ensure_ascii=False)
+        blocks.append(f"- [{pattern['scenario_name']}] {data[:PATTERN_PROMPT_MAX_CHARS]}")
+    return "# REFERENCE PATTERNS (실제 사기 수법 참고)\n" + "\n".join(blocks) + "\n"
@@ -0,0 +1,134 @@
+import time
+import asyncio
+import datetime
+
+from config import PROMPT_CONTEXT_CACHE_ENABLED, PROMPT_CONTEXT_CACHE_TTL_SECONDS, GOOGLE_API_KEY, AI_OFFLINE
+from services.context_service import estimate_tokens
+from services.log_service import get_logger
+
+_LOG = get_logger("prompt_templates")
+
+# 캐시 만료 직전의 컨텍스트는 사용하지 않습니다. (요청 도중 만료 방지)
+_EXPIRY_MARGIN_SECONDS = 120
+
+
+class PromptTemplate:
+    """
+    (endpoint, crime_type)별로 미리 만들어 둔 고정 프롬프트 접두부.
+    매 요청마다 달라지는 부분(대화 기록 등)은 항상 이 접두부 뒤에 붙습니다.
+    """
+
+    def __init__(self, endpoint: str, crime_type: str | None, static_prefix: str):
+        self.endpoint = endpoint
+        self.crime_type = crime_type
+        self.static_prefix = static_prefix
+        self.estimated_tokens = estimate_tokens(static_prefix)
+        self.counted_tokens: dict[str, int] = {}                 # model_name -> API 기준 토큰 수
+        self.cached_models: dict[str, tuple[object, float]] = {}  # model_name -> (캐시 기반 모델, 만료 시각)
+        self.cache_hits = 0
+        self.uses = 0
+
+
+class TemplateRegistry:
+    """
+    고정 접두부 템플릿 레지스트리.
+    - 서버 시작 시 모든 (endpoint, crime_type) 접두부를 한 번만 만들어 둡니다.
+    - PROMPT_CONTEXT_CACHE_ENABLED면 각 접두부를 Gemini 캐시 컨텍스트로 등록하고,
+      호출 시 캐시 기반 모델에 가변 부분만 보내 입력 토큰을 줄입니다.
+    - 캐시를 쓰지 않거나 등록에 실패하면 '접두부 + 가변 부분'을 그대로 보냅니다.
+      (고정 부분이 항상 앞에 오므로 Gemini의 암묵적 접두 캐시에도 유리합니다.)
+    """
+
+    def __init__(self):
+        self._templates: dict[tuple[str, str | None], PromptTemplate] = {}
+        self._refreshing: set[tuple[str, str | None, str]] = set()
+
+    def register(self, endpoint: str, crime_type: str | None, static_prefix: str) -> PromptTemplate:
+        template = PromptTemplate(endpoint, crime_type, static_prefix)
+        self._templates[(endpoint, crime_type)] = template
+        return template
+
+    def get(self, endpoint: str, crime_type: str | None = None, default_crime_type: str | None = None) -> PromptTemplate:
+        template = self._templates.get((endpoint, crime_type))
+        if template is None:
+            template = self._templates[(endpoint, default_crime_type)]
+        return template
+
+    def bind(self, template: PromptTemplate | None, model, dynamic_part: str) -> tuple[object, str]:
+        """
+        이번 호출에 사용할 (모델, 프롬프트)를 반환합니다.
+        유효한 캐시 컨텍스트가 있으면 캐시 기반 모델과 가변 부분만, 없으면 기본 모델과 전체 프롬프트를 반환합니다.
+        """
+        if template is None:
+            return model, dynamic_part
+        template.uses += 1
+        cached = template.cached_models.get(model.model_name)
+        if cached is not None:
+            cached_model, expires_at = cached
+            if expires_at - time.time() > _EXPIRY_MARGIN_SECONDS:
+                template.cache_hits += 1
+                return cached_model, dynamic_part
+            # 만료가 가까우면 이번 호출은 전체 프롬프트로 보내고, 백그라운드에서 새로 등록합니다.
+            del template.cached_models[model.model_name]
+            self._schedule_refresh(template, model)
+        return model, template.static_prefix + dynamic_part
+
+    async def register_cached_contexts(self, models: list) -> None:
+        """(서버 시작 시) 모든 템플릿을 모델별 Gemini 캐시 컨텍스트로 등록하고 토큰 수를 측정합니다."""
+        if not (GOOGLE_API_KEY or AI_OFFLINE):
+            return
+        jobs = []
+        for template in self._templates.values():
+            for model in models:
+                jobs.append(self._count_tokens(template, model))
+                if PROMPT_CONTEXT_CACHE_ENABLED and not AI_OFFLINE:
+                    jobs.append(self._create_cache(template, model))
+        await asyncio.gather(*jobs)
+
+    def stats(self) -> list[dict]:
+        return [
+            {
+                "endpoint": template.endpoint,
+                "crime_type": template.crime_type,
+                "estimated_tokens": template.estimated_tokens,
+                "counted_tokens": template.counted_tokens,
+                "cached_models": sorted(template.cached_models),
+                "uses": template.uses,
+                "cache_hits": template.cache_hits,
+            }
+            for template in self._templates.values()
+        ]
+
+    # --- 내부 구현 ---
+    async def _count_tokens(self, template: PromptTemplate, model) -> None:
+        try:
+            response = await model.count_tokens_async(template.static_prefix)
+            template.counted_tokens[model.model_name] = response.total_tokens
+        except Exception as e:
+            _LOG.warning("토큰 수 측정 실패", endpoint=template.endpoint, crime_type=template.crime_type, error=str(e))
+
+    async def _create_cache(self, template: PromptTemplate, model) -> None:
+        import google.generativeai as genai
+        from google.generativeai import caching
+
+        try:
+            # 모델별 최소 토큰 수보다 짧은 접두부는 API가 거절하며, 그 경우 전체 프롬프트 방식을 유지합니다.
+            cached_content = await asyncio.to_thread(
+                caching.CachedContent.create,
+                model=model.model_name,
+                display_name=f"safeguard-{template.endpoint}-{template.crime_type or 'common'}"[:128],
+                system_instruction=template.static_prefix,
+                ttl=datetime.timedelta(seconds=PROMPT_CONTEXT_CACHE_TTL_SECONDS),
+            )
+            cached_model = genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+            template.cached_models[model.model_name] = (cached_model, cached_content.expire_time.timestamp())
+        except Exception as e:
+            _LOG.warning("캐시 컨텍스트 등록 실패", endpoint=template.endpoint, crime_type=template.crime_type, model=model.model_name, error=str(e))
+
+    def _schedule_refresh(self, template: PromptTemplate, model) -> None:
+        key = (template.endpoint, template.crime_type, model.model_name)
+        if not PROMPT_CONTEXT_CACHE_ENABLED or key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        task = asyncio.get_running_loop().create_task(self._create_cache(template, model))
+        task.add_done_callback(lambda _: self._refreshing.discard(key))
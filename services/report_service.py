@@ -0,0 +1,166 @@
+import hashlib
+
+from config import RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_DB_PATH, REPORT_CACHE_TTL_SECONDS
+from models import DialogueHistoryEntry
+from services import gemini_service, scoring_service
+from services.gemini_scheduler import OverloadedError, background_priority
+from services.cache_service import ResultCache
+from services.single_flight import SingleFlight
+from services.log_service import get_logger
+
+_LOG = get_logger("report")
+
+# --- 리포트 엔진 ---
+# 같은 세션(crime_type + 대화 기록)의 분석은 한 번만 실행하고, 기본 리포트는 분석 결과에서 바로 만듭니다.
+# 프리미엄 리포트는 같은 분석(등급/위험했던 대응)을 입력으로 받아 생성하므로, 두 리포트의 등급이 항상 같습니다.
+_ANALYSIS_CACHE = ResultCache("report_analysis", RESULT_CACHE_MAX_ENTRIES, REPORT_CACHE_TTL_SECONDS, RESULT_CACHE_DB_PATH)
+_PREMIUM_CACHE = ResultCache("premium_report", RESULT_CACHE_MAX_ENTRIES, REPORT_CACHE_TTL_SECONDS, RESULT_CACHE_DB_PATH)
+
+# 진행 중인 생성 작업. 같은 세션의 동시 요청은 하나의 호출 결과를 함께 기다립니다.
+# 요청이 모두 끊겨도 결과는 캐시에 저장되어 재시도/미리 생성에 쓰이므로 끝까지 실행합니다.
+_FLIGHTS = SingleFlight("report", cancel_when_abandoned=False)
+
+_STATS = {
+    "analysis_calls": 0,       # 실제로 실행한 세션 분석 호출 수
+    "analysis_reused": 0,      # 캐시 또는 진행 중인 분석을 재사용한 횟수
+    "premium_calls": 0,        # 실제로 실행한 프리미엄 리포트 호출 수
+    "premium_reused": 0,       # 캐시 또는 진행 중인 프리미엄 리포트를 재사용한 횟수
+    "precomputed": 0,          # 기본 리포트 요청 후 백그라운드에서 미리 만든 프리미엄 리포트 수
+    "fast_reports": 0,         # Gemini 없이 결정적 채점만으로 만든 기본 리포트 수
+}
+
+# fast 기본 리포트의 등급별 총평 (결정적 채점 결과만으로 작성)
+_FAST_SUMMARIES = {
+    "A": "사기 수법에 흔들리지 않고 끝까지 안전하게 대응했습니다.",
+    "B": "대체로 안전하게 대응했지만, 판단이 흔들린 순간이 있었습니다.",
+    "C": "위험한 대응이 있어 실제 상황이었다면 피해로 이어질 수 있었습니다.",
+    "F": "사기범의 요구에 여러 번 응해 실제 피해로 이어질 가능성이 매우 높았습니다.",
+}
+
+
+def session_key(crime_type: str, history_list: list[DialogueHistoryEntry], grade: str | None = None) -> str:
+    # BE가 채점 후 붙이는 verdict/axes는 키에서 제외하고, 역할과 대사 내용과 (채점으로 확정된) 등급만 사용합니다.
+    digest = hashlib.sha256()
+    digest.update(crime_type.encode("utf-8"))
+    digest.update((grade or "").encode("utf-8"))
+    for entry in history_list:
+        digest.update(b"\x1e")
+        digest.update(entry.role.encode("utf-8"))
+        digest.update(b"\x1f")
+        digest.update(entry.text.strip().encode("utf-8"))
+    return digest.hexdigest()
+
+
+async def _get_or_create(cache: ResultCache, key: str, stat: str, factory) -> dict:
+    """캐시에 있으면 반환하고, 없으면 진행 중인 작업에 합류하거나 새로 생성하여 캐시에 저장합니다."""
+    cached = await cache.aget(key)
+    if cached is not None:
+        _STATS[f"{stat}_reused"] += 1
+        return cached
+
+    flight_key = f"{cache.namespace}:{key}"
+    _STATS[f"{stat}_reused" if _FLIGHTS.in_flight(flight_key) else f"{stat}_calls"] += 1
+
+    async def create():
+        result = await factory()
+        await cache.aset(key, result)
+        return result
+
+    return await _FLIGHTS.do(flight_key, create)
+
+
+async def _analysis(history_list: list[DialogueHistoryEntry], crime_type: str, key: str, grade: str | None) -> dict:
+    return await _get_or_create(
+        _ANALYSIS_CACHE, key, "analysis",
+        lambda: gemini_service.analyze_report_session(history_list, crime_type, grade)
+    )
+
+
+def _basic_view(analysis: dict) -> dict:
+    return {
+        "grade": analysis["grade"],
+        "summary": analysis["summary"],
+        "caution_point": analysis["caution_point"],
+        "guide": analysis["guide"],
+    }
+
+
+def _fast_view(history_list: list[DialogueHistoryEntry], score: dict) -> dict:
+    """결정적 채점 결과만으로 기본 리포트를 만듭니다. (Gemini 호출 없음)"""
+    riskiest = score["riskiest_turn"]
+    entry = history_list[riskiest - 1]
+    if entry.verdict in ("risky", "unsafe"):
+        caution_point = f"{riskiest}번째 턴의 '{entry.text}' 대응이 가장 위험했습니다."
+    else:
+        caution_point = "위험한 대응 없이 침착하게 대화를 이어갔습니다."
+    axis = score["highest_vulnerability_axis"]
+    guide = "금전이나 개인정보를 요구받으면 통화를 끊고, 해당 기관의 공식 번호로 직접 확인하세요."
+    if axis:
+        guide = f"'{axis}' 유형의 압박에 특히 흔들렸습니다. " + guide
+    return {"grade": score["grade"], "summary": _FAST_SUMMARIES[score["grade"]], "caution_point": caution_point, "guide": guide}
+
+
+async def basic_report(history_list: list[DialogueHistoryEntry], crime_type: str, fast: bool = False) -> dict:
+    """
+    세션 분석에서 무료 기본 리포트를 만듭니다. (같은 세션의 분석이 있으면 재사용)
+    - 등급은 대화 기록의 verdict로 계산한 결정적 등급을 사용합니다. (verdict가 없을 때만 Gemini가 판정)
+    - fast=True면 Gemini 없이 채점 결과만으로 만듭니다. (verdict가 없으면 일반 리포트로 생성)
+    """
+    score = scoring_service.score_session(history_list)
+    grade = score["grade"]
+    if fast and grade is not None:
+        _STATS["fast_reports"] += 1
+        return _fast_view(history_list, score)
+    try:
+        analysis = await _analysis(history_list, crime_type, session_key(crime_type, history_list, grade), grade)
+    except OverloadedError:
+        raise
+    except Exception as e:
+        _LOG.error("기본 리포트 생성 실패", error=str(e))
+        # BE는 항상 grade 필드를 기대하므로, 실패 시에도 (채점 결과가 없으면 기본 등급 'C') 등급을 채워 반환합니다.
+        return {"error": "리포트 생성 실패", "grade": grade or "C"}
+    return _basic_view(analysis)
+
+
+async def premium_report(history_list: list[DialogueHistoryEntry], crime_type: str) -> dict:
+    """세션 분석을 바탕으로 유료 프리미엄 리포트를 만듭니다. (기본 리포트와 같은 분석/등급 사용)"""
+    grade = scoring_service.score_session(history_list)["grade"]
+    key = session_key(crime_type, history_list, grade)
+    analysis = None
+    try:
+        analysis = await _analysis(history_list, crime_type, key, grade)
+        return await _get_or_create(
+            _PREMIUM_CACHE, key, "premium",
+            lambda: gemini_service.generate_premium_report(history_list, crime_type, analysis)
+        )
+    except OverloadedError:
+        raise
+    except Exception as e:
+        _LOG.error("프리미엄 리포트 생성 실패", error=str(e))
+        # BE는 항상 overall_evaluation.grade 필드를 기대하므로, 실패 시에도 (분석 또는 채점 결과와 같은) 등급을 채워 반환합니다.
+        grade = analysis["grade"] if analysis else (grade or "C")
+        return {"error": "리포트를 생성하는 중 오류가 발생했습니다.", "overall_evaluation": {"grade": grade}}
+
+
+async def precompute_premium(history_list: list[DialogueHistoryEntry], crime_type: str) -> None:
+    """(기본 리포트 응답 후 백그라운드) 업그레이드 시 바로 반환할 수 있도록 프리미엄 리포트를 미리 만들어 둡니다."""
+    grade = scoring_service.score_session(history_list)["grade"]
+    if await _PREMIUM_CACHE.aget(session_key(crime_type, history_list, grade)) is not None:
+        return
+    # 사용자가 기다리지 않는 호출이므로 가장 낮은 우선순위로 실행하고, 과부하면 건너뜁니다. (업그레이드 시 그때 생성)
+    with background_priority():
+        try:
+            result = await premium_report(history_list, crime_type)
+        except OverloadedError:
+            return
+    if "error" not in result:
+        _STATS["precomputed"] += 1
+
+
+def report_stats() -> dict:
+    return {
+        **_STATS,
+        "in_flight": _FLIGHTS.stats()["in_flight"],
+        "analysis_cache": _ANALYSIS_CACHE.stats(),
+        "premium_cache": _PREMIUM_CACHE.stats(),
+    }
@@ -0,0 +1,45 @@
+from typing import Any
+from pydantic import BaseModel
+
+# Gemini response_schema(OpenAPI 부분집합)가 이해하는 키만 남깁니다.
+_ALLOWED_KEYS = {"type", "format", "description", "nullable", "enum", "items", "properties", "required"}
+_RENAMED_KEYS = {"minItems": "min_items", "maxItems": "max_items"}
+
+
+def _convert(node: dict[str, Any], defs: dict[str, Any]) -> dict[str, Any]:
+    if "$ref" in node:
+        node = defs[node["$ref"].split("/")[-1]]
+
+    # Optional[X] (anyOf: [X, null]) -> X + nullable
+    if "anyOf" in node:
+        variants = [variant for variant in node["anyOf"] if variant.get("type") != "null"]
+        if len(variants) != 1:
+            raise ValueError("Gemini 스키마는 Optional 이외의 Union 타입을 지원하지 않습니다.")
+        converted = _convert(variants[0], defs)
+        converted["nullable"] = True
+        if "description" in node:
+            converted["description"] = node["description"]
+        return converted
+
+    schema = {}
+    for key, value in node.items():
+        if key in _RENAMED_KEYS:
+            schema[_RENAMED_KEYS[key]] = value
+        elif key == "properties":
+            schema["properties"] = {name: _convert(child, defs) for name, child in value.items()}
+        elif key == "items":
+            schema["items"] = _convert(value, defs)
+        elif key in _ALLOWED_KEYS:
+            schema[key] = value
+    if "enum" in schema:
+        schema["format"] = "enum"
+    return schema
+
+
+def to_gemini_schema(model_cls: type[BaseModel]) -> dict[str, Any]:
+    """
+    Pydantic 응답 모델을 Gemini JSON 응답 모드의 response_schema(dict)로 변환합니다.
+    ($ref 펼치기, title/default 등 미지원 키 제거)
+    """
+    json_schema = model_cls.model_json_schema()
+    return _convert(json_schema, json_schema.get("$defs", {}))
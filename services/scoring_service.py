@@ -0,0 +1,153 @@
+import numpy as np
+
+from config import SCORING_RECENCY_HALF_LIFE_TURNS, SCORING_VERDICT_WEIGHTS, SCORING_GRADE_THRESHOLDS
+from models import DialogueHistoryEntry
+
+# --- 결정적 채점 ---
+# BE가 턴마다 붙이는 verdict(safe/risky/unsafe)와 axes(취약 축별 점수, 클수록 취약)를 배열로 바꿔
+# 최근 턴 가중 평균으로 축별 취약도와 위험 점수를 계산합니다. 여러 세션은 패딩한 2차원/3차원 배열로 한 번에 계산합니다.
+
+_GRADES = [grade for grade, _ in SCORING_GRADE_THRESHOLDS] + ["F"]
+_GRADE_BOUNDS = np.array([bound for _, bound in SCORING_GRADE_THRESHOLDS])
+# 'unsafe' 대응이 있으면 받을 수 있는 가장 좋은 등급 (C)
+_UNSAFE_GRADE_INDEX = _GRADES.index("C")
+_VERDICT_WEIGHTS = SCORING_VERDICT_WEIGHTS
+_UNSAFE_WEIGHT = SCORING_VERDICT_WEIGHTS["unsafe"]
+
+
+def _scored_turns(history_list: list[DialogueHistoryEntry]) -> list[tuple[int, DialogueHistoryEntry]]:
+    """채점 정보(verdict 또는 axes)가 있는 턴과 그 턴 번호(1부터)"""
+    return [
+        (number, entry) for number, entry in enumerate(history_list, start=1)
+        if entry.verdict in _VERDICT_WEIGHTS or entry.axes
+    ]
+
+
+def _score_arrays(histories: list[list[DialogueHistoryEntry]]) -> dict:
+    """
+    세션 목록을 배열로 바꿔 한 번에 채점합니다.
+    - verdicts: (세션, 턴) 위험 점수, axes: (세션, 턴, 축) 취약 점수. 값이 없는 칸은 NaN
+    - 가중치는 세션마다 마지막 채점 턴이 1이고, 반감기(턴 수)마다 절반이 됩니다.
+    """
+    scored = [_scored_turns(history) for history in histories]
+    axis_names: dict[str, int] = {}
+    for turns in scored:
+        for _, entry in turns:
+            for axis in entry.axes or ():
+                axis_names.setdefault(axis, len(axis_names))
+
+    sessions = len(histories)
+    max_turns = max((len(turns) for turns in scored), default=0)
+    verdicts = np.full((sessions, max_turns), np.nan)
+    axes = np.full((sessions, max_turns, len(axis_names)), np.nan)
+    turn_numbers = np.zeros((sessions, max_turns), dtype=np.int64)
+    counts = np.zeros(sessions, dtype=np.int64)
+    for s, turns in enumerate(scored):
+        counts[s] = len(turns)
+        for t, (number, entry) in enumerate(turns):
+            turn_numbers[s, t] = number
+            if entry.verdict in _VERDICT_WEIGHTS:
+                verdicts[s, t] = _VERDICT_WEIGHTS[entry.verdict]
+            for axis, value in (entry.axes or {}).items():
+                axes[s, t, axis_names[axis]] = value
+
+    # 최근 턴 가중치 (채점 턴이 없는 패딩 칸은 0)
+    age = counts[:, None] - 1 - np.arange(max_turns)[None, :]
+    weights = np.where(age >= 0, 0.5 ** (np.maximum(age, 0) / SCORING_RECENCY_HALF_LIFE_TURNS), 0.0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        verdict_mask = ~np.isnan(verdicts)
+        verdict_weights = weights * verdict_mask
+        risk = np.nansum(verdicts * verdict_weights, axis=1) / verdict_weights.sum(axis=1)
+
+        axis_mask = ~np.isnan(axes)
+        axis_weights = weights[:, :, None] * axis_mask
+        axis_scores = np.nansum(axes * axis_weights, axis=1) / axis_weights.sum(axis=1)
+
+    # 등급: 위험 점수 구간으로 정하고, 'unsafe' 대응이 있으면 C보다 좋을 수 없습니다.
+    has_unsafe = (verdicts == _UNSAFE_WEIGHT).any(axis=1)
+    grade_index = np.searchsorted(_GRADE_BOUNDS, np.nan_to_num(risk), side="right")
+    grade_index = np.where(has_unsafe, np.maximum(grade_index, _UNSAFE_GRADE_INDEX), grade_index)
+
+    # 가장 위험했던 턴: verdict 점수가 가장 높은 턴 중 가장 최근 턴
+    riskiest_turn = np.zeros(sessions, dtype=np.int64)
+    if max_turns:
+        riskiest = np.argmax(np.where(verdict_mask, verdicts * 2 + weights, -1.0), axis=1)
+        riskiest_turn = turn_numbers[np.arange(sessions), riskiest]
+
+    return {
+        "axis_names": list(axis_names),
+        "counts": counts,
+        "verdicts": verdicts,
+        "risk": risk,
+        "grade_index": grade_index,
+        "axis_scores": axis_scores,
+        "riskiest_turn": riskiest_turn,
+    }
+
+
+def _session_result(arrays: dict, s: int) -> dict:
+    risk = arrays["risk"][s]
+    scored = not np.isnan(risk)
+    axis_scores = {
+        name: round(float(score), 4)
+        for name, score in zip(arrays["axis_names"], arrays["axis_scores"][s])
+        if not np.isnan(score)
+    }
+    verdict_row = arrays["verdicts"][s]
+    return {
+        "grade": _GRADES[arrays["grade_index"][s]] if scored else None,
+        "risk_score": round(float(risk), 4) if scored else None,
+        "highest_vulnerability_axis": max(axis_scores, key=axis_scores.get) if axis_scores else None,
+        "axis_scores": axis_scores,
+        "verdict_counts": {verdict: int((verdict_row == weight).sum()) for verdict, weight in _VERDICT_WEIGHTS.items()},
+        "scored_turns": int(arrays["counts"][s]),
+        "riskiest_turn": int(arrays["riskiest_turn"][s]) if scored else None,
+    }
+
+
+def score_session(history_list: list[DialogueHistoryEntry]) -> dict:
+    """
+    한 세션의 등급/위험 점수/축별 취약도를 계산합니다.
+    verdict가 하나도 없으면 grade와 risk_score는 None입니다. (축 정보만 있어도 취약 축은 계산)
+    """
+    return _session_result(_score_arrays([history_list]), 0)
+
+
+def highest_vulnerability_axis(history_list: list[DialogueHistoryEntry]) -> str | None:
+    """최근 턴 가중 취약도가 가장 높은 축 (axes 정보가 없으면 None)"""
+    return score_session(history_list)["highest_vulnerability_axis"]
+
+
+def score_sessions(histories: list[list[DialogueHistoryEntry]]) -> dict:
+    """
+    여러 세션을 한 번에 채점하고, 집단 통계(등급 분포, 평균 위험 점수, 축별 평균 취약도)를 함께 반환합니다.
+    """
+    arrays = _score_arrays(histories)
+    results = [_session_result(arrays, s) for s in range(len(histories))]
+    scored = ~np.isnan(arrays["risk"])
+    grade_counts = np.bincount(arrays["grade_index"][scored], minlength=len(_GRADES))
+    axis_scores = arrays["axis_scores"]
+    axis_present = ~np.isnan(axis_scores)
+    axis_counts = axis_present.sum(axis=0)
+    axis_means = np.where(axis_present, axis_scores, 0.0).sum(axis=0) / np.maximum(axis_counts, 1)
+    highest_axis_counts: dict[str, int] = {}
+    for result in results:
+        axis = result["highest_vulnerability_axis"]
+        if axis is not None:
+            highest_axis_counts[axis] = highest_axis_counts.get(axis, 0) + 1
+
+    return {
+        "results": results,
+        "cohort": {
+            "sessions": len(histories),
+            "scored_sessions": int(scored.sum()),
+            "grade_distribution": {grade: int(count) for grade, count in zip(_GRADES, grade_counts)},
+            "mean_risk_score": round(float(arrays["risk"][scored].mean()), 4) if scored.any() else None,
+            "axis_means": {
+                name: round(float(mean), 4)
+                for name, mean, count in zip(arrays["axis_names"], axis_means, axis_counts) if count
+            },
+            "highest_axis_counts": highest_axis_counts,
+        },
+    }
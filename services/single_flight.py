@@ -0,0 +1,100 @@
+import json
+import asyncio
+import hashlib
+
+from config import REQUEST_COALESCING_ENABLED
+from services.metrics_service import COALESCED_CALLS
+
+# --- 동시 요청 합치기 (single-flight) ---
+# BE의 타임아웃 재시도나 사용자의 연속 클릭으로 같은 요청이 몇 초 안에 여러 번 들어오면,
+# 첫 요청만 Gemini/Vision을 호출하고 나머지는 진행 중인 호출의 결과를 함께 기다립니다.
+# 결과를 보관하지는 않으므로(보관은 ResultCache 담당) 호출이 끝난 뒤 들어온 요청은 새로 실행합니다.
+
+# 통계 조회용 (생성된 모든 SingleFlight)
+_REGISTRY: list["SingleFlight"] = []
+
+
+def request_key(*parts) -> str:
+    """호출 입력(엔드포인트, 프롬프트 등)의 정규화된 해시. dict는 키 순서와 관계없이 같은 값이 됩니다."""
+    canonical = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    키별로 진행 중인 호출을 하나만 유지하는 표.
+    - 같은 키의 호출이 진행 중이면 factory를 실행하지 않고 그 결과(또는 예외)를 함께 받습니다.
+    - 기다리던 요청 하나가 취소되어도(연결 끊김 등) 공유 호출은 계속되고, 다른 요청은 결과를 받습니다.
+    - 기다리는 요청이 모두 떠나면 cancel_when_abandoned일 때 공유 호출도 취소합니다. (아무도 받지 않을 호출에 쿼터를 쓰지 않음)
+      결과를 캐시에 저장하는 등 끝까지 실행할 가치가 있는 호출은 False로 둡니다.
+    """
+
+    def __init__(self, name: str, cancel_when_abandoned: bool = True):
+        self.name = name
+        self.cancel_when_abandoned = cancel_when_abandoned
+        self._flights: dict[str, _Flight] = {}
+        self._stats = {"executed": 0, "coalesced": 0, "abandoned": 0, "failed": 0}
+        _REGISTRY.append(self)
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._flights
+
+    async def do(self, key: str, factory):
+        """
+        key의 호출이 진행 중이면 합류하고, 없으면 factory()로 새로 시작해 결과를 반환합니다.
+        factory는 코루틴이나 Future를 반환하는 함수입니다. (여러 키를 한 번에 처리하는 배치는 키별 Future를 넘김)
+        """
+        if not REQUEST_COALESCING_ENABLED:
+            return await factory()
+
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.future.add_done_callback(lambda future: self._finish(key, flight))
+            self._count("executed")
+        else:
+            self._count("coalesced")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.future)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.future.done() and self.cancel_when_abandoned:
+                # 마지막 요청이 떠난 호출은 바로 표에서 빼서, 이후 같은 요청이 취소 중인 호출에 합류하지 않게 합니다.
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.future.cancel()
+                self._count("abandoned")
+
+    def _finish(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if flight.future.cancelled():
+            return
+        # 기다리는 요청이 없어도 '예외가 처리되지 않았다'는 경고가 남지 않도록 여기서 확인합니다.
+        if flight.future.exception() is not None:
+            self._stats["failed"] += 1
+
+    def _count(self, outcome: str) -> None:
+        self._stats[outcome] += 1
+        COALESCED_CALLS.labels(self.name, outcome).inc()
+
+    def stats(self) -> dict:
+        executed, coalesced = self._stats["executed"], self._stats["coalesced"]
+        return {
+            **self._stats,
+            "in_flight": len(self._flights),
+            "coalesced_ratio": round(coalesced / (executed + coalesced), 4) if executed + coalesced else 0.0,
+        }
+
+
+def coalescing_stats() -> dict:
+    return {"enabled": REQUEST_COALESCING_ENABLED, **{flight.name: flight.stats() for flight in _REGISTRY}}
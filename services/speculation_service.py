@@ -0,0 +1,175 @@
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict, deque
+
+from config import (
+    SPECULATIVE_TURNS_ENABLED, SPECULATIVE_CACHE_SIZE, SPECULATIVE_TTL_SECONDS,
+    SPECULATIVE_MAX_CALLS_PER_MINUTE
+)
+from models import DialogueHistoryEntry
+from services import gemini_service
+from services.gemini_scheduler import PriorityUpgrade, background_priority
+from services.log_service import get_logger
+
+_LOG = get_logger("speculation")
+
+# --- 추측 생성 캐시 ---
+# 적응형 턴은 항상 safe/risky/unsafe 3개 선택지를 돌려주므로, 다음 요청의 대화 기록은
+# '현재 기록 + AI 대사 + 선택지 하나' 세 가지 중 하나입니다. 응답 직후 세 갈래의 다음 턴을
+# 미리 생성해 두고, 실제 다음 요청이 오면 바로 반환합니다.
+# 다음 요청의 최대 취약점은 BE가 새 턴을 채점한 뒤에야 정해지므로 키에 넣지 않고, 조회할 때 생성에 쓴 값과 같은지 확인합니다.
+_entries: OrderedDict[str, dict] = OrderedDict()   # key -> {"task", "parent", "axis", "upgrade", "expires_at"}
+_siblings: dict[str, set[str]] = {}                 # parent key -> 같은 응답에서 갈라진 key들
+_call_times: deque[float] = deque()                 # 최근 1분간 추측 호출 시각 (예산 관리)
+
+_STATS = {
+    "speculated": 0,       # 추측으로 실행한 Gemini 호출 수
+    "hits": 0,             # 미리 만든 결과를 그대로 반환한 요청 수
+    "misses": 0,           # 추측 캐시에 없던 요청 수
+    "axis_mismatches": 0,  # 미리 만든 턴이 있었지만 최대 취약점이 달라 버린 요청 수 (misses에 포함)
+    "wasted": 0,           # 사용되지 않고 버려진 추측 호출 수
+    "budget_skipped": 0,   # 예산 초과로 건너뛴 추측 호출 수
+}
+
+
+def _turn_key(crime_type: str, history_list: list[DialogueHistoryEntry]) -> str:
+    # BE가 채점 후 붙이는 verdict/axes, 역할 표기 차이는 키에서 제외하고 대사 내용만 사용합니다.
+    digest = hashlib.sha256()
+    digest.update(crime_type.encode("utf-8"))
+    for entry in history_list:
+        digest.update(b"\x1e")
+        digest.update(entry.text.strip().encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _discard(key: str, wasted: bool) -> None:
+    entry = _entries.pop(key, None)
+    if entry is None:
+        return
+    siblings = _siblings.get(entry["parent"])
+    if siblings is not None:
+        siblings.discard(key)
+        if not siblings:
+            del _siblings[entry["parent"]]
+    if wasted:
+        _STATS["wasted"] += 1
+        if not entry["task"].done():
+            entry["task"].cancel()
+
+
+def _evict_expired(now: float) -> None:
+    for key in [key for key, entry in _entries.items() if entry["expires_at"] <= now]:
+        _discard(key, wasted=True)
+    while len(_entries) > SPECULATIVE_CACHE_SIZE:
+        _discard(next(iter(_entries)), wasted=True)
+
+
+def _take_budget(now: float) -> bool:
+    while _call_times and _call_times[0] <= now - 60:
+        _call_times.popleft()
+    if len(_call_times) >= SPECULATIVE_MAX_CALLS_PER_MINUTE:
+        return False
+    _call_times.append(now)
+    return True
+
+
+async def lookup(crime_type: str, history_list: list[DialogueHistoryEntry], highest_vulnerability_axis: str) -> dict | None:
+    """
+    미리 생성해 둔 다음 턴이 있으면 반환합니다. (생성 중이면 우선순위를 적응형 턴으로 올리고 완료를 기다림)
+    사용된 갈래의 형제 갈래들은 더 이상 쓰일 일이 없으므로 즉시 정리합니다.
+    생성에 쓴 최대 취약점이 이번 요청과 다르면 그 턴은 쓰지 않고 버립니다.
+    """
+    if not SPECULATIVE_TURNS_ENABLED:
+        return None
+    _evict_expired(time.time())
+    key = _turn_key(crime_type, history_list)
+    entry = _entries.get(key)
+    if entry is None:
+        _STATS["misses"] += 1
+        return None
+
+    for sibling in list(_siblings.get(entry["parent"], ())):
+        if sibling != key:
+            _discard(sibling, wasted=True)
+    if entry["axis"] != highest_vulnerability_axis:
+        _discard(key, wasted=True)
+        _STATS["axis_mismatches"] += 1
+        _STATS["misses"] += 1
+        return None
+    _discard(key, wasted=False)
+    entry["upgrade"].upgrade()
+
+    try:
+        result = await asyncio.shield(entry["task"])
+    except Exception as e:
+        _LOG.warning("추측 생성 결과 사용 실패", error=str(e))
+        _STATS["misses"] += 1
+        return None
+    if "error" in result:
+        _STATS["misses"] += 1
+        return None
+    _STATS["hits"] += 1
+    return dict(result)
+
+
+async def _speculative_turn(upgrade: PriorityUpgrade, **kwargs) -> dict:
+    # 아직 아무도 기다리지 않으므로 가장 낮은 우선순위로 실행하고, 실제 요청이 합류하면(lookup) 적응형 턴 우선순위로 올립니다.
+    # 과부하로 거절되면 실패 결과로 남겨 다음 요청이 직접 생성하게 합니다.
+    with background_priority(upgrade):
+        try:
+            return await gemini_service.generate_adaptive_turn(**kwargs)
+        except gemini_service.OverloadedError as e:
+            return {"error": str(e)}
+
+
+async def speculate(crime_type: str, history_list: list[DialogueHistoryEntry], highest_vulnerability_axis: str, turn: dict) -> None:
+    """
+    방금 반환한 적응형 턴(turn)의 각 선택지에 대해 다음 턴을 백그라운드에서 생성해 둡니다.
+    (FastAPI BackgroundTasks로 응답 전송 후 실행)
+    """
+    if not SPECULATIVE_TURNS_ENABLED or "error" in turn or not turn.get("options"):
+        return
+    now = time.time()
+    _evict_expired(now)
+
+    parent = _turn_key(crime_type, history_list)
+    agent_entry = DialogueHistoryEntry(role="agent", text=turn.get("next_speech", ""))
+    for option in turn["options"]:
+        next_history = list(history_list) + [
+            agent_entry,
+            DialogueHistoryEntry(role="user", text=option.get("text", ""), verdict=option.get("verdict")),
+        ]
+        key = _turn_key(crime_type, next_history)
+        if key in _entries:
+            continue
+        if not _take_budget(now):
+            _STATS["budget_skipped"] += 1
+            continue
+
+        upgrade = PriorityUpgrade()
+        task = asyncio.get_running_loop().create_task(_speculative_turn(
+            upgrade,
+            crime_type=crime_type,
+            history_list=next_history,
+            highest_vulnerability_axis=highest_vulnerability_axis
+        ))
+        _entries[key] = {
+            "task": task, "parent": parent, "axis": highest_vulnerability_axis, "upgrade": upgrade,
+            "expires_at": now + SPECULATIVE_TTL_SECONDS,
+        }
+        _siblings.setdefault(parent, set()).add(key)
+        _STATS["speculated"] += 1
+    _evict_expired(now)
+
+
+def speculation_stats() -> dict:
+    lookups = _STATS["hits"] + _STATS["misses"]
+    return {
+        "enabled": SPECULATIVE_TURNS_ENABLED,
+        **_STATS,
+        "hit_rate": round(_STATS["hits"] / lookups, 4) if lookups else 0.0,
+        "cached": len(_entries),
+        "calls_last_minute": len(_call_times),
+        "max_calls_per_minute": SPECULATIVE_MAX_CALLS_PER_MINUTE,
+    }
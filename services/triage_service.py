@@ -0,0 +1,257 @@
+import re
+import json
+import asyncio
+import threading
+
+from config import (
+    TRIAGE_LLM_BAND_LOW, TRIAGE_LLM_BAND_HIGH, TRIAGE_TRAINING_PATH,
+    TRIAGE_HOLDOUT_RATIO, TRIAGE_MIN_TRAINING_EXAMPLES, TRIAGE_MIN_PRECISION
+)
+from services import gemini_service
+from services.cache_service import DIAGNOSIS_CACHE, hash_text
+from services.log_service import get_logger
+from services.metrics_service import stage
+
+_LOG = get_logger("triage")
+
+# --- 키워드 매처 ---
+# (정규식, 가중치) 목록. 판정 근거(detected_keywords)로 보여줄 표현을 찾는 데만 쓰며, 가중치는 표시 순서입니다.
+# (판정 점수는 라벨 데이터로 학습·보정한 분류기만 사용합니다)
+KEYWORD_RULES = [
+    (r"안전\s*계좌|보호\s*계좌|국가\s*안전\s*계좌", 0.7),
+    (r"검찰청?|검사|수사관|사건\s*번호|금융\s*감독원|금감원|경찰청", 0.35),
+    (r"계좌\s*이체|송금|입금\s*(해|부탁|바랍)|이체\s*(해|부탁)", 0.25),
+    (r"bit\.ly|han\.gl|me2\.do|url\.kr|tinyurl|vo\.la|buly\.kr|t\.ly", 0.45),
+    (r"폰\s*(이\s*)?(고장|액정|깨졌)|휴대폰\s*(고장|수리)", 0.45),
+    (r"원격\s*(제어|지원)|앱\s*설치|팀뷰어|애니\s*데스크|퀵\s*서포트", 0.45),
+    (r"인증\s*번호|OTP|비밀\s*번호|보안\s*카드", 0.35),
+    (r"신분증\s*(사진|촬영|보내)", 0.4),
+    (r"상품권|기프트\s*카드|문화\s*상품권|구글\s*기프트", 0.35),
+    (r"선\s*입금|수수료\s*(먼저|입금)|보증금\s*먼저", 0.4),
+    (r"저금리\s*대출|대환\s*대출|정부\s*지원\s*대출|대출\s*(승인|한도)", 0.4),
+    (r"해외\s*결제|결제\s*(승인|완료).{0,20}(본인이\s*아닐|문의)", 0.4),
+    (r"택배.{0,20}(주소\s*(불일치|확인)|보관\s*중)|미납\s*(요금|과태료)", 0.35),
+    (r"부고|청첩장|모바일\s*초대장", 0.2),
+    (r"안전\s*결제\s*링크|외부\s*결제|카톡으로\s*(연락|대화)", 0.35),
+]
+_COMPILED_RULES = [(re.compile(pattern, re.IGNORECASE), weight) for pattern, weight in KEYWORD_RULES]
+
+# LLM 없이 판정할 때 사용하는 안내 문구
+_FAST_PATH_TEMPLATES = {
+    "위험": {
+        "title": "금융사기 의심 메시지입니다",
+        "summary": "신고된 금융사기 문자와 매우 비슷한 표현이 발견되었습니다.",
+        "guide": "링크를 누르거나 송금하지 말고, 해당 기관의 공식 대표번호로 직접 확인하세요.",
+        "keyword": "사기 의심 문구",     # 규칙에 걸린 표현이 없을 때 detected_keywords에 넣을 값 (최소 1개)
+    },
+    "관심": {
+        "title": "뚜렷한 사기 징후는 발견되지 않았습니다",
+        "summary": "신고된 금융사기 문자와 비슷한 표현이 거의 없습니다.",
+        "guide": "다만 금전 요구나 링크가 추가로 오면 다시 한 번 확인해보세요.",
+        "keyword": "특이 표현 없음",
+    },
+}
+
+
+class _TriageModel:
+    """
+    문자 n-gram TF-IDF + 보정(sigmoid calibration)된 로지스틱 회귀 분류기. 첫 사용 시 한 번만 학습합니다.
+    - TRIAGE_TRAINING_PATH(JSONL: {"text": ..., "label": 0|1})의 라벨 데이터가 있어야 학습하며, 없으면 fast path를 쓰지 않습니다.
+    - 데이터의 일부(TRIAGE_HOLDOUT_RATIO)를 떼어 두고 나머지로 학습한 뒤, 떼어 둔 데이터로 fast path 판정의 정밀도를 잽니다.
+      '위험'/'관심' 각각 정밀도가 TRIAGE_MIN_PRECISION 이상인 쪽만 LLM 없이 판정합니다. (나머지는 모두 Gemini로 진단)
+    """
+
+    def __init__(self):
+        self._pipeline = None
+        self._fitted = False
+        self._lock = threading.Lock()
+        self.validation: dict = {"status": "not_trained"}
+        self.scam_enabled = False       # 점수 >= BAND_HIGH면 '위험'으로 바로 판정
+        self.benign_enabled = False     # 점수 <= BAND_LOW면 '관심'으로 바로 판정
+
+    @property
+    def ready(self) -> bool:
+        return self._fitted
+
+    def _load_examples(self) -> list[tuple[str, int]]:
+        examples = []
+        try:
+            with open(TRIAGE_TRAINING_PATH, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        row = json.loads(line)
+                        examples.append((row["text"], int(row["label"])))
+        except (OSError, ValueError, KeyError) as e:
+            _LOG.warning("사전 분류 학습 데이터 로드 실패, fast path를 쓰지 않습니다", path=TRIAGE_TRAINING_PATH, error=str(e))
+            return []
+        return examples
+
+    def _fit(self) -> None:
+        if not TRIAGE_TRAINING_PATH:
+            # 라벨 데이터는 저장소/이미지에 포함되지 않으므로, 경로를 설정하기 전까지 fast path는 항상 Gemini로 진단합니다.
+            self.validation = {"status": "no_training_data"}
+            _LOG.warning("TRIAGE_TRAINING_PATH가 없어 mode=fast도 항상 Gemini로 진단합니다")
+            return
+        examples = self._load_examples()
+        labels = [label for _, label in examples]
+        if len(examples) < TRIAGE_MIN_TRAINING_EXAMPLES or min(labels.count(0), labels.count(1)) < 10:
+            self.validation = {"status": "insufficient_training_data", "examples": len(examples), "scam_examples": labels.count(1)}
+            _LOG.warning("사전 분류 학습 데이터가 부족해 fast path를 쓰지 않습니다", **self.validation)
+            return
+
+        import numpy as np
+        from sklearn.calibration import CalibratedClassifierCV
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.model_selection import train_test_split
+        from sklearn.pipeline import make_pipeline
+
+        texts = [text for text, _ in examples]
+        train_texts, test_texts, train_labels, test_labels = train_test_split(
+            texts, labels, test_size=TRIAGE_HOLDOUT_RATIO, stratify=labels, random_state=0
+        )
+        pipeline = make_pipeline(
+            TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 4), sublinear_tf=True, min_df=2),
+            CalibratedClassifierCV(LogisticRegression(max_iter=1000, class_weight="balanced"), method="sigmoid", cv=5)
+        )
+        pipeline.fit(train_texts, train_labels)
+
+        # 떼어 둔 데이터로 실제 fast path 판정(구간 밖)의 정밀도를 잽니다. (보고되는 값은 서비스에 쓰는 바로 이 모델의 성능)
+        scores = pipeline.predict_proba(test_texts)[:, 1]
+        truth = np.array(test_labels)
+        scam = scores >= TRIAGE_LLM_BAND_HIGH
+        benign = scores <= TRIAGE_LLM_BAND_LOW
+        scam_precision = float((truth[scam] == 1).mean()) if scam.any() else None
+        benign_precision = float((truth[benign] == 0).mean()) if benign.any() else None
+        self.scam_enabled = scam_precision is not None and scam_precision >= TRIAGE_MIN_PRECISION
+        self.benign_enabled = benign_precision is not None and benign_precision >= TRIAGE_MIN_PRECISION
+        self.validation = {
+            "status": "validated" if self.scam_enabled or self.benign_enabled else "below_precision_target",
+            "train_examples": len(train_texts),
+            "holdout_examples": len(test_texts),
+            "min_precision": TRIAGE_MIN_PRECISION,
+            "scam_precision": round(scam_precision, 4) if scam_precision is not None else None,
+            "scam_decisions": int(scam.sum()),
+            "benign_precision": round(benign_precision, 4) if benign_precision is not None else None,
+            "benign_decisions": int(benign.sum()),
+            # LLM 없이 판정할 수 있는 비율 (정밀도 기준을 통과한 쪽만)
+            "holdout_fast_path_rate": round(float(((scam & self.scam_enabled) | (benign & self.benign_enabled)).mean()), 4),
+        }
+        _LOG.info("사전 분류기 학습 및 검증 완료", **self.validation)
+        self._pipeline = pipeline
+
+    def ensure_fitted(self) -> None:
+        if not self._fitted:
+            with self._lock:
+                if not self._fitted:
+                    self._fit()
+                    self._fitted = True
+
+    def predict_proba(self, text: str) -> float | None:
+        """사기일 확률 (학습된 모델이 없으면 None)"""
+        self.ensure_fitted()
+        if self._pipeline is None:
+            return None
+        return float(self._pipeline.predict_proba([text])[0][1])
+
+
+_MODEL = _TriageModel()
+
+
+def warm_up() -> None:
+    """(서버 시작 시, 스레드에서) 분류기를 미리 학습/검증해 첫 진단 요청이 학습 시간을 기다리지 않게 합니다."""
+    _MODEL.ensure_fitted()
+
+
+# --- 지표 ---
+_STATS = {
+    "fast_path": 0,        # LLM 없이 판정 (절약된 호출 수)
+    "escalated": 0,        # 신뢰도가 구간 안에 있어 LLM으로 넘긴 횟수
+    "cache_hits": 0,       # 이전 진단 결과(DIAGNOSIS_CACHE)를 그대로 반환한 횟수
+    "unavailable": 0,      # 검증된 분류기가 없어 mode=fast 요청을 LLM으로 진단한 횟수
+    "full_mode": 0,        # 클라이언트가 mode=full을 지정한(또는 기본값) 횟수
+}
+
+
+def match_keywords(text: str) -> list[str]:
+    """키워드 규칙에 걸린 표현들을 가중치가 큰 순서로 반환합니다. (판정 근거 표시용, 점수에는 쓰지 않음)"""
+    detected = []
+    for pattern, weight in _COMPILED_RULES:
+        match = pattern.search(text)
+        if match:
+            detected.append((weight, match.group(0)))
+    detected.sort(key=lambda item: item[0], reverse=True)
+    return [keyword for _, keyword in detected]
+
+
+def classify(text: str) -> dict:
+    """
+    로컬 분류기로 텍스트를 빠르게 판정합니다.
+    - scam_score: 보정된 분류기의 사기 확률 (학습 데이터가 없으면 None)
+    - risk_level: 검증을 통과한 쪽의 구간 밖이면 '위험'/'관심', 아니면 '주의'(LLM으로 진단)
+    """
+    keywords = match_keywords(text)
+    scam_score = _MODEL.predict_proba(text)
+    risk_level = "주의"
+    if scam_score is not None:
+        if scam_score >= TRIAGE_LLM_BAND_HIGH and _MODEL.scam_enabled:
+            risk_level = "위험"
+        elif scam_score <= TRIAGE_LLM_BAND_LOW and _MODEL.benign_enabled:
+            risk_level = "관심"
+    return {
+        "risk_level": risk_level,
+        "detected_keywords": keywords[:3],
+        "scam_score": round(scam_score, 4) if scam_score is not None else None,
+    }
+
+
+def _with_scores(result: dict, scam_score: float | None = None, confidence: float | None = None) -> dict:
+    return {**result, "scam_score": scam_score, "confidence": confidence}
+
+
+async def diagnose(text: str, mode: str = "full") -> dict:
+    """
+    mode='fast'면 로컬 판정 결과가 확실한 경우 바로 반환하고, 애매한 경우(설정된 구간 안)에만 Gemini로 진단합니다.
+    응답 형식은 TriageDiagnosisResponse(Gemini 진단 + scam_score/confidence)입니다. mode='full'(기본값)이면 항상 Gemini로 진단합니다.
+    """
+    if mode == "full":
+        _STATS["full_mode"] += 1
+        return _with_scores(await gemini_service.diagnose_text_risk(text))
+
+    # 같은 문자를 이미 Gemini로 진단했다면 로컬 판정보다 그 결과를 우선합니다.
+    cached = await DIAGNOSIS_CACHE.aget(hash_text(text))
+    if cached is not None:
+        _STATS["cache_hits"] += 1
+        return _with_scores(cached)
+
+    with stage("triage"):
+        # 학습이 끝나기 전(워밍업 중)에는 학습을 기다리는 동안 이벤트 루프가 멈추지 않도록 스레드에서 판정합니다.
+        triage = classify(text) if _MODEL.ready else await asyncio.to_thread(classify, text)
+    scam_score = triage["scam_score"]
+    if scam_score is None or not (_MODEL.scam_enabled or _MODEL.benign_enabled):
+        _STATS["unavailable"] += 1
+        return _with_scores(await gemini_service.diagnose_text_risk(text))
+    if triage["risk_level"] == "주의":
+        _STATS["escalated"] += 1
+        return _with_scores(await gemini_service.diagnose_text_risk(text), scam_score)
+
+    _STATS["fast_path"] += 1
+    template = _FAST_PATH_TEMPLATES[triage["risk_level"]]
+    return _with_scores({
+        "risk_level": triage["risk_level"],
+        "title": template["title"],
+        "detected_keywords": triage["detected_keywords"] or [template["keyword"]],
+        "summary": template["summary"],
+        "guide": template["guide"],
+    }, scam_score, scam_score if triage["risk_level"] == "위험" else round(1 - scam_score, 4))
+
+
+def triage_stats() -> dict:
+    decided = _STATS["fast_path"] + _STATS["escalated"]
+    return {
+        **_STATS,
+        "llm_calls_saved": _STATS["fast_path"],
+        "fast_path_rate": round(_STATS["fast_path"] / decided, 4) if decided else 0.0,
+        "llm_band": [TRIAGE_LLM_BAND_LOW, TRIAGE_LLM_BAND_HIGH],
+        "validation": _MODEL.validation,
+    }
@@ -0,0 +1,287 @@
+import re
+import copy
+import random
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from config import (
+    TURN_CACHE_ENABLED, TURN_CACHE_MAX_ENTRIES, TURN_CACHE_SIMILARITY, TURN_CACHE_TOP_K,
+    TURN_CACHE_CONTEXT_TURNS, TURN_CACHE_MAX_VARIANTS
+)
+from models import DialogueHistoryEntry
+
+# --- 적응형 턴 근사 중복 캐시 ---
+# 사용자가 같은 선택지를 고르는 경우가 많아, (crime_type, 최대 취약점, 턴 수)가 같고 최근 대화만 조금 다른 요청이 반복됩니다.
+# 최근 대화를 문자 n-gram TF-IDF 벡터로 바꿔, 코사인 유사도가 임계값 이상인 이전 턴을 Gemini 호출 없이 반환합니다.
+# 최근 대화 전체가 비슷해도 마지막 대사(보통 사용자의 답)가 다르면 다음 턴도 달라야 하므로, 마지막 대사끼리의 유사도도 함께 요구합니다.
+# 대화가 매번 똑같아지지 않도록 유사한 상위 몇 개 중 하나를 무작위로 고릅니다.
+
+# 해싱 벡터 차원 (어휘를 미리 학습하지 않으므로 새 항목을 바로 색인에 추가할 수 있음)
+_N_FEATURES = 2 ** 18
+# 문서 빈도가 바뀐 만큼 저장된 벡터의 IDF 가중치가 낡으므로, 이 횟수만큼 추가/삭제할 때마다 전체를 다시 가중합니다.
+_REWEIGHT_EVERY = 512
+# 물음표/말줄임표 등 문장부호 차이는 같은 답으로 봅니다.
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+
+_STATS = {
+    "lookups": 0,
+    "hits": 0,
+    "stored": 0,               # 색인에 추가한 턴 수
+    "variant_skipped": 0,      # 같은 대화 기록의 변형이 이미 충분해 추가하지 않은 턴 수
+    "evicted": 0,              # 크기 상한으로 정리한 턴 수 (가장 오래 사용되지 않은 것부터)
+    "reweighted": 0,           # 전체 IDF 재가중 횟수
+}
+# 턴 수(대화 기록 길이)별 [조회, 적중] (어느 구간에서 호출을 절약하는지 확인용)
+_BY_TURNS: dict[int, list[int]] = {}
+
+
+class _Entry:
+    def __init__(self, bucket: tuple, exact_key: str, counts, last_counts, turn: dict):
+        self.bucket = bucket
+        self.exact_key = exact_key
+        self.counts = counts              # 최근 대화의 가중 전 TF (1 x _N_FEATURES 희소 행)
+        self.last_counts = last_counts    # 마지막 대사의 가중 전 TF
+        self.vector = None                # IDF 가중 + L2 정규화된 행
+        self.last_vector = None
+        self.turn = turn
+
+
+class _Bucket:
+    """같은 (crime_type, 취약점, 턴 수)의 항목들과, 조회할 때 만드는 가중 벡터 행렬"""
+
+    def __init__(self):
+        self.ids: list[int] = []
+        self.matrices = None          # (최근 대화 행렬, 마지막 대사 행렬). None이면 다음 조회 때 다시 쌓음
+
+    def add(self, entry_id: int) -> None:
+        self.ids.append(entry_id)
+        self.matrices = None
+
+    def remove(self, entry_id: int) -> None:
+        self.ids.remove(entry_id)
+        self.matrices = None
+
+
+class SemanticTurnCache:
+    """
+    크기 제한이 있는 LRU 근사 중복 캐시.
+    - 벡터화는 HashingVectorizer(문자 n-gram, 어휘 학습 없음) + 항목 추가/삭제 때마다 갱신하는 문서 빈도 기반 IDF
+    - 색인은 버킷별 희소 행렬이며, 추가/삭제는 해당 버킷만 다시 쌓습니다.
+    - 잠금이 없으므로 조회/저장은 모두 이벤트 루프에서만 호출합니다. (BackgroundTasks에 동기 함수로 넘기면 스레드풀에서 실행되어 경쟁 상태가 됩니다)
+    """
+
+    def __init__(self, max_entries: int, similarity: float, top_k: int, context_turns: int, max_variants: int):
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.top_k = top_k
+        self.context_turns = context_turns
+        self.max_variants = max_variants
+        self._vectorizer = None
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()   # 최근 사용 순
+        self._buckets: dict[tuple, _Bucket] = {}
+        self._variants: dict[str, int] = {}                       # 정확히 같은 대화 기록별 저장된 변형 수
+        self._df = np.zeros(_N_FEATURES, dtype=np.int32)
+        self._idf = np.ones(_N_FEATURES, dtype=np.float64)
+        self._next_id = 0
+        self._changes = 0
+
+    @staticmethod
+    def warm_up() -> None:
+        """(서버 시작 시, 스레드에서) scikit-learn을 미리 불러옵니다. 캐시 상태는 건드리지 않습니다."""
+        import sklearn.feature_extraction.text  # noqa: F401
+
+    def _get_vectorizer(self):
+        if self._vectorizer is None:
+            from sklearn.feature_extraction.text import HashingVectorizer  # 서버 시작 시간을 줄이기 위해 처음 사용할 때 import
+            self._vectorizer = HashingVectorizer(
+                analyzer="char_wb", ngram_range=(2, 4), n_features=_N_FEATURES,
+                alternate_sign=False, norm=None
+            )
+        return self._vectorizer
+
+    @staticmethod
+    def _bucket_key(crime_type: str, history_list: list[DialogueHistoryEntry], highest_vulnerability_axis: str) -> tuple:
+        return crime_type, highest_vulnerability_axis or "", len(history_list)
+
+    @staticmethod
+    def _exact_key(bucket: tuple, history_list: list[DialogueHistoryEntry]) -> str:
+        # BE가 채점 후 붙이는 verdict/axes는 제외하고 대사 내용만 사용합니다.
+        digest = hashlib.sha256(repr(bucket).encode("utf-8"))
+        for entry in history_list:
+            digest.update(b"\x1e")
+            digest.update(entry.text.strip().encode("utf-8"))
+        return digest.hexdigest()
+
+    def _counts(self, history_list: list[DialogueHistoryEntry]):
+        """
+        최근 context_turns개 대사와 마지막 대사의 TF 행
+        (긴 대화에서 자주 나오는 n-gram이 지배하지 않도록 1 + log(tf))
+        """
+        def line(entry: DialogueHistoryEntry) -> str:
+            return f"{entry.role} {' '.join(_PUNCTUATION_RE.sub(' ', entry.text).split())}"
+
+        recent = history_list[-self.context_turns:] if self.context_turns else []
+        texts = ["\n".join(line(entry) for entry in recent), line(history_list[-1]) if history_list else ""]
+        counts = self._get_vectorizer().transform(texts).tocsr()
+        counts.data = 1.0 + np.log(counts.data)
+        return counts[0], counts[1]
+
+    def _weigh(self, counts):
+        vector = counts.copy()
+        vector.data = vector.data * self._idf[vector.indices]
+        norm = np.sqrt((vector.data ** 2).sum())
+        if norm:
+            vector.data /= norm
+        return vector
+
+    def _update_idf(self, indices, delta: int) -> None:
+        self._df[indices] += delta
+        n = len(self._entries)
+        self._idf[indices] = np.log((1 + n) / (1 + self._df[indices])) + 1.0
+        self._changes += 1
+        if self._changes >= _REWEIGHT_EVERY:
+            self._reweight()
+
+    def _reweight(self) -> None:
+        # 항목 수가 바뀌면 모든 특성의 IDF가 조금씩 바뀌므로 주기적으로 전체를 다시 계산합니다.
+        self._idf = np.log((1 + len(self._entries)) / (1 + self._df.astype(np.float64))) + 1.0
+        for entry in self._entries.values():
+            entry.vector = self._weigh(entry.counts)
+            entry.last_vector = self._weigh(entry.last_counts)
+        for bucket in self._buckets.values():
+            bucket.matrices = None
+        self._changes = 0
+        _STATS["reweighted"] += 1
+
+    def _matrices(self, bucket: _Bucket):
+        if bucket.matrices is None:
+            from scipy.sparse import vstack
+            entries = [self._entries[entry_id] for entry_id in bucket.ids]
+            bucket.matrices = (
+                vstack([entry.vector for entry in entries], format="csr"),
+                vstack([entry.last_vector for entry in entries], format="csr"),
+            )
+        return bucket.matrices
+
+    def lookup(self, crime_type: str, history_list: list[DialogueHistoryEntry], highest_vulnerability_axis: str) -> dict | None:
+        """유사도가 임계값 이상인 캐시된 턴 중 상위 top_k개에서 하나를 무작위로 골라 반환합니다. (없으면 None)"""
+        bucket_key = self._bucket_key(crime_type, history_list, highest_vulnerability_axis)
+        by_turns = _BY_TURNS.setdefault(len(history_list), [0, 0])
+        _STATS["lookups"] += 1
+        by_turns[0] += 1
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None or not bucket.ids:
+            return None
+
+        counts, last_counts = self._counts(history_list)
+        matrix, last_matrix = self._matrices(bucket)
+        # 최근 대화와 마지막 대사 유사도 중 낮은 쪽을 점수로 사용합니다.
+        scores = np.minimum(
+            (matrix @ self._weigh(counts).T).toarray().ravel(),
+            (last_matrix @ self._weigh(last_counts).T).toarray().ravel(),
+        )
+        candidates = np.flatnonzero(scores >= self.similarity)
+        if not len(candidates):
+            return None
+        top = candidates[np.argsort(scores[candidates])[::-1][:self.top_k]]
+        entry_id = bucket.ids[int(random.choice(top))]
+        self._entries.move_to_end(entry_id)
+        _STATS["hits"] += 1
+        by_turns[1] += 1
+        return copy.deepcopy(self._entries[entry_id].turn)
+
+    def store(self, crime_type: str, history_list: list[DialogueHistoryEntry], highest_vulnerability_axis: str, turn: dict) -> None:
+        """Gemini가 생성한 턴을 색인에 추가합니다. (같은 대화 기록의 변형은 max_variants개까지 보관해 무작위 선택에 사용)"""
+        bucket_key = self._bucket_key(crime_type, history_list, highest_vulnerability_axis)
+        exact_key = self._exact_key(bucket_key, history_list)
+        if self._variants.get(exact_key, 0) >= self.max_variants:
+            _STATS["variant_skipped"] += 1
+            return
+
+        entry = _Entry(bucket_key, exact_key, *self._counts(history_list), copy.deepcopy(turn))
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = entry
+        self._variants[exact_key] = self._variants.get(exact_key, 0) + 1
+        self._buckets.setdefault(bucket_key, _Bucket()).add(entry_id)
+        self._update_idf(entry.counts.indices, 1)
+        entry.vector = self._weigh(entry.counts)
+        entry.last_vector = self._weigh(entry.last_counts)
+        _STATS["stored"] += 1
+
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        bucket = self._buckets[entry.bucket]
+        bucket.remove(entry_id)
+        if not bucket.ids:
+            del self._buckets[entry.bucket]
+        self._variants[entry.exact_key] -= 1
+        if not self._variants[entry.exact_key]:
+            del self._variants[entry.exact_key]
+        self._update_idf(entry.counts.indices, -1)
+        _STATS["evicted"] += 1
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "buckets": len(self._buckets),
+            "max_entries": self.max_entries,
+        }
+
+
+TURN_CACHE = SemanticTurnCache(
+    TURN_CACHE_MAX_ENTRIES, TURN_CACHE_SIMILARITY, TURN_CACHE_TOP_K, TURN_CACHE_CONTEXT_TURNS, TURN_CACHE_MAX_VARIANTS
+)
+
+
+def warm_up() -> None:
+    if TURN_CACHE_ENABLED:
+        TURN_CACHE.warm_up()
+
+
+def lookup(crime_type: str, history_list: list[DialogueHistoryEntry], highest_vulnerability_axis: str) -> dict | None:
+    if not TURN_CACHE_ENABLED:
+        return None
+    return TURN_CACHE.lookup(crime_type, history_list, highest_vulnerability_axis)
+
+
+def store(crime_type: str, history_list: list[DialogueHistoryEntry], highest_vulnerability_axis: str, turn: dict) -> None:
+    """오류 없이 생성된 턴만 저장합니다. (이벤트 루프에서 호출)"""
+    if not TURN_CACHE_ENABLED or "error" in turn or not turn.get("options"):
+        return
+    TURN_CACHE.store(crime_type, history_list, highest_vulnerability_axis, turn)
+
+
+async def replay(turn: dict):
+    """캐시된 턴을 스트리밍 엔드포인트와 같은 (event, data) 순서로 내보냅니다."""
+    yield "token", {"text": turn["next_speech"]}
+    yield "options", {"next_speech": turn["next_speech"], "options": turn["options"]}
+    yield "done", {}
+
+
+async def recording(events, crime_type: str, history_list: list[DialogueHistoryEntry], highest_vulnerability_axis: str):
+    """스트리밍 턴 이벤트를 그대로 전달하면서, 선택지까지 받은 턴을 캐시에 저장합니다."""
+    async for event, data in events:
+        if event == "options":
+            store(crime_type, history_list, highest_vulnerability_axis, data)
+        yield event, data
+
+
+def turn_cache_stats() -> dict:
+    lookups = _STATS["lookups"]
+    return {
+        "enabled": TURN_CACHE_ENABLED,
+        **_STATS,
+        "hit_rate": round(_STATS["hits"] / lookups, 4) if lookups else 0.0,
+        **TURN_CACHE.stats(),
+        "similarity": TURN_CACHE_SIMILARITY,
+        "by_turns": {
+            turns: {"lookups": counts[0], "hits": counts[1], "hit_rate": round(counts[1] / counts[0], 4)}
+            for turns, counts in sorted(_BY_TURNS.items())
+        },
+    }
@@ -0,0 +1,198 @@
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+
+from config import (
+    VOICE_SESSION_IDLE_SECONDS, VOICE_SESSION_MAX_SESSIONS, VOICE_SESSION_MAX_RETAINED_TURNS
+)
+from models import DialogueHistoryEntry, UserInfo, VoiceSessionStart
+from services import gemini_service
+from services.context_service import SessionContext
+from services.log_service import get_logger
+
+_LOG = get_logger("voice_session")
+
+# --- 음성 세션 ---
+# 음성 모드는 발화마다 전체 대화 기록을 다시 보내는 대신, WebSocket 세션이 대화 기록과 증분 프롬프트를 서버에 보관합니다.
+# 연결이 끊겨도 VOICE_SESSION_IDLE_SECONDS 안에는 같은 session_id로 다시 연결해 이어서 사용할 수 있습니다.
+
+# WebSocket 종료 코드 (4000번대는 애플리케이션 정의)
+CLOSE_TRY_AGAIN_LATER = 1013
+CLOSE_IDLE_TIMEOUT = 4408
+CLOSE_SESSION_NOT_FOUND = 4404
+CLOSE_SESSION_IN_USE = 4409
+CLOSE_INVALID_START = 4400
+
+
+class VoiceSessionError(Exception):
+    """세션을 열거나 이어서 사용할 수 없음 (close_code로 WebSocket을 닫습니다)"""
+
+    def __init__(self, message: str, close_code: int):
+        super().__init__(message)
+        self.message = message
+        self.close_code = close_code
+
+
+class VoiceSession:
+    def __init__(self, session_id: str, user_info: UserInfo, context: SessionContext):
+        self.session_id = session_id
+        self.user_info = user_info
+        self.context = context
+        self.created_at = time.monotonic()
+        self.last_active = self.created_at
+        self.connected = False
+
+    def touch(self) -> None:
+        self.last_active = time.monotonic()
+
+
+# session_id -> 세션 (최근 활동 순)
+_SESSIONS: OrderedDict[str, VoiceSession] = OrderedDict()
+_sweeper: asyncio.Task | None = None
+
+_STATS = {
+    "opened": 0,               # 새로 연 세션 수
+    "resumed": 0,              # 끊긴 뒤 session_id로 다시 연결한 횟수
+    "turns": 0,                # 완료된 음성 턴 수
+    "evicted_idle": 0,         # 유휴 시간 초과로 정리한 세션 수
+    "evicted_capacity": 0,     # 세션 수 상한으로 정리한 (연결이 끊긴) 세션 수
+    "rejected": 0,             # 상한/잘못된 요청으로 열지 못한 세션 수
+}
+
+
+def _close(session: VoiceSession) -> None:
+    _SESSIONS.pop(session.session_id, None)
+    session.context.close()
+
+
+def _evict_for_capacity() -> bool:
+    """연결이 끊긴 세션 중 가장 오래 쉬고 있는 것을 정리합니다. (정리할 세션이 없으면 False)"""
+    for session in _SESSIONS.values():
+        if not session.connected:
+            _close(session)
+            _STATS["evicted_capacity"] += 1
+            return True
+    return False
+
+
+def open_session(start: VoiceSessionStart) -> tuple[VoiceSession, bool]:
+    """
+    첫 메시지로 세션을 새로 열거나, session_id가 있으면 기존 세션에 다시 연결합니다.
+    - 반환: (세션, 이어서 사용하는지 여부)
+    """
+    if start.session_id is not None:
+        session = _SESSIONS.get(start.session_id)
+        if session is None:
+            _STATS["rejected"] += 1
+            raise VoiceSessionError("세션이 없거나 만료되었습니다.", CLOSE_SESSION_NOT_FOUND)
+        if session.connected:
+            _STATS["rejected"] += 1
+            raise VoiceSessionError("이미 다른 연결에서 사용 중인 세션입니다.", CLOSE_SESSION_IN_USE)
+        _STATS["resumed"] += 1
+    else:
+        if start.user_info is None:
+            _STATS["rejected"] += 1
+            raise VoiceSessionError("새 세션에는 user_info가 필요합니다.", CLOSE_INVALID_START)
+        if len(_SESSIONS) >= VOICE_SESSION_MAX_SESSIONS and not _evict_for_capacity():
+            _STATS["rejected"] += 1
+            raise VoiceSessionError("진행 중인 음성 세션이 너무 많습니다. 잠시 후 다시 시도해주세요.", CLOSE_TRY_AGAIN_LATER)
+        context = gemini_service.create_voice_context(VOICE_SESSION_MAX_RETAINED_TURNS)
+        context.extend(start.dialogue_history)
+        session = VoiceSession(uuid.uuid4().hex, start.user_info, context)
+        _SESSIONS[session.session_id] = session
+        _STATS["opened"] += 1
+
+    session.connected = True
+    session.touch()
+    _SESSIONS.move_to_end(session.session_id)
+    return session, start.session_id is not None
+
+
+def detach(session: VoiceSession) -> None:
+    """WebSocket 연결이 끊긴 세션은 유휴 시간 동안 보관합니다. (다시 연결하면 이어서 사용)"""
+    session.connected = False
+    session.touch()
+    if session.session_id in _SESSIONS:
+        _SESSIONS.move_to_end(session.session_id)
+
+
+def end(session: VoiceSession) -> None:
+    """클라이언트가 통화를 끝낸 세션을 바로 정리합니다."""
+    _close(session)
+
+
+async def stream_turn(session: VoiceSession, user_message: str):
+    """
+    세션의 다음 음성 턴을 (event, data) 튜플로 스트리밍합니다. (이벤트는 /simulation/voice_turn/stream과 동일)
+    응답이 끝까지 생성된 경우에만 사용자 발화와 AI 대사를 세션 기록에 추가합니다.
+    """
+    session.touch()
+    tokens = []
+    failed = False
+    async for event, data in gemini_service.stream_voice_session_turn(session.context, user_message):
+        if event == "token":
+            tokens.append(data["text"])
+        elif event == "error":
+            failed = True
+        elif event == "done" and not failed:
+            ai_message = "".join(tokens).strip()
+            session.context.append(DialogueHistoryEntry(role="user", text=user_message))
+            session.context.append(DialogueHistoryEntry(role="agent", text=ai_message))
+            _STATS["turns"] += 1
+            data = {"ai_message": ai_message, "turns": session.context.total_turns}
+        yield event, data
+    session.touch()
+
+
+def _evict_idle() -> None:
+    deadline = time.monotonic() - VOICE_SESSION_IDLE_SECONDS
+    evicted = 0
+    for session in list(_SESSIONS.values()):
+        # 연결 중인 세션의 유휴 시간은 WebSocket 핸들러가 수신 대기 시간 제한으로 관리합니다.
+        if not session.connected and session.last_active < deadline:
+            _close(session)
+            evicted += 1
+    if evicted:
+        _STATS["evicted_idle"] += evicted
+        _LOG.info("유휴 음성 세션 정리", sessions=evicted, remaining=len(_SESSIONS))
+
+
+async def _sweep_loop() -> None:
+    interval = max(1.0, min(30.0, VOICE_SESSION_IDLE_SECONDS / 4))
+    while True:
+        await asyncio.sleep(interval)
+        _evict_idle()
+
+
+def start() -> None:
+    """(서버 시작 시) 유휴 세션 정리 작업을 띄웁니다."""
+    global _sweeper
+    if _sweeper is None:
+        _sweeper = asyncio.get_running_loop().create_task(_sweep_loop())
+
+
+async def stop() -> None:
+    """(서버 종료 시) 정리 작업을 멈추고 모든 세션을 닫습니다."""
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.cancel()
+        try:
+            await _sweeper
+        except asyncio.CancelledError:
+            pass
+        _sweeper = None
+    for session in list(_SESSIONS.values()):
+        _close(session)
+
+
+def voice_session_stats() -> dict:
+    sessions = list(_SESSIONS.values())
+    return {
+        **_STATS,
+        "sessions": len(sessions),
+        "connected": sum(session.connected for session in sessions),
+        "retained_turns": sum(session.context.stats()["retained_turns"] for session in sessions),
+        "retained_text_chars": sum(session.context.text_chars for session in sessions),
+        "max_sessions": VOICE_SESSION_MAX_SESSIONS,
+    }
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# 테스트는 항상 로컬 가짜 클라이언트(AI_BACKEND=fake)로 실행하고, 영속 파일은 임시 폴더에 만듭니다.
+# (config는 import 시점에 환경 변수를 읽으므로 서비스 모듈을 import하기 전에 설정)
+_TMP_DIR = tempfile.mkdtemp(prefix="safeguard-tests-")
+os.environ["AI_BACKEND"] = "fake"
+os.environ.setdefault("BATCH_DB_PATH", os.path.join(_TMP_DIR, "batch_jobs.db"))
+os.environ.pop("RESULT_CACHE_DB_PATH", None)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
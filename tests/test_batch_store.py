@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from services import batch_service
+from services.batch_service import BatchJobStore
+
+
+def _session(session_id):
+    return {"session_id": session_id, "crime_type": "기관사칭", "dialogue_history": [{"role": "user", "text": "네"}]}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BatchJobStore(str(tmp_path / "batch_jobs.db"))
+
+
+def test_claim_returns_each_item_once_then_none(store):
+    job = store.create_job([_session("s1"), _session("s2")], ["basic", "premium"])
+    assert job["total"] == 4
+
+    claimed = [store.claim() for _ in range(4)]
+    assert sorted(item["item_index"] for item in claimed) == [0, 1, 2, 3]
+    assert all(item["attempts"] == 1 for item in claimed)
+    assert claimed[0]["payload"]["crime_type"] == "기관사칭"
+    assert store.claim() is None
+    assert store.get_job(job["job_id"])["running"] == 4
+
+
+def test_expired_lease_is_reclaimed(store, monkeypatch):
+    monkeypatch.setattr(batch_service, "BATCH_LEASE_SECONDS", 0.05)
+    store.create_job([_session("s1")], ["basic"])
+
+    first = store.claim()
+    assert store.claim() is None  # 점유 중인 항목은 다른 워커가 가져가지 않습니다.
+    time.sleep(0.1)
+    second = store.claim()
+    assert second["item_index"] == first["item_index"]
+    assert second["attempts"] == 2
+
+
+def test_retry_later_waits_for_delay(store):
+    job = store.create_job([_session("s1")], ["basic"])
+    item = store.claim()
+
+    store.retry_later(item, "overloaded", delay=0.1)
+    assert store.claim() is None
+    assert store.get_job(job["job_id"])["results"][0]["error"] == "overloaded"
+    time.sleep(0.15)
+    retried = store.claim()
+    assert retried["attempts"] == 2
+
+
+def test_release_does_not_count_as_attempt(store):
+    store.create_job([_session("s1")], ["basic"])
+    item = store.claim()
+
+    store.release(item)
+    assert store.claim()["attempts"] == 1
+
+
+def test_complete_and_fail_are_reported_in_job(store):
+    job = store.create_job([_session("s1"), _session("s2")], ["basic"])
+    first, second = store.claim(), store.claim()
+    assert store.get_job(job["job_id"])["status"] == "running"
+
+    store.complete(first, {"grade": "A"})
+    store.fail(second, "invalid payload")
+    status = store.get_job(job["job_id"])
+    assert status["status"] == "completed"
+    assert (status["completed"], status["failed"], status["progress"]) == (1, 1, 1.0)
+    by_index = {result["index"]: result for result in status["results"]}
+    assert by_index[first["item_index"]]["result"] == {"grade": "A"}
+    assert by_index[first["item_index"]]["error"] is None
+    assert by_index[second["item_index"]]["error"] == "invalid payload"
+    assert store.get_job("missing") is None
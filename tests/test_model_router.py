@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from services import model_router
+from services.model_router import ModelRouter, FALLBACK_TIER
+
+ROUTES = {
+    "diagnose": {"primary": "pro", "slo": 0.05, "timeout": 1.0},
+    "premium_report": {"primary": "pro", "slo": 0.05, "timeout": 1.0},
+    "basic_report": {"primary": "flash", "slo": 0.01, "timeout": 1.0},
+}
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(model_router, "BREAKER_WINDOW", 4)
+    monkeypatch.setattr(model_router, "BREAKER_MIN_CALLS", 2)
+    monkeypatch.setattr(model_router, "BREAKER_FAILURE_RATIO", 0.5)
+    monkeypatch.setattr(model_router, "BREAKER_COOLDOWN_SECONDS", 0.1)
+    monkeypatch.setattr(model_router, "HEDGE_ENABLED", True)
+    # get_model은 등급 이름을 그대로 돌려주므로, call은 어느 등급으로 호출되었는지 알 수 있습니다.
+    return ModelRouter(lambda tier: tier, ["pro", "flash"], ROUTES)
+
+
+def _call(delays: dict, calls: list | None = None, error: Exception | None = None):
+    async def call(tier):
+        if calls is not None:
+            calls.append(tier)
+        await asyncio.sleep(delays[tier])
+        if error is not None and tier == "pro":
+            raise error
+        return tier
+    return call
+
+
+def test_slow_primary_is_hedged_to_flash(router):
+    result = asyncio.run(router.execute("diagnose", _call({"pro": 0.5, "flash": 0.01})))
+    assert result == "flash"
+    assert router.stats()["hedges"] == 1
+    assert router.stats()["hedge_wins"] == 1
+
+
+def test_fast_primary_is_not_hedged(router):
+    result = asyncio.run(router.execute("diagnose", _call({"pro": 0.01, "flash": 0.01})))
+    assert result == "pro"
+    assert router.stats()["hedges"] == 0
+
+
+def test_flash_primary_is_never_hedged(router):
+    calls = []
+    result = asyncio.run(router.execute("basic_report", _call({"flash": 0.05}, calls)))
+    assert result == "flash"
+    assert calls == ["flash"]
+    assert router.stats()["hedges"] == 0
+
+
+def test_breaker_opens_on_errors_and_recovers_after_cooldown(router, monkeypatch):
+    monkeypatch.setattr(model_router, "HEDGE_ENABLED", False)
+    failing = _call({"pro": 0.0, "flash": 0.0}, error=RuntimeError("boom"))
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            asyncio.run(router.execute("diagnose", failing))
+    assert router.breakers["pro"].state == "open"
+    # 열린 동안에는 같은 등급을 쓰는 모든 엔드포인트가 빠른 모델로 강등됩니다.
+    assert router.select("diagnose") == FALLBACK_TIER
+    assert router.select("premium_report") == FALLBACK_TIER
+
+    asyncio.run(asyncio.sleep(0.12))
+    assert router.breakers["pro"].state == "half_open"
+    assert router.select("diagnose") == "pro"
+    assert asyncio.run(router.execute("diagnose", _call({"pro": 0.0, "flash": 0.0}))) == "pro"
+    assert router.breakers["pro"].state == "closed"
+
+
+def test_half_open_failure_reopens_breaker(router, monkeypatch):
+    monkeypatch.setattr(model_router, "HEDGE_ENABLED", False)
+    failing = _call({"pro": 0.0, "flash": 0.0}, error=RuntimeError("boom"))
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            asyncio.run(router.execute("diagnose", failing))
+    asyncio.run(asyncio.sleep(0.12))
+    with pytest.raises(RuntimeError):
+        asyncio.run(router.execute("diagnose", failing))
+    assert router.breakers["pro"].state == "open"
+    assert router.breakers["pro"].trips == 1
+
+
+def test_slo_misses_only_degrade_their_own_endpoint(router, monkeypatch):
+    monkeypatch.setattr(model_router, "HEDGE_ENABLED", False)
+    # EWMA 기반 강등 없이 매번 주 모델로 보내, SLO 브레이커만 확인합니다.
+    monkeypatch.setattr(model_router, "ROUTER_PROBE_RATE", 1.0)
+    slow = _call({"pro": 0.08, "flash": 0.0})
+    for _ in range(2):
+        assert asyncio.run(router.execute("premium_report", slow)) == "pro"
+
+    # 느린 프리미엄 호출은 자기 엔드포인트의 SLO 브레이커만 열고, 등급 공용 브레이커와 diagnose에는 영향이 없습니다.
+    assert router.slo_breakers[("premium_report", "pro")].state == "open"
+    assert router.breakers["pro"].state == "closed"
+    assert router.latency[("diagnose", "pro")].ewma is None
+    assert router.select("diagnose") == "pro"
+    assert router.select("premium_report") == FALLBACK_TIER
+
+
+def test_timeouts_count_against_the_tier_breaker(router, monkeypatch):
+    monkeypatch.setattr(model_router, "HEDGE_ENABLED", False)
+    routes = {**ROUTES, "diagnose": {**ROUTES["diagnose"], "timeout": 0.02}}
+    router.routes = routes
+    for _ in range(2):
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(router.execute("diagnose", _call({"pro": 0.2, "flash": 0.0})))
+    assert router.stats()["timeouts"] == 2
+    assert router.breakers["pro"].state == "open"
@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+from services.cache_service import ResultCache, hash_text
+
+
+def test_entries_expire_after_ttl():
+    cache = ResultCache("test_ttl", max_entries=10, ttl_seconds=0.05)
+    cache.set("key", {"risk_level": "위험"})
+    assert cache.get("key") == {"risk_level": "위험"}
+
+    time.sleep(0.1)
+    assert cache.get("key") is None
+    assert cache.stats()["size"] == 0
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache("test_lru", max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a를 최근 사용으로 갱신합니다.
+
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["size"] == 2
+
+
+def test_returned_values_are_copies():
+    cache = ResultCache("test_copy", max_entries=10, ttl_seconds=60)
+    value = {"detected_keywords": ["검찰"]}
+    cache.set("key", value)
+    value["detected_keywords"].append("수정")
+
+    cached = cache.get("key")
+    cached["detected_keywords"].append("수정")
+    assert cache.get("key") == {"detected_keywords": ["검찰"]}
+
+
+def test_persistent_tier_is_shared_between_instances(tmp_path):
+    db_path = str(tmp_path / "result_cache.db")
+    writer = ResultCache("diagnosis", max_entries=10, ttl_seconds=60, db_path=db_path)
+    reader = ResultCache("diagnosis", max_entries=10, ttl_seconds=60, db_path=db_path)
+    other_namespace = ResultCache("ocr", max_entries=10, ttl_seconds=60, db_path=db_path)
+
+    writer.set("key", {"risk_level": "주의"})
+    assert reader.get("key") == {"risk_level": "주의"}
+    assert reader.stats()["persistent_hits"] == 1
+    assert reader.get("key") == {"risk_level": "주의"}  # 이후에는 메모리 계층에서 찾습니다.
+    assert reader.stats()["hits"] == 1
+    assert other_namespace.get("key") is None
+
+
+def test_async_api_uses_both_tiers(tmp_path):
+    db_path = str(tmp_path / "result_cache.db")
+    writer = ResultCache("diagnosis", max_entries=10, ttl_seconds=60, db_path=db_path)
+    reader = ResultCache("diagnosis", max_entries=10, ttl_seconds=60, db_path=db_path)
+
+    async def main():
+        await writer.aset("key", ["값"])
+        assert await writer.aget("key") == ["값"]
+        assert await reader.aget("key") == ["값"]
+        assert await reader.aget("missing") is None
+
+    asyncio.run(main())
+    assert writer.stats()["hits"] == 1
+    assert reader.stats()["persistent_hits"] == 1
+    assert reader.stats()["misses"] == 1
+
+
+def test_text_key_ignores_urls_digits_and_spacing():
+    first = hash_text("[국외발신] 010-1234-5678 로  연락   http://a.kr/x")
+    second = hash_text("[국외발신] 010-9999-0000 로 연락 https://b.com/y")
+    assert first == second
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from services import single_flight
+from services.single_flight import SingleFlight
+
+
+@pytest.fixture(autouse=True)
+def coalescing_enabled(monkeypatch):
+    monkeypatch.setattr(single_flight, "REQUEST_COALESCING_ENABLED", True)
+
+
+def test_concurrent_callers_share_one_execution():
+    flights = SingleFlight("test_share")
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def main():
+        return await asyncio.gather(*(flights.do("key", work) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["done"] * 5
+    assert len(runs) == 1
+    assert flights.stats()["executed"] == 1
+    assert flights.stats()["coalesced"] == 4
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_exception_is_shared_and_next_call_runs_again():
+    flights = SingleFlight("test_error")
+    runs = []
+
+    async def failing():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        results = await asyncio.gather(*(flights.do("key", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        # 결과를 보관하지 않으므로 끝난 뒤의 호출은 새로 실행합니다.
+        with pytest.raises(ValueError):
+            await flights.do("key", failing)
+
+    asyncio.run(main())
+    assert len(runs) == 2
+    assert flights.stats()["failed"] == 2
+
+
+def test_one_cancelled_waiter_does_not_cancel_shared_call():
+    flights = SingleFlight("test_partial_cancel")
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        first = asyncio.ensure_future(flights.do("key", work))
+        second = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "done"
+        assert first.cancelled()
+
+    asyncio.run(main())
+    assert flights.stats()["abandoned"] == 0
+
+
+def test_shared_call_is_cancelled_when_all_waiters_leave():
+    flights = SingleFlight("test_abandon")
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        return "done"
+
+    async def main():
+        waiters = [asyncio.ensure_future(flights.do("key", work)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        # 포기된 호출은 표에서 바로 빠지므로 새 요청은 새로 실행합니다.
+        assert not flights.in_flight("key")
+
+    asyncio.run(main())
+    assert cancelled == [1]
+    assert flights.stats()["abandoned"] == 1
+
+
+def test_abandoned_call_keeps_running_when_configured():
+    flights = SingleFlight("test_keep_running", cancel_when_abandoned=False)
+    finished = []
+
+    async def work():
+        await asyncio.sleep(0.03)
+        finished.append(1)
+        return "done"
+
+    async def main():
+        waiter = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert flights.in_flight("key")
+        # 아직 진행 중인 호출에 새 요청이 합류합니다.
+        assert await flights.do("key", work) == "done"
+
+    asyncio.run(main())
+    assert finished == [1]
+    assert flights.stats()["executed"] == 1